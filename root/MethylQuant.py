@@ -43,38 +43,39 @@
 #------------------ Dependencies ----------------------------#
 
 ## External dependencies
-import wx
 import unittest
+import multiprocessing
  
 ## Internal dependencies
-from src import controller
-import tests
+#The UI (wx) and the tests are imported by main() and suite(). 
+#Worker processes re-import this module when they start, and they need neither
 
 #------------------- Global Variables -----------------------#
-    
-LOG_FILE = "MethylQuant_log_file.txt"                                   # Use for testing
 
 #------------------ Classes & Functions ---------------------#
-   
-class MethylQuantApp(wx.App):
-     
-    def __init__(self):
-        wx.App.__init__(self)     #redirect=True, filename=LOG_FILE     # Use for testing
- 
-    def OnInit(self):
-        self.frame = controller.MethylQuantFrame()
-        self.frame.Show()         #Make the UI visible to the user
-        return True
-
-#########################################################################################################
  
 def suite():
+    import tests
+
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(tests.TestPeptideReader, 'test'))
+    suite.addTest(unittest.makeSuite(tests.TestMzIdentMlReader, 'test'))
     suite.addTest(unittest.makeSuite(tests.TestCsvWriter, 'test'))
     suite.addTest(unittest.makeSuite(tests.TestMassCalculations, 'test'))
     suite.addTest(unittest.makeSuite(tests.TestRawReader, 'test'))
+    suite.addTest(unittest.makeSuite(tests.TestSyntheticRaw, 'test'))
     suite.addTest(unittest.makeSuite(tests.TestConfidenceCalculations, 'test'))
+    suite.addTest(unittest.makeSuite(tests.TestConsole, 'test'))
+    suite.addTest(unittest.makeSuite(tests.TestExperimentDefinitions, 'test'))
+    suite.addTest(unittest.makeSuite(tests.TestResultCache, 'test'))
+    suite.addTest(unittest.makeSuite(tests.TestSession, 'test'))
+    suite.addTest(unittest.makeSuite(tests.TestShardedRawJob, 'test'))
+    suite.addTest(unittest.makeSuite(tests.TestStageTimings, 'test'))
+    suite.addTest(unittest.makeSuite(tests.TestLruCache, 'test'))
+    suite.addTest(unittest.makeSuite(tests.TestMassKeys, 'test'))
+    suite.addTest(unittest.makeSuite(tests.TestMemoryUsage, 'test'))
+    suite.addTest(unittest.makeSuite(tests.TestPsmTrace, 'test'))
+    suite.addTest(unittest.makeSuite(tests.TestOutputDiff, 'test'))
     return suite
 
 #########################################################################################################
@@ -82,10 +83,14 @@ def suite():
 def main():
     ## Run unit tests
 #     unittest.main(defaultTest='suite')
-    app = MethylQuantApp()
+    from src import controller
+
+    app = controller.MethylQuantApp()
     app.MainLoop()
 
 #------------------- Main -----------------------------------#
  
 if __name__ == "__main__":
+    #needed for worker processes when MethylQuant is frozen into an executable
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,39 @@
+#--------------------------------------------------------------------------------------------------------------------
+#MethylQuant (command line)
+#
+#Runs MethylQuant without the UI, e.g., on cluster nodes and batch systems.
+#The requirements are the same as MethylQuant.py, except that wxpython is not needed.
+#
+#Examples:
+#   python MethylQuantConsole.py -p peptides.csv -r C:\raw_files --workers 4
+#   python MethylQuantConsole.py -p peptides.csv -r C:\raw_files --save-config experiments.json
+#   python MethylQuantConsole.py --config experiments.json overnight.toml
+#
+#Experiment definitions files can also be saved and opened from the UI (File menu)
+#
+#Exit codes:
+#   0 - All experiments passed
+#   1 - At least one experiment failed
+#   2 - Invalid arguments, config file or experiment
+#   3 - Cancelled (Ctrl+C); only some results were written
+#--------------------------------------------------------------------------------------------------------------------
+
+#------------------ Dependencies ----------------------------#
+
+## External dependencies
+import sys
+import multiprocessing
+ 
+## Internal dependencies
+from src import console
+
+#------------------- Global Variables -----------------------#
+
+#------------------ Classes & Functions ---------------------#
+
+#------------------- Main -----------------------------------#
+ 
+if __name__ == "__main__":
+    #needed for worker processes when MethylQuant is frozen into an executable
+    multiprocessing.freeze_support()
+    sys.exit(console.main())
@@ -0,0 +1,335 @@
+#--------------------------------------------------------------------------------------------------------------------
+#Synthetic methyl-SILAC dataset generator for MethylQuant
+#
+#Performance work needs the same input every time, at sizes that real datasets rarely come in,
+#so this generates complete runs from a seed:
+#   * MS1 spectra with light and heavy isotope envelopes (eluting with a tailing peak shape),
+#     on top of noise peaks, with mass and intensity noise
+#   * MS/MS scans (top N per MS1 scan), some of which are the PSMs
+#   * a PSM file (.CSV) with the columns of the PeptidesReader
+#   * an experiments file (.JSON) to run the dataset with, and a manifest of the dataset (dataset.json)
+#
+#The light/heavy mass shifts come from M residues (13CD3 label) and methylated K/R residues, so the
+#dataset is searched with the default labels and modifications. Thermo RAW files can't be written,
+#so the RAW files are synthetic RAW files (See io.synthetic), which RawReader opens instead of MSFileReader.
+#The same arguments (and seed) always give the same files.
+#
+#Usage:
+#   python benchmarks/dataset.py OUTPUT_DIR [--psms N] [--seed S] [--psms-per-raw N] [...]
+#   python MethylQuantConsole.py -c OUTPUT_DIR/experiments.json
+#--------------------------------------------------------------------------------------------------------------------
+
+#------------------ Dependencies ----------------------------#
+
+## External dependencies
+import os
+import sys
+import json
+import math
+import argparse
+import numpy
+import pandas
+
+## Internal dependencies
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+from src.io.synthetic import writeSyntheticRaw
+
+#------------------- Global Variables -----------------------#
+
+DATASET_FORMAT    = "MethylQuant synthetic dataset"
+DATASET_VERSION   = 1
+MANIFEST_FILE     = "dataset.json"
+EXPERIMENTS_FILE  = "experiments.json"
+PSM_FILE          = "synthetic_psms.csv"
+RAW_FILE_FORMAT   = "synthetic_%02d.raw"
+
+PROTON_MASS       = 1.007276
+WATER_MASS        = 18.010565
+ISOTOPE_SPACING   = 1.00335         # 13C - 12C (the same as calculatePeptideIsotopeMasses)
+METHYL_MASS       = 14.01565        # CH2
+LABEL_MASS        = 4.022185        # 13CD3 - CH3, per M residue and per methyl group (the default label and mods)
+NUM_ISOTOPES      = 4               # Isotope peaks per envelope (MethylQuant looks for 3)
+AVERAGINE_LAMBDA  = 1.0 / 1800      # Expected number of heavy isotopes per Da (Poisson approximation)
+FWHM_TO_SIGMA     = 1.0 / 2.3548
+
+# Monoisotopic residue masses. M, K and R are only placed where they are wanted (See createPeptides)
+RESIDUE_MASSES    = {"G": 57.02146, "A": 71.03711, "S": 87.03203, "P": 97.05276, "V": 99.06841,
+                     "T": 101.04768, "C": 103.00919, "L": 113.08406, "I": 113.08406, "N": 114.04293,
+                     "D": 115.02694, "Q": 128.05858, "E": 129.04259, "H": 137.05891, "F": 147.06841,
+                     "Y": 163.06333, "W": 186.07931, "M": 131.04049, "K": 128.09496, "R": 156.10111}
+BASE_RESIDUES     = "GASPVTCLINDQEHFYW"
+METHYL_MODS       = ("Methyl", "Dimethyl", "Trimethyl")
+CHARGES           = (2, 3, 4)
+CHARGE_WEIGHTS    = (0.55, 0.35, 0.10)
+
+#------------------ Classes & Functions ---------------------#
+
+""" Returns a table of peptide property -> numpy.array (or list) for num_peptides random peptides.
+    Every peptide has at least one M residue or methylated K/R residue, so it has a light/heavy mass shift
+"""
+def createPeptides(rng, num_peptides):
+    lengths   = rng.randint(7, 21, num_peptides)
+    offsets   = numpy.concatenate([[0], numpy.cumsum(lengths)])
+    alphabet  = numpy.frombuffer(BASE_RESIDUES.encode(), dtype=numpy.uint8)
+    residues  = alphabet[rng.randint(0, len(alphabet), offsets[-1])]
+
+    #tryptic peptides end with K or R
+    residues[offsets[1:] - 1] = numpy.where(rng.rand(num_peptides) < 0.5, ord("K"), ord("R"))
+
+    #the mass shift comes from M residues (60%), a methylated K/R (25%) or both (15%)
+    label_type    = rng.choice(3, num_peptides, p=(0.60, 0.25, 0.15))
+    num_M         = numpy.where(label_type != 1, 1 + (rng.rand(num_peptides) < 0.3), 0)
+    M_positions   = offsets[:-1, None] + (rng.rand(num_peptides, 2) * (lengths[:, None] - 1)).astype(int)
+    for M_idx in range(2):
+        has_M = num_M > M_idx
+        residues[M_positions[has_M, M_idx]] = ord("M")
+
+    is_methylated   = label_type != 0
+    methyl_position = (rng.rand(num_peptides) * (lengths - 1)).astype(int)
+    methyl_residue  = numpy.where(rng.rand(num_peptides) < 0.6, ord("K"), ord("R"))
+    methyl_count    = rng.choice((1, 2, 3), num_peptides, p=(0.5, 0.35, 0.15))
+    methyl_count    = numpy.where(methyl_residue == ord("R"), numpy.minimum(methyl_count, 2), methyl_count)
+    methyl_count    = numpy.where(is_methylated, methyl_count, 0)
+    residues[(offsets[:-1] + methyl_position)[is_methylated]] = methyl_residue[is_methylated]
+
+    mass_table    = numpy.zeros(256)
+    for residue, mass in RESIDUE_MASSES.items():
+        mass_table[ord(residue)] = mass
+    peptide_masses = (numpy.add.reduceat(mass_table[residues], offsets[:-1]) + WATER_MASS
+                      + methyl_count * METHYL_MASS)
+
+    #residues may have overwritten each other, so count the M residues again
+    num_M          = numpy.add.reduceat((residues == ord("M")).astype(int), offsets[:-1])
+    mass_shifts    = (num_M + methyl_count) * LABEL_MASS
+
+    sequence_bytes = residues.tobytes()
+    sequences      = [sequence_bytes[offsets[i]:offsets[i + 1]].decode() for i in range(num_peptides)]
+    modifications  = ["%s%d(%s)" % (chr(methyl_residue[i]), methyl_position[i] + 1, METHYL_MODS[methyl_count[i] - 1])
+                      if is_methylated[i] else "" for i in range(num_peptides)]
+    return {"sequences":      sequences,
+            "modifications":  modifications,
+            "peptide_masses": peptide_masses,
+            "mass_shifts":    mass_shifts}
+
+""" Returns numpy.array of the relative intensity of the first NUM_ISOTOPES isotope peaks of each peptide mass
+"""
+def getIsotopeDistributions(peptide_masses):
+    expected_isotopes = peptide_masses * AVERAGINE_LAMBDA
+    isotope_nums      = numpy.arange(NUM_ISOTOPES)
+    factorials        = numpy.array([math.factorial(k) for k in isotope_nums])
+    distributions     = (numpy.exp(-expected_isotopes[:, None]) *
+                         expected_isotopes[:, None] ** isotope_nums / factorials)
+    return distributions / distributions.sum(axis=1)[:, None]
+
+""" Returns the retention time of each MS1 scan and each MS/MS scan, and the scan types (See createRun)
+"""
+def getScanLayout(num_cycles, top_n, cycle_time):
+    cycle_rts  = 0.01 + numpy.arange(num_cycles) * cycle_time
+    scan_rts   = (cycle_rts[:, None] + numpy.arange(top_n + 1) * (cycle_time / (top_n + 1))).ravel()
+    scan_types = numpy.tile(numpy.array([1] + [2] * top_n, dtype=numpy.int8), num_cycles)
+    return (cycle_rts, scan_rts, scan_types)
+
+""" Creates one synthetic RAW file and returns the PSMs in it (as a pandas.DataFrame)
+
+    Each cycle is an MS1 scan followed by top_n MS/MS scans. Each peptide elutes as a light and a heavy
+    species (unless it's unpaired), and is sequenced (as the light peptide) in one or more MS/MS scans
+    around its apex. MS/MS scans that aren't PSMs have a random precursor.
+"""
+def createRun(rng, raw_path, raw_file, num_psms, options):
+    num_cycles = int(options.gradient / options.cycle_time)
+    top_n      = options.top_n
+    (cycle_rts, scan_rts, scan_types) = getScanLayout(num_cycles, top_n, options.cycle_time)
+
+    #peptides are sequenced 1 or more times (so there are fewer peptides than PSMs)
+    psm_counts   = 1 + rng.poisson(options.psms_per_peptide - 1, num_psms)
+    psm_counts   = psm_counts[:numpy.searchsorted(numpy.cumsum(psm_counts), num_psms) + 1]
+    psm_counts[-1] -= psm_counts.sum() - num_psms
+    num_peptides = len(psm_counts)
+
+    peptides     = createPeptides(rng, num_peptides)
+    charges      = rng.choice(CHARGES, num_peptides, p=CHARGE_WEIGHTS)
+    light_mzs    = (peptides["peptide_masses"] + charges * PROTON_MASS) / charges
+    heavy_mzs    = light_mzs + peptides["mass_shifts"] / charges
+    isotopes     = getIsotopeDistributions(peptides["peptide_masses"])
+
+    #elution: an apex, a (tailing) Gaussian peak shape, and a light/heavy RT offset and H/L ratio
+    apex_rts     = cycle_rts[0] + (0.05 + 0.9 * rng.rand(num_peptides)) * (cycle_rts[-1] - cycle_rts[0])
+    sigmas       = options.peak_width * FWHM_TO_SIGMA * rng.lognormal(0, 0.3, num_peptides)
+    abundances   = rng.lognormal(numpy.log(options.abundance), 1.0, num_peptides)
+    rt_offsets   = rng.normal(options.rt_offset, options.rt_offset_sd, num_peptides)
+    HL_ratios    = rng.lognormal(numpy.log(options.hl_ratio), options.hl_ratio_sd, num_peptides)
+    HL_ratios[rng.rand(num_peptides) < options.unpaired] = 0
+
+    #light species, then heavy species
+    species_mzs        = numpy.concatenate([light_mzs, heavy_mzs])
+    species_charges    = numpy.tile(charges, 2)
+    species_apexes     = numpy.concatenate([apex_rts, apex_rts + rt_offsets])
+    species_sigmas     = numpy.tile(sigmas, 2)
+    species_abundances = numpy.concatenate([abundances, abundances * HL_ratios])
+    species_isotopes   = numpy.tile(isotopes, (2, 1))
+
+    #expand to (species, MS1 scan) within 4 sigmas of the apex
+    start_cycles   = numpy.searchsorted(cycle_rts, species_apexes - 4 * species_sigmas)
+    stop_cycles    = numpy.searchsorted(cycle_rts, species_apexes + 4 * species_sigmas * (1 + options.tailing))
+    cycle_counts   = numpy.where(species_abundances > 0, stop_cycles - start_cycles, 0)
+    species_idx    = numpy.repeat(numpy.arange(len(species_mzs)), cycle_counts)
+    cycle_idx      = (numpy.arange(len(species_idx)) - numpy.repeat(numpy.cumsum(cycle_counts) - cycle_counts, cycle_counts)
+                      + start_cycles[species_idx])
+    RT_deltas      = cycle_rts[cycle_idx] - species_apexes[species_idx]
+    widths         = species_sigmas[species_idx] * numpy.where(RT_deltas > 0, 1 + options.tailing, 1)
+    elution        = species_abundances[species_idx] * numpy.exp(-0.5 * (RT_deltas / widths) ** 2)
+
+    #expand to isotope peaks, with mass and intensity noise, and drop what's under the detection limit
+    isotope_nums       = numpy.tile(numpy.arange(NUM_ISOTOPES), len(species_idx))
+    species_idx        = numpy.repeat(species_idx, NUM_ISOTOPES)
+    signal_cycles      = numpy.repeat(cycle_idx, NUM_ISOTOPES)
+    signal_intensities = (numpy.repeat(elution, NUM_ISOTOPES) * species_isotopes[species_idx, isotope_nums]
+                          * rng.lognormal(0, options.intensity_noise, len(species_idx)))
+    signal_mzs         = ((species_mzs[species_idx] + isotope_nums * ISOTOPE_SPACING / species_charges[species_idx])
+                          * (1 + rng.normal(0, options.mass_accuracy, len(species_idx)) / 1e6))
+    is_detected        = signal_intensities >= options.detection_limit
+    signal_scans       = signal_cycles[is_detected] * (top_n + 1)
+    signal_mzs         = signal_mzs[is_detected]
+    signal_intensities = signal_intensities[is_detected]
+
+    #noise peaks in every MS1 scan
+    noise_counts      = rng.poisson(options.noise_peaks, num_cycles)
+    noise_scans       = numpy.repeat(numpy.arange(num_cycles) * (top_n + 1), noise_counts)
+    noise_mzs         = rng.uniform(options.min_mz, options.max_mz, len(noise_scans))
+    noise_intensities = rng.lognormal(numpy.log(options.detection_limit * 2), 0.8, len(noise_scans))
+
+    #sequence each peptide close to its apex. PSMs take the first free MS/MS scan from there (in order)
+    psm_peptides      = numpy.repeat(numpy.arange(num_peptides), psm_counts)
+    psm_rts           = apex_rts[psm_peptides] + rng.normal(0, 0.5, num_psms) * sigmas[psm_peptides]
+    psm_cycles        = numpy.clip(numpy.searchsorted(cycle_rts, psm_rts) - 1, 0, num_cycles - 1)
+    psm_order         = numpy.argsort(psm_cycles, kind="mergesort")
+    psm_peptides      = psm_peptides[psm_order]
+    slot_ranks        = numpy.arange(num_psms)
+    psm_slots         = numpy.maximum.accumulate(psm_cycles[psm_order] * top_n - slot_ranks) + slot_ranks
+    psm_slots         = numpy.minimum(psm_slots, num_cycles * top_n - num_psms + slot_ranks)
+    psm_scans         = (psm_slots // top_n) * (top_n + 1) + (psm_slots % top_n) + 1
+
+    #the 2nd isotope peak is sometimes selected for fragmentation
+    precursor_masses  = numpy.where(scan_types == 2, rng.uniform(options.min_mz, options.max_mz, len(scan_types)), 0)
+    selected_isotopes = (rng.rand(num_psms) < 0.2).astype(int)
+    precursor_masses[psm_scans] = ((light_mzs[psm_peptides] + selected_isotopes * ISOTOPE_SPACING / charges[psm_peptides])
+                                   * (1 + rng.normal(0, options.mass_accuracy, num_psms) / 1e6))
+
+    #fragment peaks in every MS/MS scan
+    MS_MS_scans          = numpy.flatnonzero(scan_types == 2)
+    fragment_counts      = rng.poisson(options.fragment_peaks, len(MS_MS_scans))
+    fragment_scans       = numpy.repeat(MS_MS_scans, fragment_counts)
+    fragment_mzs         = rng.uniform(100, 2000, len(fragment_scans))
+    fragment_intensities = rng.lognormal(numpy.log(options.detection_limit), 1.0, len(fragment_scans))
+
+    peak_scans       = numpy.concatenate([signal_scans, noise_scans, fragment_scans])
+    peak_masses      = numpy.concatenate([signal_mzs, noise_mzs, fragment_mzs])
+    peak_intensities = numpy.concatenate([signal_intensities, noise_intensities, fragment_intensities])
+    peak_order       = numpy.lexsort((peak_masses, peak_scans))
+    peak_offsets     = numpy.concatenate([[0], numpy.cumsum(numpy.bincount(peak_scans, minlength=len(scan_types)))])
+    writeSyntheticRaw(raw_path, scan_rts, scan_types, precursor_masses, peak_offsets,
+                      peak_masses[peak_order], peak_intensities[peak_order].astype(numpy.float32))
+
+    return pandas.DataFrame({"Sequence":      [peptides["sequences"][i] for i in psm_peptides],
+                             "Modifications": [peptides["modifications"][i] for i in psm_peptides],
+                             "Charge":        charges[psm_peptides],
+                             "Data File":     raw_file,
+                             "Start Scan":    psm_scans + 1,
+                             "Calc m/z":      light_mzs[psm_peptides]})
+
+""" Generates a synthetic dataset in output_dir and returns its manifest (See MANIFEST_FILE)
+
+    Keyword arguments:
+    output_dir -- Directory of the dataset (created if needed)
+    options    -- argparse.Namespace of the generation options (See createParser)
+"""
+def generateDataset(output_dir, options):
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    num_raws  = max(1, int(math.ceil(options.psms / float(options.psms_per_raw))))
+    psm_table = []
+    raw_files = []
+    for raw_idx in range(num_raws):
+        #each RAW file has its own random stream, so it doesn't depend on the other RAW files
+        rng      = numpy.random.RandomState([options.seed, raw_idx])
+        raw_file = RAW_FILE_FORMAT % (raw_idx + 1)
+        num_psms = options.psms // num_raws + (raw_idx < options.psms % num_raws)
+        psm_table.append(createRun(rng, os.path.join(output_dir, raw_file), raw_file, num_psms, options))
+        raw_files.append(raw_file)
+
+    psm_table = pandas.concat(psm_table, ignore_index=True)
+    psm_table.to_csv(os.path.join(output_dir, PSM_FILE), index=False, float_format="%.5f")
+
+    experiments = {"format": "MethylQuant experiments", "version": 1,
+                   "experiments": [{"name": "Synthetic %d PSMs (seed %d)" % (options.psms, options.seed),
+                                    "description": "Methyl-SILAC",
+                                    "peptides_files": [{"path": PSM_FILE, "silac_type": "light",
+                                                        "output_style": "summary"}],
+                                    "raw_dirs": [{"path": ".", "raw_files": raw_files}]}]}
+    manifest    = {"format": DATASET_FORMAT, "version": DATASET_VERSION,
+                   "num_psms": len(psm_table), "raw_files": raw_files, "peptides_file": PSM_FILE,
+                   "experiments_file": EXPERIMENTS_FILE, "options": vars(options)}
+    for file_name, content in ((EXPERIMENTS_FILE, experiments), (MANIFEST_FILE, manifest)):
+        with open(os.path.join(output_dir, file_name), "w") as f:
+            json.dump(content, f, indent=2, sort_keys=True)
+
+    return manifest
+
+def createParser():
+    parser = argparse.ArgumentParser(description="Generate a synthetic methyl-SILAC dataset")
+    parser.add_argument("output_dir", help="Directory of the dataset")
+    parser.add_argument("--psms", type=int, default=1000, help="Number of PSMs (default: 1000)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--psms-per-raw", type=int, default=5000, help="PSMs per RAW file (default: 5000)")
+    parser.add_argument("--psms-per-peptide", type=float, default=1.3,
+                        help="Average number of PSMs per peptide (default: 1.3)")
+
+    group = parser.add_argument_group("run")
+    group.add_argument("--gradient", type=float, default=90, help="Run length in minutes (default: 90)")
+    group.add_argument("--cycle-time", type=float, default=0.03,
+                       help="Minutes between MS1 scans (default: 0.03)")
+    group.add_argument("--top-n", type=int, default=10, help="MS/MS scans per MS1 scan (default: 10)")
+    group.add_argument("--min-mz", type=float, default=350, help="Lowest m/z of noise peaks (default: 350)")
+    group.add_argument("--max-mz", type=float, default=1600, help="Highest m/z of noise peaks (default: 1600)")
+    group.add_argument("--noise-peaks", type=float, default=300,
+                       help="Average number of noise peaks per MS1 scan (default: 300)")
+    group.add_argument("--fragment-peaks", type=float, default=40,
+                       help="Average number of peaks per MS/MS scan (default: 40)")
+    group.add_argument("--detection-limit", type=float, default=1000,
+                       help="Lowest intensity of an isotope peak (default: 1000)")
+    group.add_argument("--mass-accuracy", type=float, default=2.0, help="m/z noise (ppm, s.d.) (default: 2)")
+    group.add_argument("--intensity-noise", type=float, default=0.1,
+                       help="Intensity noise (log scale, s.d.) (default: 0.1)")
+
+    group = parser.add_argument_group("peptides")
+    group.add_argument("--abundance", type=float, default=1e6, help="Median peptide apex intensity (default: 1e6)")
+    group.add_argument("--peak-width", type=float, default=0.25, help="Median elution peak FWHM in minutes (default: 0.25)")
+    group.add_argument("--tailing", type=float, default=0.5,
+                       help="How much wider the tail of an elution peak is than its front (default: 0.5)")
+    group.add_argument("--rt-offset", type=float, default=-0.01,
+                       help="Mean heavy - light RT offset in minutes (default: -0.01)")
+    group.add_argument("--rt-offset-sd", type=float, default=0.005, help="S.d. of the RT offset (default: 0.005)")
+    group.add_argument("--hl-ratio", type=float, default=1.0, help="Median H/L ratio (default: 1)")
+    group.add_argument("--hl-ratio-sd", type=float, default=0.5, help="S.d. of the H/L ratio (log scale) (default: 0.5)")
+    group.add_argument("--unpaired", type=float, default=0.1,
+                       help="Fraction of peptides without a heavy partner (default: 0.1)")
+    return parser
+
+def main(argv=None):
+    parser  = createParser()
+    options = parser.parse_args(argv)
+    if options.psms_per_raw > int(options.gradient / options.cycle_time) * options.top_n:
+        parser.error("there are more PSMs per RAW file than MS/MS scans (increase --gradient or --top-n)")
+
+    output_dir = options.output_dir
+    del options.output_dir
+    manifest   = generateDataset(output_dir, options)
+    print("%d PSMs in %d RAW files written to %s" % (manifest["num_psms"], len(manifest["raw_files"]), output_dir))
+    return 0
+
+#------------------- Main -----------------------------------#
+
+if __name__ == "__main__":
+    sys.exit(main())
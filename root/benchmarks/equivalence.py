@@ -0,0 +1,119 @@
+#--------------------------------------------------------------------------------------------------------------------
+#Golden-output equivalence check for MethylQuant
+#
+#A faster engine is only useful if it gives the same results as the published algorithm
+#(IsotopeCorrelationTask/ElutionCorrelationTask, run row by row by ExperimentTask). This runs a candidate
+#engine (See task.equivalence.ENGINE_TABLE) and compares every column of its outputs with the expected outputs:
+#   * scan numbers, elution counts, confidence calls and text must match exactly
+#   * other numbers must match within a relative/absolute tolerance
+#
+#The expected outputs are either golden outputs (the default) or the outputs of the legacy engine:
+#   * golden outputs (golden/psms_N_seed_S_MethylQuant.csv) were written by the baseline tree, i.e., the
+#     published algorithm before any of the performance work (no memo tables, LRU caches or quantized mass
+#     keys), from the synthetic dataset with the same --psms and --seed. They catch changes to the search itself,
+#     so they must never be rewritten by the current tree
+#   * the legacy engine shares the search with the other engines, so it only catches differences between
+#     engines. It is used for experiments without golden outputs (-c)
+#
+#The experiments are either given (-c) or a synthetic dataset (See benchmarks/dataset.py).
+#
+#Usage:
+#   python benchmarks/equivalence.py [-c FILE ...] [--psms N] [--seed S] [--engine NAME] [--workers N]
+#                                    [--expected golden|legacy] [--rtol X] [--atol X] 
+#                                    [--report FILE] [--mismatches FILE]
+#
+#Exits with 1 if any output differs
+#--------------------------------------------------------------------------------------------------------------------
+
+#------------------ Dependencies ----------------------------#
+
+## External dependencies
+import os
+import sys
+import argparse
+import tempfile
+import pandas
+
+## Internal dependencies
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+import pipeline
+from src.io.experiments import ExperimentsReader
+from src.task import equivalence
+
+#------------------- Global Variables -----------------------#
+
+GOLDEN_DIR       = os.path.join(ROOT_DIR, "benchmarks", "golden")
+GOLDEN_FORMAT    = "psms_%d_seed_%d_MethylQuant.csv"
+EXPECTED_GOLDEN  = "golden"
+EXPECTED_LEGACY  = equivalence.LEGACY_ENGINE
+
+#------------------ Classes & Functions ---------------------#
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that an engine gives the same output as the golden outputs "
+                                                 "or the legacy engine")
+    parser.add_argument("-c", "--config", metavar="FILE", nargs="+", default=[],
+                        help="Experiment definitions files (default: a synthetic dataset)")
+    parser.add_argument("--psms", type=int, default=1000, help="PSMs of the synthetic dataset (default: 1000)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the synthetic dataset (default: 0)")
+    parser.add_argument("--data-dir", default=pipeline.DEFAULT_DATA_DIR, help="Directory of the (generated) datasets")
+    parser.add_argument("--engine", default="session", choices=sorted(equivalence.ENGINE_TABLE),
+                        help="Engine to check (default: session)")
+    parser.add_argument("--workers", type=int, default=1, help="Number of workers of the engine (default: 1)")
+    parser.add_argument("--expected", choices=(EXPECTED_GOLDEN, EXPECTED_LEGACY), 
+                        help="Compare with the golden outputs of the synthetic dataset, or the outputs of the "
+                             "legacy engine (default: golden, or legacy with -c)")
+    parser.add_argument("--rtol", type=float, default=equivalence.DEFAULT_RTOL,
+                        help="Relative tolerance of numbers (default: %(default)g)")
+    parser.add_argument("--atol", type=float, default=equivalence.DEFAULT_ATOL,
+                        help="Absolute tolerance of numbers (default: %(default)g)")
+    parser.add_argument("--work-dir", help="Directory for the outputs of the engines (default: a temporary directory)")
+    parser.add_argument("--report", metavar="FILE", help="Write the full diff report to a file")
+    parser.add_argument("--mismatches", metavar="FILE", help="Write every mismatching value to a .CSV file")
+    args = parser.parse_args(argv)
+
+    expected          = args.expected or (EXPECTED_LEGACY if len(args.config) != 0 else EXPECTED_GOLDEN)
+    definitions_paths = args.config
+    golden_paths      = None
+    if expected == EXPECTED_GOLDEN:
+        golden_path = os.path.join(GOLDEN_DIR, GOLDEN_FORMAT % (args.psms, args.seed))
+        if len(args.config) != 0:
+            parser.error("there are no golden outputs for -c (use --expected legacy)")
+        if not os.path.exists(golden_path):
+            parser.error("there is no golden output for %d PSMs (seed %d) in %s (use --expected legacy)" 
+                         % (args.psms, args.seed, GOLDEN_DIR))
+
+    if len(definitions_paths) == 0:
+        dataset_dir       = pipeline.getDataset(args.data_dir, args.psms, args.seed)
+        definitions_paths = [os.path.join(dataset_dir, pipeline.dataset.EXPERIMENTS_FILE)]
+
+    experiment_list = []
+    for definitions_path in definitions_paths:
+        experiment_list.extend(ExperimentsReader(definitions_path).getExperiments())
+
+    #the synthetic dataset has a single peptides file
+    if expected == EXPECTED_GOLDEN:
+        golden_paths = {p: golden_path for e in experiment_list for p in e.file_info.getPeptideFiles()}
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="methylquant_equivalence_")
+    diffs    = equivalence.runEquivalence(experiment_list, args.engine, work_dir, args.workers, args.rtol, args.atol,
+                                          golden_paths)
+
+    print("\n\n".join([d.formatReport() for d in diffs]))
+    if args.report is not None:
+        with open(args.report, "w") as f:
+            f.write("\n\n".join([d.formatReport(max_mismatches=len(d.mismatch_table)) for d in diffs]) + "\n")
+    if args.mismatches is not None:
+        mismatch_tables = [d.mismatch_table.assign(**{"Output File": d.actual_path}) for d in diffs]
+        pandas.concat(mismatch_tables).to_csv(args.mismatches, index=False)
+
+    is_equal = all(d.isEqual() for d in diffs)
+    print("%s: %s the %s outputs (outputs in %s)" % (args.engine, "same as" if is_equal else "DIFFERS from",
+                                                     expected, work_dir))
+    return 0 if is_equal else 1
+
+#------------------- Main -----------------------------------#
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+#--------------------------------------------------------------------------------------------------------------------
+#Import-time benchmark for MethylQuant
+#
+#Every worker process (and the UI) has to import MethylQuant before it can do anything,
+#so slow imports are paid again and again. This benchmark imports each package in a 
+#fresh interpreter and checks that:
+#   * the time it takes (on top of numpy and pandas, which are always needed) is within budget
+#   * none of the slow, optional modules are imported (they should only be imported when used)
+#
+#Usage:
+#   python benchmarks/imports.py [--repeat N] [--scale X]
+#
+#Exits with 1 if any package is over budget or imports an optional module
+#--------------------------------------------------------------------------------------------------------------------
+
+#------------------ Dependencies ----------------------------#
+
+## External dependencies
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+## Internal dependencies
+
+#------------------- Global Variables -----------------------#
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# Table containing package names -> maximum import time (ms), not counting numpy and pandas
+IMPORT_BUDGET_MS = {"src.model":   100,
+                    "src.io":      150,
+                    "src.task":    250,
+                    "src.console": 300}
+
+# Modules that are only needed by some features, and so should not be imported up front
+OPTIONAL_MODULES = ["wx",                   # UI
+                    "pubsub",               # UI
+                    "matplotlib",           # Plotting (debugging only)
+                    "scipy",                # Pearson correlation (only when scoring)
+                    "lxml",                 # mzIdentML files
+                    "comtypes",             # RAW files
+                    "pymsfilereader"]       # RAW files
+
+# Run in a fresh interpreter, so that nothing has been imported beforehand
+IMPORT_SCRIPT = """
+import sys, time, json
+start_time = time.perf_counter()
+import numpy, pandas
+base_time  = time.perf_counter()
+import %s
+end_time   = time.perf_counter()
+print(json.dumps({"base_ms":   (base_time - start_time) * 1000,
+                  "import_ms": (end_time - base_time) * 1000,
+                  "modules":   sorted(set(m.split(".")[0] for m in sys.modules))}))
+"""
+
+#------------------ Classes & Functions ---------------------#
+
+""" Returns (base time (ms), import time (ms), [optional modules]) for a package,
+    using the fastest of several runs
+"""
+def measureImport(package_name, repeat):
+    results = []
+    for i in range(repeat):
+        output = subprocess.check_output([sys.executable, "-c", IMPORT_SCRIPT % package_name], 
+                                         cwd=ROOT_DIR)
+        results.append(json.loads(output.decode().strip().splitlines()[-1]))
+
+    fastest_result   = min(results, key=lambda x: x["import_ms"])
+    optional_modules = [m for m in OPTIONAL_MODULES if m in fastest_result["modules"]]
+    return (fastest_result["base_ms"], fastest_result["import_ms"], optional_modules)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the import time of each MethylQuant package")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs per package (the fastest is used)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for the budgets (e.g., for slow machines)")
+    args = parser.parse_args(argv)
+
+    is_ok = True
+    print("%-12s %10s %10s %10s  %s" % ("package", "base (ms)", "time (ms)", "budget", "optional modules"))
+    for package_name, budget_ms in IMPORT_BUDGET_MS.items():
+        (base_ms, import_ms, optional_modules) = measureImport(package_name, args.repeat)
+        budget_ms = budget_ms * args.scale
+        is_within_budget = import_ms <= budget_ms and len(optional_modules) == 0
+        is_ok            = is_ok and is_within_budget
+
+        print("%-12s %10.1f %10.1f %10.1f  %s %s" % (package_name, base_ms, import_ms, budget_ms, 
+                                                     ",".join(optional_modules) or "-", 
+                                                     "" if is_within_budget else "<- FAIL"))
+
+    return 0 if is_ok else 1
+
+#------------------- Main -----------------------------------#
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+#--------------------------------------------------------------------------------------------------------------------
+#End-to-end benchmark for MethylQuant
+#
+#Runs a headless session (the same as MethylQuantConsole.py) over synthetic datasets of several sizes
+#(See benchmarks/dataset.py), each in a fresh interpreter, and records for each (size, workers):
+#   * the wall time of the session and the PSMs per second
+#   * the peak RSS of the session (and of its worker processes)
+#   * the time of each stage (See model.timing), summed over the RAW files
+#   * the MD5 of the output files (so a change in output shows up too)
+#
+#The results are written to a .JSON file, which can later be used as the baseline of another run.
+#Anything slower/bigger than the baseline by more than the tolerance is a regression.
+#The baseline of the default sizes is kept in benchmarks/baseline.json and is used unless --baseline is given
+#(--baseline "" runs without one). Times depend on the machine, so the baseline should be refreshed on the
+#machine that checks for regressions, with --output benchmarks/baseline.json, whenever it changes.
+#Datasets are generated the first time they are needed and kept in the data directory.
+#
+#Usage:
+#   python benchmarks/pipeline.py [--sizes N ...] [--workers N ...] [--output FILE]
+#                                 [--baseline FILE] [--tolerance X] [--rss-tolerance X]
+#
+#Exits with 1 if there are any regressions, or if a session fails
+#--------------------------------------------------------------------------------------------------------------------
+
+#------------------ Dependencies ----------------------------#
+
+## External dependencies
+import os
+import sys
+import glob
+import json
+import hashlib
+import platform
+import argparse
+import tempfile
+import subprocess
+
+## Internal dependencies
+import dataset
+
+#------------------- Global Variables -----------------------#
+
+ROOT_DIR         = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+RESULTS_FORMAT   = "MethylQuant benchmark results"
+RESULTS_VERSION  = 1
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), "methylquant_benchmarks")
+DEFAULT_SIZES    = [1000, 10000]
+DEFAULT_BASELINE = os.path.join(ROOT_DIR, "benchmarks", "baseline.json")
+OUTPUT_PATTERN   = "*_MethylQuant.csv"
+MB               = 1024 * 1024
+
+# Run in a fresh interpreter, so that the peak RSS is the session's own
+SESSION_SCRIPT = """
+import time, json
+from src import io, model, task
+
+statuses = {}
+def sendMessage(topic, **kwargs):
+    if topic == task.UPDATE_EXPERIMENT_STATUS_LISTENER:
+        statuses[kwargs["experiment_idx"]] = kwargs["experiment_status"]
+
+model.enableTiming(True)
+experiment_list = io.ExperimentsReader(%(experiments_path)r).getExperiments()
+session_task    = task.SessionTask(experiment_list, %(num_workers)d, send_message=sendMessage)
+start_time      = time.perf_counter()
+session_task.run()
+wall_time       = time.perf_counter() - start_time
+
+stage_timings   = model.StageTimings()
+for raw_timings in session_task.getTimingReport().raw_timings_table.values():
+    stage_timings.merge(raw_timings)
+# Worker processes report their own peak RSS (See SessionTask.getMemoryUsage)
+workers_peak_rss = stage_timings.memory_usage.peak_rss if %(num_workers)d > 1 else None
+print(json.dumps({"wall_time":        wall_time,
+                  "peak_rss":         model.getPeakRss(),
+                  "workers_peak_rss": workers_peak_rss,
+                  "passed":           all(s == model.Experiment.PASSED for s in statuses.values()),
+                  "stages":           {row[0]: {"calls": row[1], "total_time": row[2],
+                                                "max_time": row[3], "items": row[4]}
+                                       for row in stage_timings.getRows()}}))
+"""
+
+#------------------ Classes & Functions ---------------------#
+
+""" Returns the directory of the dataset with num_psms PSMs, generating it if it's not in data_dir already
+"""
+def getDataset(data_dir, num_psms, seed):
+    dataset_dir = os.path.join(data_dir, "psms_%d_seed_%d" % (num_psms, seed))
+    options     = dataset.createParser().parse_args([dataset_dir, "--psms", str(num_psms), "--seed", str(seed)])
+    del options.output_dir
+
+    manifest_path = os.path.join(dataset_dir, dataset.MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get("version") == dataset.DATASET_VERSION and manifest.get("options") == vars(options):
+            return dataset_dir
+
+    print("Generating %d PSMs in %s" % (num_psms, dataset_dir))
+    dataset.generateDataset(dataset_dir, options)
+    return dataset_dir
+
+""" Runs a session over a dataset in a fresh interpreter, and returns its results
+"""
+def runBenchmark(dataset_dir, num_workers):
+    for output_path in glob.glob(os.path.join(dataset_dir, OUTPUT_PATTERN + "*")):
+        os.remove(output_path)
+
+    script  = SESSION_SCRIPT % {"experiments_path": os.path.join(dataset_dir, dataset.EXPERIMENTS_FILE),
+                                "num_workers":      num_workers}
+    output  = subprocess.check_output([sys.executable, "-c", script], cwd=ROOT_DIR)
+    results = json.loads(output.decode().strip().splitlines()[-1])
+
+    results["output_md5"] = {}
+    for output_path in sorted(glob.glob(os.path.join(dataset_dir, OUTPUT_PATTERN))):
+        results["output_md5"][os.path.basename(output_path)] = getMd5(output_path)
+    return results
+
+def getMd5(path):
+    with open(path, "rb") as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+""" Returns a description of the machine and the build the benchmarks ran on
+"""
+def getEnvironment():
+    import numpy
+    import pandas
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT_DIR,
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {"commit":    commit,
+            "python":    platform.python_version(),
+            "numpy":     numpy.__version__,
+            "pandas":    pandas.__version__,
+            "platform":  platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count()}
+
+""" Returns the regressions of a benchmark against its baseline, as a list of messages.
+    Stages that take less than min_stage_time in the baseline are too noisy to compare
+"""
+def getRegressions(results, baseline, tolerance, rss_tolerance, min_stage_time):
+    regressions = []
+    if results["wall_time"] > baseline["wall_time"] * (1 + tolerance):
+        regressions.append("wall time %.2fs -> %.2fs" % (baseline["wall_time"], results["wall_time"]))
+
+    for rss_name in ("peak_rss", "workers_peak_rss"):
+        if results.get(rss_name) and baseline.get(rss_name) and \
+           results[rss_name] > baseline[rss_name] * (1 + rss_tolerance):
+            regressions.append("%s %.1fMB -> %.1fMB" % (rss_name.replace("_", " "), baseline[rss_name] / MB,
+                                                        results[rss_name] / MB))
+
+    for stage, stage_results in results["stages"].items():
+        stage_baseline = baseline["stages"].get(stage)
+        if stage_baseline is None or stage_baseline["total_time"] < min_stage_time:
+            continue
+        if stage_results["total_time"] > stage_baseline["total_time"] * (1 + tolerance):
+            regressions.append("%s %.2fs -> %.2fs" % (stage, stage_baseline["total_time"],
+                                                      stage_results["total_time"]))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run MethylQuant over synthetic datasets and check for regressions")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Dataset sizes in PSMs (default: %s)" % " ".join(map(str, DEFAULT_SIZES)))
+    parser.add_argument("--workers", type=int, nargs="+", default=[1], help="Numbers of workers (default: 1)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the datasets (default: 0)")
+    parser.add_argument("--repeat", type=int, default=1, help="Number of runs per benchmark (the fastest is used)")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="Directory of the (generated) datasets")
+    parser.add_argument("--output", default="benchmark_results.json", help="Results file (default: %(default)s)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE,
+                        help="Results file of an earlier run to compare against, or \"\" for none "
+                             "(default: benchmarks/baseline.json)")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Allowed slow down of the wall time and of each stage (default: 0.15)")
+    parser.add_argument("--rss-tolerance", type=float, default=0.15,
+                        help="Allowed increase of the peak RSS (default: 0.15)")
+    parser.add_argument("--min-stage-time", type=float, default=1.0,
+                        help="Stages faster than this (s) in the baseline are not compared (default: 1)")
+    args = parser.parse_args(argv)
+
+    baseline_table = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline_table = json.load(f)["benchmarks"]
+
+    dataset_dirs    = [(num_psms, getDataset(args.data_dir, num_psms, args.seed)) for num_psms in args.sizes]
+    benchmark_table = {}
+    is_ok           = True
+    print("%-24s %10s %10s %12s %12s  %s" % ("benchmark", "time (s)", "PSMs/s", "RSS (MB)", "baseline (s)", "status"))
+    for num_psms, dataset_dir in dataset_dirs:
+        for num_workers in args.workers:
+            benchmark_name = "psms=%d workers=%d" % (num_psms, num_workers)
+            runs           = [runBenchmark(dataset_dir, num_workers) for i in range(args.repeat)]
+            results        = min(runs, key=lambda x: x["wall_time"])
+            results.update({"num_psms": num_psms, "num_workers": num_workers,
+                            "psms_per_second": num_psms / results["wall_time"]})
+            benchmark_table[benchmark_name] = results
+
+            status   = [] if results["passed"] else ["session failed"]
+            baseline = baseline_table.get(benchmark_name)
+            if baseline is not None:
+                status.extend(getRegressions(results, baseline, args.tolerance, args.rss_tolerance,
+                                             args.min_stage_time))
+                if baseline.get("output_md5") not in (None, results["output_md5"]):
+                    print("  note: the output of %s differs from the baseline" % benchmark_name)
+            is_ok = is_ok and len(status) == 0
+
+            print("%-24s %10.2f %10.1f %12.1f %12s  %s" % (benchmark_name, results["wall_time"],
+                                                           results["psms_per_second"],
+                                                           (results["peak_rss"] or 0) / MB,
+                                                           "%.2f" % baseline["wall_time"] if baseline else "-",
+                                                           "; ".join(status) or "OK"))
+
+    with open(args.output, "w") as f:
+        json.dump({"format": RESULTS_FORMAT, "version": RESULTS_VERSION, "environment": getEnvironment(),
+                   "benchmarks": benchmark_table}, f, indent=2, sort_keys=True)
+    print("Results written to %s" % args.output)
+    return 0 if is_ok else 1
+
+#------------------- Main -----------------------------------#
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,24 @@
+#--------------------------------------------------------------------------------------------------------------------
+
+#This package contains classes and functions for running MethylQuant without a UI (i.e., headless)
+#Nothing in this package (or the packages it uses) imports wx
+
+#------------------ Dependencies ----------------------------#
+
+# Standard library imports
+
+# External imports
+
+# Internal imports
+from .core import ConsoleProgress
+from .core import createParser
+from .core import createExperiments
+from .core import createParametersList
+from .core import main
+from .constants import *
+
+#------------------- Global Variables -----------------------#
+
+#------------------ Classes & Functions ---------------------#
+
+#########################################################################################################
@@ -0,0 +1,22 @@
+#--------------------------------------------------------------------------------------------------------------------
+
+#This module contains console-related constants
+
+#------------------ Dependencies ----------------------------#
+
+# Standard library imports
+
+# External imports
+
+# Internal imports
+
+#------------------- Global Variables -----------------------#
+
+EXIT_SUCCESS   = 0      # All experiments passed
+EXIT_FAILED    = 1      # At least one experiment failed
+EXIT_USAGE     = 2      # Invalid arguments, config file or experiment (same as argparse)
+EXIT_CANCELLED = 3      # The session was interrupted; only some results were written
+
+PROGRAM_NAME   = "MethylQuantConsole"
+
+#------------------ Classes & Functions ---------------------#
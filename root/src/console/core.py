@@ -0,0 +1,335 @@
+#--------------------------------------------------------------------------------------------------------------------
+
+#This module contains classes and functions for running a session of MethylQuant experiments from the command line
+
+#------------------ Dependencies ----------------------------#
+
+# Standard library imports
+import sys
+import signal
+import argparse
+import itertools
+import threading
+import traceback
+
+# External imports
+
+# Internal imports
+from .. import model
+from .. import task
+from ..io.experiments import ExperimentsReader
+from ..io.experiments import ExperimentsWriter
+from ..io.experiments import createExperiment
+from ..io.cache import DEFAULT_CACHE_PATH
+from .constants import *
+
+#------------------- Global Variables -----------------------#
+
+EXPERIMENT_STATUS_TEXT = {model.Experiment.PASSED:  "PASSED", 
+                          model.Experiment.FAILED:  "FAILED",
+                          model.Experiment.PARTIAL: "PARTIAL"}
+
+#------------------ Classes & Functions ---------------------#
+
+""" Prints the messages of a session to the console (instead of the GUI)
+    and keeps track of the status of each experiment
+"""
+class ConsoleProgress():
+
+    def __init__(self, experiment_list, stream=sys.stderr, quiet=False):
+        self.experiment_list   = experiment_list
+        self.stream            = stream
+        self.quiet             = quiet
+        self.experiment_status = {}     # Table containing experiment index -> experiment status
+        self.last_line_len     = 0
+
+    """ Used as the send_message of SessionTask
+    """
+    def sendMessage(self, topic, **kwargs):
+        if topic == task.UPDATE_PROGRESS_LISTENER:
+            self.OnUpdateProgress(**kwargs)
+
+        elif topic == task.UPDATE_EXPERIMENT_STATUS_LISTENER:
+            self.OnUpdateExperimentStatus(**kwargs)
+
+        elif topic == task.UPDATE_MEMORY_LISTENER:
+            self.OnUpdateMemory(**kwargs)
+
+    def OnUpdateProgress(self, progress_report):
+        if self.quiet:
+            return
+
+        progress_counts = [progress_report.session_count, progress_report.raw_count, 
+                           progress_report.experiment_count]
+        status_text     = " | ".join([str(c) for c in progress_counts if c is not None])
+
+        #overwrite the previous line if we can, otherwise print a line per update
+        if self.stream.isatty():
+            self.stream.write("\r" + status_text.ljust(self.last_line_len))
+            self.last_line_len = len(status_text)
+        else:
+            self.stream.write(status_text + "\n")
+        self.stream.flush()
+
+    def OnUpdateMemory(self, raw_file, memory_usage):
+        if self.quiet:
+            return
+
+        self.finishLine()
+        self.stream.write("Memory after %s: %s\n" % (raw_file, memory_usage.formatDetails()))
+        self.stream.flush()
+
+    def OnUpdateExperimentStatus(self, experiment_idx, experiment_status):
+        self.experiment_status[experiment_idx] = experiment_status
+        self.finishLine()
+
+        experiment_name = self.experiment_list[experiment_idx].getExperimentName()
+        self.stream.write("Experiment %d (%s): %s\n" % (experiment_idx + 1, experiment_name, 
+                                                        EXPERIMENT_STATUS_TEXT[experiment_status]))
+        self.stream.flush()
+
+    def finishLine(self):
+        if self.last_line_len != 0:
+            self.stream.write("\n")
+            self.last_line_len = 0
+
+    """ Returns the exit code for the session, based on the worst experiment status
+    """
+    def getExitCode(self):
+        experiment_statuses = [self.experiment_status.get(i, model.Experiment.FAILED) 
+                               for i in range(len(self.experiment_list))]
+
+        if model.Experiment.FAILED in experiment_statuses:
+            return EXIT_FAILED
+
+        if model.Experiment.PARTIAL in experiment_statuses:
+            return EXIT_CANCELLED
+        return EXIT_SUCCESS
+
+#########################################################################################################
+
+def createParser():
+    parser = argparse.ArgumentParser(prog=PROGRAM_NAME, 
+                                     description="Quantify methyl-SILAC pairs without the MethylQuant UI.")
+
+    group = parser.add_argument_group("experiment")
+    group.add_argument("-c", "--config", metavar="FILE", nargs="+", default=[],
+                       help="Experiment definitions files (.json, .toml), e.g., saved by the UI or --save-config. "
+                            "If given, the experiment options below are ignored")
+    group.add_argument("-p", "--peptides", metavar="FILE", nargs="+", default=[],
+                       help="Sequenced peptides files (.csv, .mzid)")
+    group.add_argument("-r", "--raw-dirs", metavar="DIR", nargs="+", default=[],
+                       help="Directories containing the .raw files")
+    group.add_argument("--name", default="My Experiment", help="Experiment name")
+    group.add_argument("--description", default="Methyl-SILAC", help="Experiment description")
+    group.add_argument("--heavy", action="store_true", 
+                       help="The sequenced peptides are heavy (default: light)")
+    group.add_argument("--full-output", action="store_true", 
+                       help="Write the full output (default: summary)")
+    group.add_argument("--labels", metavar="RESIDUE:MASS", nargs="+", type=parseMassShift, 
+                       default=sorted(model.DEFAULT_LABEL_SET), help="Labels (default: M:4.022185)")
+    group.add_argument("--mods", metavar="NAME:MASS", nargs="+", type=parseMassShift, 
+                       default=sorted(model.DEFAULT_MOD_SET), 
+                       help="Modifications (default: Methyl, Dimethyl and Trimethyl)")
+
+    (mass_error, time_window_overlap, time_window, 
+     empty_ms_allowed, min_isotopomers_allowed, pearson_threshold) = model.DEFAULT_PARAMETER_TUPLE
+
+    group = parser.add_argument_group("parameters")
+    group.add_argument("--mass-error", type=float, default=mass_error, 
+                       help="Mass error (ppm)")
+    group.add_argument("--time-window-overlap", type=float, default=time_window_overlap, 
+                       help="Pair overlap search window (min)")
+    group.add_argument("--time-window", type=float, default=time_window, 
+                       help="Pair elution search window (min)")
+    group.add_argument("--empty-ms-allowed", type=int, default=empty_ms_allowed, 
+                       help="Empty MS allowed")
+    group.add_argument("--min-isotopomers-allowed", type=int, default=min_isotopomers_allowed, 
+                       help="Minimum isotopomers")
+    group.add_argument("--pearson-threshold", type=float, default=pearson_threshold, 
+                       help="Pearson correlation coefficient threshold")
+    group.add_argument("--sweep", metavar="NAME=VALUE,...", action="append", type=parseSweep, default=[],
+                       help="Run a parameter sweep over the given values of a parameter (e.g., mass_error=5,10,20). "
+                            "Can be repeated to sweep a grid. Other parameters are taken from the options above, "
+                            "and the results are written to one table per peptides file (*_MethylQuant_sweep.csv)")
+
+    group = parser.add_argument_group("session")
+    group.add_argument("-w", "--workers", type=int, default=task.DEFAULT_NUM_WORKERS,
+                       help="Number of worker processes")
+    group.add_argument("--resume", action="store_true", 
+                       help="Skip .raw files that were completed by a previous (interrupted) run "
+                            "with the same parameters and input files, and append the rest")
+    group.add_argument("--cache", metavar="FILE", nargs="?", const=DEFAULT_CACHE_PATH, 
+                       help="Keep the result of each row in a cache (default: %s), "
+                            "so that re-runs only search new or changed rows" % DEFAULT_CACHE_PATH)
+    group.add_argument("--timing", action="store_true", 
+                       help="Time each stage of the search, and print a summary for each .raw file "
+                            "and each experiment at the end")
+    group.add_argument("--trace", metavar="FILE", 
+                       help="Write a JSON line for each row searched to FILE: its .raw file and scan, "
+                            "the scans visited, peak lookups, averaging calls, time of each stage and boundaries found")
+    group.add_argument("-q", "--quiet", action="store_true", 
+                       help="Only print the status of each experiment")
+    group.add_argument("--save-config", metavar="FILE", 
+                       help="Save the experiments to an experiment definitions file and exit, without running them")
+    return parser
+
+""" Converts "NAME:MASS" into (NAME, MASS). Used for labels and modifications
+"""
+def parseMassShift(text):
+    try:
+        (name, mass) = text.rsplit(":", 1)
+        return (name, float(mass))
+
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid mass shift: '%s' (expected NAME:MASS)" % text)
+
+""" Converts "NAME=VALUE,..." into (NAME, [VALUE, ...]). Used for parameter sweeps
+"""
+def parseSweep(text):
+    try:
+        (name, values) = text.split("=", 1)
+        values         = [float(v) for v in values.split(",")]
+
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid sweep: '%s' (expected NAME=VALUE,...)" % text)
+
+    if name not in model.PARAMETER_NAMES:
+        raise argparse.ArgumentTypeError("invalid sweep parameter: '%s' (expected one of %s)" 
+                                         % (name, ", ".join(model.PARAMETER_NAMES)))
+    return (name, values)
+
+""" Returns a list of Parameters for every combination of the swept values (See parseSweep).
+    Parameters that are not swept are taken from the command line arguments
+"""
+def createParametersList(args):
+    sweep_names     = [name for (name, values) in args.sweep]
+    parameters_list = []
+    for sweep_values in itertools.product(*[values for (name, values) in args.sweep]):
+        parameter_table = {n: getattr(args, n) for n in model.PARAMETER_NAMES}
+        parameter_table.update(zip(sweep_names, sweep_values))
+        parameters_list.append(model.Parameters([parameter_table[n] for n in model.PARAMETER_NAMES]))
+    return parameters_list
+
+""" Returns a list of Experiments from the experiment definitions files (if there are any), 
+    or from the command line arguments.
+
+    Raises a ValueError if any of the experiments are invalid
+"""
+def createExperiments(args):
+    if len(args.config) == 0:
+        return [createExperiment(getDefinition(args))]
+
+    experiment_list = []
+    for definitions_path in args.config:
+        try:
+            experiments_reader = ExperimentsReader(definitions_path)
+            experiment_list.extend(experiments_reader.getExperiments())
+
+        except ValueError as e:
+            raise ValueError("%s: %s" % (definitions_path, e))
+
+    return experiment_list
+
+""" Returns the definition of the experiment given by the command line arguments (See io.ExperimentsReader)
+"""
+def getDefinition(args):
+    silac_type   = "heavy" if args.heavy else "light"
+    output_style = "full" if args.full_output else "summary"
+    return {"name":           args.name,
+            "description":    args.description,
+            "peptides_files": [{"path": p, "silac_type": silac_type, "output_style": output_style} 
+                               for p in args.peptides],
+            "raw_dirs":       args.raw_dirs,
+            "labels":         [{"residue": r, "mass": m} for (r, m) in args.labels],
+            "modifications":  [{"name": t, "mass": m} for (t, m) in args.mods],
+            "parameters":     {n: getattr(args, n) for n in model.PARAMETER_NAMES}}
+
+#########################################################################################################
+
+""" Runs MethylQuant from the command line and returns the exit code
+    
+    Keyword arguments:
+    argv -- Command line arguments (sys.argv[1:] if None)
+"""
+def main(argv=None):
+    parser = createParser()
+    args   = parser.parse_args(argv)
+
+    try:
+        if len(args.sweep) != 0 and args.resume:
+            raise ValueError("--resume can't be used with --sweep")
+
+        experiment_list = createExperiments(args)
+        if args.save_config is not None:
+            experiments_writer = ExperimentsWriter(args.save_config)
+            experiments_writer.writeExperiments(experiment_list)
+            return EXIT_SUCCESS
+
+    except (ValueError, IOError) as e:
+        parser.print_usage(sys.stderr)
+        sys.stderr.write("%s: error: %s\n" % (parser.prog, e))
+        return EXIT_USAGE
+
+    model.enableTiming(args.timing)
+    console_progress = ConsoleProgress(experiment_list, quiet=args.quiet)
+    if len(args.sweep) != 0:
+        session_task = task.SweepTask(experiment_list, createParametersList(args), args.workers, 
+                                      send_message=console_progress.sendMessage, cache_path=args.cache,
+                                      trace_path=args.trace)
+    else:
+        session_task = task.SessionTask(experiment_list, args.workers, 
+                                        send_message=console_progress.sendMessage, resume=args.resume, 
+                                        cache_path=args.cache, trace_path=args.trace)
+
+    #the session runs in its own thread, so that Ctrl+C can cancel it cleanly (See installCancelHandler)
+    session_errors = []
+    session_done   = threading.Event()
+    session_thread = threading.Thread(target=runSession, args=(session_task, session_errors, session_done))
+    cancel_handler = installCancelHandler(session_task)
+    session_thread.start()
+    try:
+        while not session_done.wait(0.5):
+            pass
+
+    finally:
+        if cancel_handler is not None:
+            signal.signal(signal.SIGINT, cancel_handler)
+    session_thread.join()
+
+    console_progress.finishLine()
+    if args.timing:
+        sys.stderr.write(session_task.getTimingReport().formatReport() + "\n")
+    if len(session_errors) != 0:
+        traceback.print_exception(*session_errors[0])
+        return EXIT_FAILED
+    return console_progress.getExitCode()
+
+def runSession(session_task, session_errors, session_done):
+    try:
+        session_task.run()
+
+    except Exception:
+        session_errors.append(sys.exc_info())
+
+    finally:
+        session_done.set()
+
+""" Makes Ctrl+C (SIGINT) cancel the session instead of raising KeyboardInterrupt in the main thread, 
+    which can interrupt a wait on the session thread part way through. 
+    Returns the previous handler (to put back once the session is done), 
+    or None if the handler can't be installed (signals can only be handled by the main thread)
+"""
+def installCancelHandler(session_task):
+    def OnInterrupt(signum, frame):
+        if not session_task.isCancelled():
+            sys.stderr.write("\nCancelling...\n")
+            session_task.cancel()
+
+    try:
+        return signal.signal(signal.SIGINT, OnInterrupt)
+
+    except ValueError:
+        return None
+
+#########################################################################################################
@@ -10,6 +10,7 @@
 # External imports
 
 # Internal imports
+from .core import MethylQuantApp
 from .core import MethylQuantFrame
 
 #------------------- Global Variables -----------------------#
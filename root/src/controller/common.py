@@ -81,6 +81,26 @@ def showInvalidExperimentDialog():
 
 #########################################################################################################
 
+def showInvalidExperimentsFileDialog(definitions_path, error_text):
+    invalid_file_dialog = wx.MessageDialog(None, definitions_path + " is invalid.\n\n" +
+                                           error_text + "\n\n" +
+                                           "For more information, See Help.",
+                                           "Error", style=wx.ICON_ERROR)
+    invalid_file_dialog.ShowModal()
+
+#########################################################################################################
+
+def showSessionErrorDialog(session_error):
+    session_error_dialog = wx.MessageDialog(None, "MethylQuant stopped because of an error.\n\n" +
+                                            "%s: %s\n\n" % (type(session_error).__name__, session_error) +
+                                            "Unfinished experiments have been marked as failed. " +
+                                            "Results written so far have been kept.\n\n" +
+                                            "For more information, See Help.",
+                                            "Error", style=wx.ICON_ERROR)
+    session_error_dialog.ShowModal()
+
+#########################################################################################################
+
 def showInvalidModificationDialog():
     invalid_modification_dialog = wx.MessageDialog(None, "Modification is invalid.\n\n" +
                                                    "Please check:\n" +
@@ -5,6 +5,8 @@
 #------------------ Dependencies ----------------------------#
 
 # Standard library imports
+import threading
+import traceback
 
 # External imports
 import wx
@@ -17,6 +19,9 @@ from .. import view
 from . import info
 from . import tool
 from .common import *
+from ..io.experiments import ExperimentsReader
+from ..io.experiments import ExperimentsWriter
+from ..io.cache import DEFAULT_CACHE_PATH
 
 #------------------- Global Variables -----------------------#
 
@@ -26,9 +31,23 @@ REMOVE_EXPERIMENT_DIALOG_TITLE   = "Remove Experiment"
 REMOVE_EXPERIMENT_DIALOG_MESSAGE = "Are you sure you want to remove this experiment?"
 ADD_EXPERIMENT_DIALOG_TITLE      = "Add Experiment"
 ADD_EXPERIMENT_DIALOG_SIZE       = (0.26, 0.4)
+LOG_FILE                         = "MethylQuant_log_file.txt"      # Use for testing
+EXPERIMENTS_FILE_WILDCARD        = "JSON (*.json)|*.json|TOML (*.toml)|*.toml"
 
 #------------------ Classes & Functions ---------------------#
 
+class MethylQuantApp(wx.App):
+     
+    def __init__(self):
+        wx.App.__init__(self)     #redirect=True, filename=LOG_FILE     # Use for testing
+ 
+    def OnInit(self):
+        self.frame = MethylQuantFrame()
+        self.frame.Show()         #Make the UI visible to the user
+        return True
+
+#########################################################################################################
+
 class MethylQuantFrame(wx.Frame):
 
     def __init__(self):
@@ -36,6 +55,9 @@ class MethylQuantFrame(wx.Frame):
                           title=MQ_FRAME_TITLE)
 
         self.experiment_list = []
+        self.sessionTask     = None
+        self.sessionThread   = None
+        self.is_closing      = False    # The window is closed once the session has stopped (See OnExit)
         pub.subscribe(self.UpdateExperimentList, view.UPDATE_EXPERIMENT_LIST_LISTENER)
 
         (x, y) = getSize(MQ_FRAME_SIZE)
@@ -52,12 +74,16 @@ class MethylQuantFrame(wx.Frame):
         #Create the main panel that will hold all other widgets
         self.main_panel = view.MethylQuantPanel(self)
         self.Bind(wx.EVT_BUTTON, self.OnStart, self.main_panel.start_btn)
+        self.Bind(wx.EVT_BUTTON, self.OnPause, self.main_panel.pause_btn)
+        self.Bind(wx.EVT_BUTTON, self.OnCancelSession, self.main_panel.cancel_btn)
         self.Bind(wx.EVT_CLOSE, self.OnExit)
 
     def getMenuData(self):
         # Underline hotkey letter with &
         return (("&File", 
-                    (("About", wx.ART_INFORMATION, self.OnAbout), 
+                    (("Open experiments", wx.ART_FILE_OPEN, self.OnOpenExperiments), 
+                     ("Save experiments", wx.ART_FILE_SAVE, self.OnSaveExperiments), 
+                     ("About", wx.ART_INFORMATION, self.OnAbout), 
                      ("Exit", wx.ART_QUIT, self.OnExit))),
                 ("&Tools", 
                     (("Modifications", None, self.OnModifications), 
@@ -108,16 +134,66 @@ class MethylQuantFrame(wx.Frame):
 
     def createStatusBar(self):
         statusBar = wx.StatusBar(self)
-        statusBar.SetFieldsCount(2)
+        statusBar.SetFieldsCount(3)
         self.SetStatusBar(statusBar)
         pub.subscribe(self.OnUpdateStatus, task.UPDATE_STATUS_LISTENER)
+        pub.subscribe(self.OnUpdateProgress, task.UPDATE_PROGRESS_LISTENER)
+        pub.subscribe(self.OnUpdateExperimentStatus, task.UPDATE_EXPERIMENT_STATUS_LISTENER)
+        pub.subscribe(self.OnUpdateMemory, task.UPDATE_MEMORY_LISTENER)
 
     """ The following functions define the actions that occur when 
         a menu item in the menubar is pressed
     """
     def OnExit(self, event):
+        #a running session is cancelled first, so that its pool is shut down and its files are 
+        #written up to the last RAW file. The window is destroyed when it finishes (See OnFinish)
+        if self.sessionThread is not None and self.sessionThread.is_alive():
+            self.is_closing = True
+            self.sessionTask.cancel()
+            self.main_panel.enableSessionButtons(False)
+            self.OnUpdateStatus(0, "Cancelling...")
+            if isinstance(event, wx.CloseEvent) and event.CanVeto():
+                event.Veto()
+            return
+
         self.Destroy()
 
+    """ Experiments are saved to (and opened from) the same experiment 
+        definitions files as the command line runner (See io.ExperimentsReader)
+    """
+    def OnOpenExperiments(self, event):
+        openFileDialog = wx.FileDialog(self, message="Open experiments", 
+                                       wildcard=EXPERIMENTS_FILE_WILDCARD, 
+                                       style=wx.FD_OPEN | wx.FD_FILE_MUST_EXIST)
+
+        if (openFileDialog.ShowModal() == wx.ID_OK):
+            definitions_path = openFileDialog.GetPath()
+            try:
+                experiments_reader = ExperimentsReader(definitions_path)
+                experiment_list    = experiments_reader.getExperiments()
+
+            except (ValueError, IOError) as e:
+                showInvalidExperimentsFileDialog(definitions_path, str(e))
+                return
+
+            for experiment in experiment_list:
+                self.experiment_list.append(experiment)
+                self.main_panel.experiment_summary_list.insertExperiment(experiment)
+
+    def OnSaveExperiments(self, event):
+        saveFileDialog = wx.FileDialog(self, message="Save experiments", 
+                                       wildcard=EXPERIMENTS_FILE_WILDCARD, 
+                                       style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT)
+
+        if (saveFileDialog.ShowModal() == wx.ID_OK):
+            definitions_path = saveFileDialog.GetPath()
+            try:
+                experiments_writer = ExperimentsWriter(definitions_path)
+                experiments_writer.writeExperiments(self.experiment_list)
+
+            except (ValueError, IOError) as e:
+                showInvalidExperimentsFileDialog(definitions_path, str(e))
+
     def OnAbout(self, event):
         about_dialog = info.AboutDialog(None)
         about_dialog.ShowModal()
@@ -163,31 +239,95 @@ class MethylQuantFrame(wx.Frame):
     def OnUpdateStatus(self, status_box_id, status_text):
         self.GetStatusBar().SetStatusText(status_text, status_box_id)
 
+    def OnUpdateProgress(self, progress_report):
+        #the session in the first status box, and the current RAW file and experiment in the second
+        progress_counts = [progress_report.raw_count, progress_report.experiment_count]
+        status_text     = " | ".join([str(c) for c in progress_counts if c is not None])
+        self.OnUpdateStatus(0, str(progress_report.session_count))
+        self.OnUpdateStatus(1, status_text)
+
+    def OnUpdateMemory(self, raw_file, memory_usage):
+        #the memory used by the last RAW file in the third status box (kept once the session has finished)
+        self.OnUpdateStatus(2, "%s: %s" % (raw_file, memory_usage.formatSummary()))
+
+    def OnUpdateExperimentStatus(self, experiment_idx, experiment_status):
+        self.main_panel.experiment_summary_list.updateExperimentStatus(experiment_idx, experiment_status)
+
     """ The following function defines what happens when
         the 'Find pairs' button is pressed 
     """
     def OnStart(self, event):
         self.enableWidgets(False)   #Disable all widgets once MethylQuant has started
+        self.OnUpdateStatus(2, "")
 
         #------------------ This is the heart of MethylQuant ----------------------------#
-        #------------------       Run for each experiment    ----------------------------#
-        for i, e in enumerate(self.experiment_list):
-            experimentTask = task.ExperimentTask(e)
-            # try:
-            experimentTask.run()
-            self.main_panel.experiment_summary_list.updateExperimentStatus(i, e.PASSED)
-
-            # # If, for whatever reason, we encounter an error, then update the experiment status to FAILED
-            # except:
-            #     self.main_panel.experiment_summary_list.updateExperimentStatus(i, experiment.FAILED)
-
-        self.finaliseProgress()
+        #------------------  Run all experiments together   ----------------------------#
+        #each RAW file is only opened once, regardless of how many 
+        #peptides files (or experiments) reference it
+        #The session runs in a background thread so that the UI stays responsive
+        num_workers = self.main_panel.workers_spin.getNumWorkers()
+        resume      = self.main_panel.resume_checkbox.GetValue()
+        cache_path  = DEFAULT_CACHE_PATH if self.main_panel.cache_checkbox.GetValue() else None
+        self.sessionTask   = task.SessionTask(self.experiment_list, num_workers, send_message=self.sendMessage, 
+                                              resume=resume, cache_path=cache_path)
+        self.sessionThread = threading.Thread(target=self.runSession, args=(self.sessionTask,), daemon=True)
+        self.sessionThread.start()
+
+    """ The following functions define what happens when
+        the 'Pause/Resume' and 'Cancel' buttons are pressed.
+        The session stops (or waits) before searching its next row
+    """
+    def OnPause(self, event):
+        if self.sessionTask.isPaused():
+            self.sessionTask.resume()
+        else:
+            self.sessionTask.pause()
+            self.OnUpdateStatus(0, "Paused")
+
+        self.main_panel.updatePauseButton(self.sessionTask.isPaused())
+
+    def OnCancelSession(self, event):
+        self.sessionTask.cancel()
+        self.main_panel.enableSessionButtons(False)
+        self.OnUpdateStatus(0, "Cancelling...")
+
+    """ Runs the session in the background thread. 
+        If it fails, the error is passed to the UI thread, which shows it (See OnFinish)
+    """
+    def runSession(self, sessionTask):
+        session_error = None
+        try:
+            sessionTask.run()
+
+        except Exception as e:
+            traceback.print_exc()
+            session_error = e
+
+        finally:
+            wx.CallAfter(self.OnFinish, session_error)
+
+    """ Passes messages from the session thread to the UI thread.
+        Widgets can only be updated by the UI thread
+    """
+    def sendMessage(self, topic, **kwargs):
+        wx.CallAfter(pub.sendMessage, topic, **kwargs)
+
+    def OnFinish(self, session_error=None):
+        self.sessionThread.join()
+        self.sessionThread = None
+        if self.is_closing:
+            self.Destroy()
+            return
+
+        self.finaliseProgress(session_error)
         self.enableWidgets(True)    #Enable all widgets once MethylQuant has finished
+        if session_error is not None:
+            showSessionErrorDialog(session_error)
 
     def enableWidgets(self, is_enabled):
         self.enableToolBar(is_enabled)
         self.enableMenuBar(is_enabled)
-        self.main_panel.Enable() if is_enabled else self.main_panel.Disable()
+        self.main_panel.enableWidgets(is_enabled)
 
     def enableToolBar(self, is_enabled):
         toolBar = self.GetToolBar()
@@ -200,13 +340,22 @@ class MethylQuantFrame(wx.Frame):
         for i in range(0, menuBar.GetMenuCount()):
             menuBar.EnableTop(i, is_enabled)
 
-    def finaliseProgress(self):
+    def finaliseProgress(self, session_error=None):
         #update the status and progress bar after processing all CSV files
         if len(self.experiment_list) == 0:
             self.OnUpdateStatus(0, "No experiments to process")
             self.OnUpdateStatus(1, "")
             self.main_panel.progress_gauge.UpdateGauge(False)
 
+        #the progress bar stays where the session stopped
+        elif session_error is not None:
+            self.OnUpdateStatus(0, "Failed")
+            self.OnUpdateStatus(1, "")
+
+        elif self.sessionTask.isCancelled():
+            self.OnUpdateStatus(0, "Cancelled")
+            self.OnUpdateStatus(1, "")
+
         else:
             self.OnUpdateStatus(0, "Done")
             self.OnUpdateStatus(1, "")
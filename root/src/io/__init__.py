@@ -10,6 +10,9 @@
 
 from .reader import PeptidesReader
 from .reader import RawReader
+from .experiments import ExperimentsReader
+from .experiments import ExperimentsWriter
+from .cache import ResultCache
 
 #------------------- Global Variables -----------------------#
 
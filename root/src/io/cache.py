@@ -0,0 +1,88 @@
+#--------------------------------------------------------------------------------------------------------------------
+
+#This module contains IO-related classes and functions for caching results between runs
+
+#------------------ Dependencies ----------------------------#
+
+## External dependencies
+import os
+import json
+import pickle
+import sqlite3
+import hashlib
+
+## Internal dependencies
+
+#------------------- Global Variables -----------------------#
+
+DEFAULT_CACHE_PATH   = os.path.join(os.path.expanduser("~"), ".MethylQuant", "results_cache.sqlite")
+RESULT_CACHE_VERSION = 2
+STAGE_CORRELATION    = "correlations"   # Results of the extraction, windowing and correlation stages
+STAGE_RESULT         = "results"        # Scored results, i.e., the (columns, values) added to the output
+CACHE_STAGES         = (STAGE_CORRELATION, STAGE_RESULT)
+MAX_KEYS_PER_QUERY   = 500      # SQLite limits the number of parameters in a query
+
+#------------------ Classes & Functions ---------------------#
+
+""" Persistent cache (SQLite database) of the result of each sequenced peptide (PSM).
+
+    Each result is stored under a key of everything that it depends on (See getResultKey),
+    so re-running the same (or a slightly changed) peptides file only needs to search
+    the rows that have not been searched before.
+
+    Results are kept for each stage of the search (See task.CorrelationTask). 
+    The correlation results don't depend on the scoring parameters, so if only those change, 
+    the rows just need to be scored again (without opening the RAW file).
+"""
+class ResultCache():
+
+    def __init__(self, cache_path=DEFAULT_CACHE_PATH):
+        self.cache_path = cache_path
+
+        cache_dir = os.path.dirname(cache_path)
+        if cache_dir != "" and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        self.connection = sqlite3.connect(cache_path)
+        for stage in CACHE_STAGES:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS %s (key TEXT PRIMARY KEY, result BLOB)" % stage)
+        self.connection.commit()
+
+    """ Returns a table of result key -> result for the keys of a stage that are in the cache
+    """
+    def getResults(self, result_keys, stage=STAGE_RESULT):
+        result_keys = list(set(result_keys))
+        results     = {}
+        for start_idx in range(0, len(result_keys), MAX_KEYS_PER_QUERY):
+            query_keys = result_keys[start_idx:start_idx + MAX_KEYS_PER_QUERY]
+            query      = "SELECT key, result FROM %s WHERE key IN (%s)" % (stage, ",".join("?" * len(query_keys)))
+            for (result_key, result) in self.connection.execute(query, query_keys):
+                results[result_key] = pickle.loads(result)
+
+        return results
+
+    """ Adds a table of result key -> result of a stage to the cache
+    """
+    def putResults(self, results, stage=STAGE_RESULT):
+        if len(results) == 0:
+            return
+
+        rows = [(k, sqlite3.Binary(pickle.dumps(v, pickle.HIGHEST_PROTOCOL))) for (k, v) in results.items()]
+        self.connection.executemany("INSERT OR REPLACE INTO %s (key, result) VALUES (?, ?)" % stage, rows)
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+#########################################################################################################
+
+""" Returns the key of a result in the cache
+
+    Keyword arguments:
+    result_inputs -- List of everything that the result depends on (must be JSON serialisable)
+"""
+def getResultKey(result_inputs):
+    result_inputs = [RESULT_CACHE_VERSION] + list(result_inputs)
+    return hashlib.sha256(json.dumps(result_inputs).encode()).hexdigest()
+
+#########################################################################################################
@@ -0,0 +1,268 @@
+#--------------------------------------------------------------------------------------------------------------------
+
+#This module contains IO-related classes and functions for reading and writing experiment definitions
+
+#------------------ Dependencies ----------------------------#
+
+## External dependencies
+import os
+import glob
+import json
+
+## Internal dependencies
+from .. import model
+from .reader import PeptidesReader
+
+#------------------- Global Variables -----------------------#
+
+DEFINITION_FORMAT  = "MethylQuant experiments"
+DEFINITION_VERSION = 1                  # Increment this (and update upgradeDefinitions) when the layout changes
+
+SILAC_TYPE_NAMES   = {model.ID_LIGHT:   "light",   model.ID_HEAVY: "heavy"}
+OUTPUT_STYLE_NAMES = {model.ID_SUMMARY: "summary", model.ID_FULL:  "full"}
+
+#------------------ Classes & Functions ---------------------#
+
+""" Experiment definitions file (.JSON or .TOML) reader.
+    
+    A file contains any number of experiments, e.g.,
+
+    {"format": "MethylQuant experiments", "version": 1,
+     "experiments": [{"name": "My Experiment", "description": "Methyl-SILAC",
+                      "peptides_files": [{"path": "a.csv", "silac_type": "light", "output_style": "summary"}],
+                      "raw_dirs": [{"path": "C:\\\\raw_files"}],
+                      "labels": [{"residue": "M", "mass": 4.022185}],
+                      "modifications": [{"name": "Methyl", "mass": 4.022185}],
+                      "parameters": {"mass_error": 10, "pearson_threshold": 0.5}}]}
+
+    Anything that is left out takes the same default as the 'Add experiment' dialog. 
+    Peptides files and RAW dirs can also be given as plain paths, and relative paths 
+    are relative to the definitions file. If the RAW files of a peptides file/RAW dir 
+    are not listed (as 'raw_files'), they are read from the file/dir.
+"""
+class ExperimentsReader():
+
+    def __init__(self, definitions_path):
+        self.definitions_path = str(definitions_path)
+        self.base_dir         = os.path.dirname(os.path.abspath(self.definitions_path))
+        self.init()
+
+    def init(self):
+        if (self.definitions_path.lower().endswith(".toml")):
+            document = loadToml(self.definitions_path)
+
+        else:
+            with open(self.definitions_path) as definitions_file:
+                document = json.load(definitions_file)
+
+        self.definitions = upgradeDefinitions(document)
+
+    """ Returns a list of Experiments. Raises a ValueError if any of them are invalid
+    """
+    def getExperiments(self):
+        experiment_list = []
+        for experiment_idx, definition in enumerate(self.definitions):
+            try:
+                experiment = createExperiment(definition, self.base_dir)
+                experiment_list.append(experiment)
+
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError("experiment %d is invalid (%s)" % (experiment_idx + 1, e))
+
+        return experiment_list
+
+#########################################################################################################
+
+""" Experiment definitions file (.JSON or .TOML) writer (See ExperimentsReader)
+"""
+class ExperimentsWriter():
+
+    def __init__(self, definitions_path):
+        self.definitions_path = str(definitions_path)
+
+    def writeExperiments(self, experiment_list):
+        document = {"format":      DEFINITION_FORMAT, 
+                    "version":     DEFINITION_VERSION,
+                    "experiments": [getDefinition(e) for e in experiment_list]}
+
+        if (self.definitions_path.lower().endswith(".toml")):
+            text = dumpToml(document)
+
+        else:
+            text = json.dumps(document, indent=2)
+
+        with open(self.definitions_path, "w") as definitions_file:
+            definitions_file.write(text)
+
+#########################################################################################################
+
+""" Returns the definition (a table of plain values) of an Experiment
+"""
+def getDefinition(experiment):
+    file_info = experiment.file_info
+
+    peptides_files = []
+    for seq_peptides_path in file_info.getPeptideFiles():
+        peptides_files.append({"path":         seq_peptides_path, 
+                               "raw_files":    sorted(file_info.peptides_file_map[seq_peptides_path]),
+                               "silac_type":   SILAC_TYPE_NAMES[file_info.getSilacType(seq_peptides_path)],
+                               "output_style": OUTPUT_STYLE_NAMES[file_info.getOutputStyle(seq_peptides_path)]})
+
+    raw_dirs = []
+    for raw_dir_path, raw_files in file_info.raw_dir_map.items():
+        raw_dirs.append({"path": raw_dir_path, "raw_files": sorted(raw_files)})
+
+    labels        = [{"residue": r, "mass": m} for (r, m) in sorted(experiment.mass_shifts.label_set)]
+    modifications = [{"name": t, "mass": m} for (t, m) in sorted(experiment.mass_shifts.mod_set)]
+    parameters    = dict(zip(model.PARAMETER_NAMES, experiment.parameters.getParameterTuple()))
+    return {"name":           experiment.getExperimentName(),
+            "description":    experiment.getExperimentDescription(),
+            "peptides_files": peptides_files,
+            "raw_dirs":       raw_dirs,
+            "labels":         labels,
+            "modifications":  modifications,
+            "parameters":     parameters}
+
+""" Returns an Experiment from its definition, in the same way as the 'Add experiment' dialog.
+    Raises a ValueError if the experiment is invalid
+    
+    Keyword arguments:
+    definition -- Table containing the experiment definition (See ExperimentsReader)
+    base_dir   -- Directory that relative paths are relative to
+"""
+def createExperiment(definition, base_dir=""):
+    peptides_files = [toEntry(e, base_dir) for e in definition.get("peptides_files", [])]
+    raw_dirs       = [toEntry(e, base_dir) for e in definition.get("raw_dirs", [])]
+    if len(peptides_files) == 0:
+        raise ValueError("no sequenced peptides files")
+    if len(raw_dirs) == 0:
+        raise ValueError("no raw file directories")
+
+    experiment_info   = (str(definition.get("name", "My Experiment")), 
+                         str(definition.get("description", "Methyl-SILAC")))
+    peptides_file_map = {}      # Table containing CSV file paths -> {Raw file names}
+    silac_map         = {}      # Table containing CSV file paths -> {Silac type}
+    output_map        = {}      # Table containing CSV file paths -> {Output style}
+    for entry in peptides_files:
+        seq_peptides_path = entry["path"]
+        peptides_file_map[seq_peptides_path] = getPeptidesRawFiles(entry)
+        silac_map[seq_peptides_path]         = getId(SILAC_TYPE_NAMES, entry.get("silac_type", "light"))
+        output_map[seq_peptides_path]        = getId(OUTPUT_STYLE_NAMES, entry.get("output_style", "summary"))
+
+    raw_dir_map = {}            # Table containing Raw dir paths  -> {Raw file names}
+    for entry in raw_dirs:
+        raw_dir_map[entry["path"]] = getDirRawFiles(entry)
+
+    labels        = definition.get("labels", None)
+    modifications = definition.get("modifications", None)
+    label_set     = (model.DEFAULT_LABEL_SET if labels is None 
+                     else set([(str(l["residue"]), float(l["mass"])) for l in labels]))
+    mod_set       = (model.DEFAULT_MOD_SET if modifications is None 
+                     else set([(str(m["name"]), float(m["mass"])) for m in modifications]))
+
+    parameters      = definition.get("parameters", {})
+    parameter_tuple = tuple([parameters.get(n, d) for (n, d) in zip(model.PARAMETER_NAMES, 
+                                                                    model.DEFAULT_PARAMETER_TUPLE)])
+    unknown_names   = set(parameters).difference(model.PARAMETER_NAMES)
+    if len(unknown_names) != 0:
+        raise ValueError("unknown parameters: " + ", ".join(sorted(unknown_names)))
+
+    #Check that the residues are unique. We cannot have more than one of the same residue
+    residues = [r for (r, m) in label_set]
+    if len(residues) != len(set(residues)):
+        raise ValueError("labels must have unique residues")
+
+    # Check that all raw files in CSVs are in the directories we are searching 
+    raw_files_in_all_csv = set.union(*peptides_file_map.values())
+    raw_files_in_all_dir = set.union(*raw_dir_map.values())
+    missing_raw_files    = raw_files_in_all_csv.difference(raw_files_in_all_dir)
+    if len(missing_raw_files) != 0:
+        raise ValueError("raw files not found: " + ", ".join(sorted(missing_raw_files)))
+
+    #Parameters raises a ValueError if any of the values are invalid
+    experiment = model.Experiment(experiment_info, peptides_file_map, raw_dir_map, 
+                                  set(label_set), set(mod_set), output_map, silac_map, parameter_tuple)
+    return experiment
+
+""" Returns the contents of a definitions file in the current layout (See DEFINITION_VERSION)
+"""
+def upgradeDefinitions(document):
+    if (not isinstance(document, dict) or document.get("format") != DEFINITION_FORMAT):
+        raise ValueError("not a MethylQuant experiments file")
+
+    version = document.get("version")
+    if (not isinstance(version, int) or version < 1 or version > DEFINITION_VERSION):
+        raise ValueError("unsupported version: %s (expected %d or lower)" % (version, DEFINITION_VERSION))
+
+    #Older versions are upgraded here, one version at a time
+    return list(document.get("experiments", []))
+
+""" Returns a peptides file/RAW dir entry as a table, with an absolute path
+"""
+def toEntry(entry, base_dir):
+    if isinstance(entry, str):
+        entry = {"path": entry}
+
+    entry         = dict(entry)
+    entry["path"] = os.path.normpath(os.path.join(base_dir, str(entry["path"])))
+    return entry
+
+def getId(id_names, name):
+    for id_value, id_name in id_names.items():
+        if id_name == str(name).lower():
+            return id_value
+    raise ValueError("'%s' is not one of: %s" % (name, ", ".join(id_names.values())))
+
+""" Returns the RAW files referenced by a peptides file entry (reading the file if they are not listed)
+"""
+def getPeptidesRawFiles(entry):
+    if "raw_files" in entry:
+        return set(map(str, entry["raw_files"]))
+
+    try:
+        peptides_reader = PeptidesReader(entry["path"])
+        return peptides_reader.getDataFiles()
+
+    except (UnicodeDecodeError, KeyError, ValueError, IOError):
+        raise ValueError(entry["path"] + " is invalid")
+
+""" Returns the RAW files in a RAW dir entry (looking in the dir if they are not listed)
+"""
+def getDirRawFiles(entry):
+    if "raw_files" in entry:
+        return set(map(str, entry["raw_files"]))
+
+    raw_files_in_dir = glob.glob(entry["path"] + "/*.raw")
+    if len(raw_files_in_dir) == 0:
+        raise ValueError(entry["path"] + " does not contain any .raw files")
+
+    f = lambda x: str(os.path.basename(x))
+    return set(map(f, raw_files_in_dir))
+
+""" TOML is read with tomllib (Python 3.11+) or the tomli package, 
+    and written with the tomli_w package. These are only imported when needed
+"""
+def loadToml(definitions_path):
+    try:
+        import tomllib
+
+    except ImportError:
+        try:
+            import tomli as tomllib
+
+        except ImportError:
+            raise ValueError("reading TOML files needs Python 3.11+ or the tomli package")
+
+    with open(definitions_path, "rb") as definitions_file:
+        return tomllib.load(definitions_file)
+
+def dumpToml(document):
+    try:
+        import tomli_w
+
+    except ImportError:
+        raise ValueError("writing TOML files needs the tomli_w package")
+
+    return tomli_w.dumps(document)
+
+#########################################################################################################
@@ -5,20 +5,25 @@
 #------------------ Dependencies ----------------------------#
 
 # Standard library imports
+import copy
 import gc
 import os
 import re
+import queue
+import threading
+from array import array
 from pathlib import Path
 
 # External imports
+import numpy
 import pandas as pd
-import wx
-import comtypes
-from lxml import etree
-from pymsfilereader import MSFileReader
+#lxml (mzIdentML), comtypes and pymsfilereader (RAW files) are only imported 
+#when they are needed, as they are slow to import (See loadMSFileReader)
 
 # Internal imports
 from .. import model
+from .synthetic import SyntheticRawFile
+from .synthetic import isSyntheticRaw
 
 #------------------- Global Variables -----------------------#
 
@@ -45,7 +50,7 @@ class PeptidesReader():
         if (self.seq_peptides_path.suffix == '.csv'):
             reader = CsvReader(self.seq_peptides_path)
 
-        elif (self.seq_peptides_path.suffix == '.mzIdentML'):
+        elif (self.seq_peptides_path.suffix in ('.mzid', '.mzIdentML')):
             reader   = MzIdentMlReader(self.seq_peptides_path)
             colNames = [self.PROTEIN_COLUMN_NAME, 
                         self.PEPTIDE_COLUMN_NAME, self.MODIFICATION_COLUMN_NAME,
@@ -61,6 +66,7 @@ class PeptidesReader():
             raise KeyError
 
         self.setHeaderIndices()
+        self.setRawIndices()
 
     def getColumns(self):
         return [x.lower() for x in self.seq_peptides.columns] 
@@ -94,17 +100,79 @@ class PeptidesReader():
         The 'Data File' column is non-optional.
     """
     def getDataFiles(self):
-        data_col_idx = self.getHeaderIndex(self.DATA_FILE_COLUMN_NAME)
-        return set(self.seq_peptides.iloc[:, data_col_idx].unique().flatten())
+        return set(self.raw_indices.keys())
  
     """ Get all sequenced peptides rows for a given .RAW file.
+        Rows are returned as a slice of the table sorted by ('Data File', 'Start Scan')
     """
     def getSortedRowsInRaw(self, raw_file):
-        #get all rows in the sequenced peptides file that match to the raw file name and sort
-        in_raw                     = self.seq_peptides.loc[:, self.DATA_FILE_COLUMN_NAME] == raw_file
-        seq_peptides_in_raw        = self.seq_peptides.loc[in_raw]
-        sorted_seq_peptides_in_raw = seq_peptides_in_raw.sort_values(self.START_SCAN_COLUMN_NAME, ascending=True)
+        (raw_start_idx, raw_stop_idx) = self.raw_indices[raw_file]
+        sorted_seq_peptides_in_raw    = self.sorted_seq_peptides.iloc[raw_start_idx:raw_stop_idx]
         return sorted_seq_peptides_in_raw
+
+    """ Get a copy of the reader containing only the rows for a given .RAW file
+        (or a contiguous part of them). 
+        This is much cheaper to send to a worker process than the whole table.
+    """
+    def getReaderForRaw(self, raw_file, start_idx=0, stop_idx=None):
+        sorted_seq_peptides_in_raw = self.getSortedRowsInRaw(raw_file).iloc[start_idx:stop_idx]
+
+        seq_peptides_reader                     = copy.copy(self)
+        seq_peptides_reader.seq_peptides        = sorted_seq_peptides_in_raw
+        seq_peptides_reader.sorted_seq_peptides = sorted_seq_peptides_in_raw
+        seq_peptides_reader.raw_indices         = {raw_file: (0, len(sorted_seq_peptides_in_raw))}
+        return seq_peptides_reader
+
+    """ Get a copy of the reader containing only some of the rows of each .RAW file
+        (e.g., the rows that are not in the result cache). 
+        The rows are kept in sorted order. .RAW files that are not in raw_rows keep none of their rows
+
+        Keyword arguments:
+        raw_rows -- Table containing Raw file name -> [Row positions in the sorted rows of the .RAW file]
+    """
+    def getReaderForRows(self, raw_rows):
+        row_indices = []
+        raw_indices = {}
+        for raw_file, (raw_start_idx, raw_stop_idx) in self.raw_indices.items():
+            raw_row_indices        = [raw_start_idx + i for i in raw_rows.get(raw_file, [])]
+            raw_indices[raw_file]  = (len(row_indices), len(row_indices) + len(raw_row_indices))
+            row_indices.extend(raw_row_indices)
+
+        sorted_seq_peptides                     = self.sorted_seq_peptides.iloc[row_indices]
+        seq_peptides_reader                     = copy.copy(self)
+        seq_peptides_reader.seq_peptides        = sorted_seq_peptides
+        seq_peptides_reader.sorted_seq_peptides = sorted_seq_peptides
+        seq_peptides_reader.raw_indices         = raw_indices
+        return seq_peptides_reader
+
+    """ Get the 'Start Scan' values of all sequenced peptides rows for a given .RAW file (in sorted order)
+    """
+    def getSortedStartScans(self, raw_file):
+        sorted_seq_peptides_in_raw = self.getSortedRowsInRaw(raw_file)
+        start_scans = sorted_seq_peptides_in_raw.iloc[:, self.getHeaderIndex(self.START_SCAN_COLUMN_NAME)]
+        return start_scans.to_numpy().astype(int)
+
+    """ Sort the sequenced peptides by ('Data File', 'Start Scan') and 
+        record the (start, stop) row positions of each .RAW file in the sorted table.
+        This is done once, so that we don't need to search the whole table for every .RAW file
+    """
+    def setRawIndices(self):
+        data_file_column  = self.seq_peptides.columns[self.getHeaderIndex(self.DATA_FILE_COLUMN_NAME)]
+        start_scan_column = self.seq_peptides.columns[self.getHeaderIndex(self.START_SCAN_COLUMN_NAME)]
+
+        #a stable sort keeps rows with the same start scan in their original order
+        self.sorted_seq_peptides = self.seq_peptides.sort_values([data_file_column, start_scan_column], 
+                                                                 kind='mergesort')
+
+        #each .RAW file is a contiguous block of rows in the sorted table
+        data_files        = self.sorted_seq_peptides[data_file_column].to_numpy()
+        is_raw_start      = numpy.append(len(data_files) > 0, data_files[1:] != data_files[:-1])
+        raw_start_indices = numpy.flatnonzero(is_raw_start[:len(data_files)])
+        raw_stop_indices  = numpy.append(raw_start_indices[1:], len(data_files))
+
+        self.raw_indices = {}
+        for raw_start_idx, raw_stop_idx in zip(raw_start_indices.tolist(), raw_stop_indices.tolist()):
+            self.raw_indices[data_files[raw_start_idx]] = (raw_start_idx, raw_stop_idx)
  
     def getRowInfo(self, row):
         peptide_sequence = self.getPeptideSequenceValue(row)
@@ -164,23 +232,24 @@ class CsvReader():
 #########################################################################################################
 
 """ mzIdentML reader
+
+    The document is streamed with iterparse and each element is cleared once it has been parsed,
+    so memory is bounded by the number of identifications rather than the size of the document.
+    References between elements are resolved with lookup tables of positions, and 
+    the PSM columns are collected directly into typed arrays.
 """
 class MzIdentMlReader():
     
-    SEQUENCE_COLLECTION_ELEMENT      = "SequenceCollection"
     DB_SEQUENCE_ELEMENT              = "DBSequence"
     PEPTIDE_ELEMENT                  = "Peptide"
     PEPTIDE_SEQUENCE_ELEMENT         = "PeptideSequence"
     MODIFICATION_ELEMENT             = "Modification"
     PEPTIDE_EVIDENCE_ELEMENT         = "PeptideEvidence"
-    DATA_COLLECTION_ELEMENT          = "DataCollection"
-    INPUTS_ELEMENT                   = "Inputs"
     SPECTRA_DATA_ELEMENT             = "SpectraData"    
-    ANALYSIS_DATA_ELEMENT            = "AnalysisData"
-    SPECTRUM_ID_LIST_ELEMENT         = "SpectrumIdentificationList"
     SPECTRUM_ID_RESULT_ELEMENT       = "SpectrumIdentificationResult"
     SPECTRUM_ID_ITEM_ELEMENT         = "SpectrumIdentificationItem"
     PEPTIDE_EVIDENCE_REF_ELEMENT     = "PeptideEvidenceRef"
+    PROTEIN_AMBIGUITY_GROUP_ELEMENT  = "ProteinAmbiguityGroup"
     CV_PARAM_ELEMENT                 = "cvParam"
     
     ID_TAG                           = "id"
@@ -189,12 +258,9 @@ class MzIdentMlReader():
     NAME_TAG                         = "name"
     DB_SEQUENCE_REF_TAG              = "dBSequence_ref"
     PEPTIDE_REF_TAG                  = "peptide_ref"
-    SEQUENCE_REF_TAG                 = "sequence"
-    MODIFICATION_REF_TAG             = "modification"
     RESIDUE_TAG                      = "residues"
     LOCATION_TAG                     = "location"
     SPECTRA_DATA_REF_TAG             = "spectraData_ref"
-    SPECTRUM_ID_ITEM_REF_TAG         = "spectrumIdentificationItem_ref"
     CALC_MZ_TAG                      = "calculatedMassToCharge"
     CHARGE_TAG                       = "chargeState"
     PEPTIDE_EVIDENCE_REF_TAG         = "peptideEvidence_ref"
@@ -205,97 +271,124 @@ class MzIdentMlReader():
 
     def __init__(self, seq_peptides_path):
         self.seq_peptides_path = seq_peptides_path
-        self.db_seq_table           = {}
-        self.peptide_table          = {}
-        self.peptide_evidence_table = {}
-        self.spectra_data_table     = {}
+
+        ## Lookup tables for resolving references between elements
+        ## Each value is stored once and referenced by its position
+        self.db_seq_table           = {}    # DBSequence id      -> position in db_seq_values
+        self.peptide_table          = {}    # Peptide id         -> position in peptide_seq_values/modification_values
+        self.peptide_evidence_table = {}    # PeptideEvidence id -> (DBSequence position, Peptide position)
+        self.spectra_data_table     = {}    # SpectraData id     -> position in spectra_data_values
+        self.db_seq_values          = []
+        self.peptide_seq_values     = []
+        self.modification_values    = []
+        self.spectra_data_values    = []
+
+        ## PSM columns. One entry per SpectrumIdentificationItem
+        self.db_seq_column          = array('l')
+        self.peptide_column         = array('l')
+        self.charge_column          = array('l')
+        self.spectra_data_column    = array('l')
+        self.scan_num_column        = array('l')
+        self.calc_mz_column         = array('d')
         
-        self.spectrum_result_table  = {}
-        self.spectrum_item_table    = {}
+        self.setNamespace("")
         self.init()
 
     def init(self):
-        tree           = etree.parse(self.seq_peptides_path)
-        root           = tree.getroot()
-        self.namespace = "{" + root.nsmap[None] + "}"
-        self.parseRoot(root)
-        
-        peptides_table          = self.parseTables()
-        self.seq_peptides_table = pd.DataFrame(peptides_table)
+        from lxml import etree
+
+        events = etree.iterparse(str(self.seq_peptides_path), events=('start-ns', 'end'))
+        for event, element in events:
+            if (event == 'start-ns'):
+                ## element is a (prefix, uri) tuple. We only want the default namespace
+                (prefix, uri) = element
+                if (prefix == '' and self.namespace == ''):
+                    self.setNamespace(uri)
+
+            elif (element.tag in self.element_parsers):
+                parseElement = self.element_parsers[element.tag]
+                parseElement(element)
+                self.clearElement(element)
+
+        self.seq_peptides_table = self.createTable()
+
+    def setNamespace(self, uri):
+        self.namespace       = uri
+        self.element_parsers = {self.getElementTag(self.DB_SEQUENCE_ELEMENT)             : self.parseDbSequenceElement,
+                                self.getElementTag(self.PEPTIDE_ELEMENT)                 : self.parsePeptideElement,
+                                self.getElementTag(self.PEPTIDE_EVIDENCE_ELEMENT)        : self.parsePeptideEvidenceElement,
+                                self.getElementTag(self.SPECTRA_DATA_ELEMENT)            : self.parseSpectraDataElement,
+                                self.getElementTag(self.SPECTRUM_ID_RESULT_ELEMENT)      : self.parseSpectrumIdResultElement,
+                                self.getElementTag(self.PROTEIN_AMBIGUITY_GROUP_ELEMENT) : self.skipElement}
 
     def getElementTag(self, string):
-        return self.namespace + string
+        return "{" + self.namespace + "}" + string if self.namespace else string
+
+    """ Release the memory held by an element that we have finished parsing. 
+        Previous siblings have already been parsed, so they can be removed from the parent too
+    """
+    def clearElement(self, element):
+        element.clear()
+        parent = element.getparent()
+        while element.getprevious() is not None:
+            del parent[0]
 
     def putDbSeq(self, db_seq_id, db_seq_value):
         if (db_seq_id in self.db_seq_table):
             raise KeyError
-        self.db_seq_table[db_seq_id] = db_seq_value
+        self.db_seq_table[db_seq_id] = len(self.db_seq_values)
+        self.db_seq_values.append(db_seq_value)
 
     def putPeptide(self, peptide_id, peptide_seq, modifications):
         if (peptide_id in self.peptide_table):
             raise KeyError
-        self.peptide_table[peptide_id] = (peptide_seq, modifications)
+        self.peptide_table[peptide_id] = len(self.peptide_seq_values)
+        self.peptide_seq_values.append(peptide_seq)
+        self.modification_values.append(modifications)
 
     def putPeptideEvidence(self, peptide_evidence_id, db_seq_id, peptide_id):
         if (peptide_evidence_id in self.peptide_evidence_table):
             raise KeyError
-        self.peptide_evidence_table[peptide_evidence_id] = (db_seq_id, peptide_id)
+        self.peptide_evidence_table[peptide_evidence_id] = (self.db_seq_table[db_seq_id], 
+                                                            self.peptide_table[peptide_id])
 
     def putSpectraData(self, spectra_data_id, spectra_data_location):
         if (spectra_data_id in self.spectra_data_table):
             raise KeyError
-        self.spectra_data_table[spectra_data_id] = spectra_data_location
-
-    def putSpectraResult(self, spectrum_result_id, spectra_data_id, scan_num):
-        if (spectrum_result_id in self.spectrum_result_table):
-            raise KeyError
-        self.spectrum_result_table[spectrum_result_id] = (spectra_data_id, scan_num)
-
-    def putSpectraItem(self, spectrum_item_id, calc_mz, charge, 
-                       peptide_evidence_id):
-        
-        if (spectrum_item_id in self.spectrum_item_table):
-            raise KeyError
-        self.spectrum_item_table[spectrum_item_id] = (calc_mz, charge, peptide_evidence_id)
-
-    def convertToSpectraResultId(self, spectrum_item_id):
-        spectrum_result_id = re.sub('SII', 'SIR'  , spectrum_item_id)
-        spectrum_result_id = re.sub('_[0-9]+$', '', spectrum_result_id)
-        return spectrum_result_id
-
-    def getSpectraDataValue(self, spectrum_item_id):
-        spectrum_result_id          = self.convertToSpectraResultId(spectrum_item_id)        
-        (spectra_data_id, scan_num) = self.spectrum_result_table[spectrum_result_id]        
-        spectra_data_location       = self.spectra_data_table[spectra_data_id]
-        return (spectra_data_location, scan_num)
-
-    def getPeptideDataValue(self, peptide_evidence_id):
-        (db_seq_id, peptide_id)      = self.peptide_evidence_table[peptide_evidence_id]        
-        db_seq_value                 = self.db_seq_table[db_seq_id]
-        (peptide_seq, modifications) = self.peptide_table[peptide_id]
-        return (db_seq_value, peptide_seq, modifications)
-
-    def parseRoot(self, root):
-        seq_collection_element_tag = self.getElementTag(self.SEQUENCE_COLLECTION_ELEMENT)
-        seq_collection_element = root.iter(seq_collection_element_tag).next()
-        self.parseSequenceCollectionElement(seq_collection_element)
-
-        data_collection_element_tag = self.getElementTag(self.DATA_COLLECTION_ELEMENT)
-        data_collection_element = root.iter(data_collection_element_tag).next()
-        self.parseDataCollectionElement(data_collection_element)
-        
-    def parseTables(self):
-        peptides_table = []
-        for spectrum_item_id in self.spectrum_item_table:
-            (calc_mz, charge, peptide_evidence_id)     = self.spectrum_item_table[spectrum_item_id]
-            (spectra_data_location, scan_num)          = self.getSpectraDataValue(spectrum_item_id)
-            (db_seq_value, peptide_seq, modifications) = self.getPeptideDataValue(peptide_evidence_id)        
+        self.spectra_data_table[spectra_data_id] = len(self.spectra_data_values)
+        self.spectra_data_values.append(spectra_data_location)
+
+    def putSpectraItem(self, spectra_data_id, scan_num, calc_mz, charge, peptide_evidence_id):
+        (db_seq_idx, peptide_idx) = self.peptide_evidence_table[peptide_evidence_id]
+        self.db_seq_column.append(db_seq_idx)
+        self.peptide_column.append(peptide_idx)
+        self.charge_column.append(charge)
+        self.spectra_data_column.append(self.spectra_data_table[spectra_data_id])
+        self.scan_num_column.append(scan_num)
+        self.calc_mz_column.append(calc_mz)
+
+    """ Create the PSM table from the typed columns.
+        Text columns are expanded from the lookup values, so each distinct string is only stored once
+    """
+    def createTable(self):
+        db_seq_values       = numpy.array(self.db_seq_values, dtype=object)
+        peptide_seq_values  = numpy.array(self.peptide_seq_values, dtype=object)
+        modification_values = numpy.array(self.modification_values, dtype=object)
+        spectra_data_values = numpy.array(self.spectra_data_values, dtype=object)
         
-            row = [db_seq_value, peptide_seq, modifications, charge, spectra_data_location, scan_num, calc_mz]
-            peptides_table.append(row)
-
+        peptide_column  = numpy.asarray(self.peptide_column, dtype=numpy.intp)
+        peptides_table  = pd.DataFrame({0 : db_seq_values[numpy.asarray(self.db_seq_column, dtype=numpy.intp)], 
+                                        1 : peptide_seq_values[peptide_column], 
+                                        2 : modification_values[peptide_column], 
+                                        3 : numpy.asarray(self.charge_column), 
+                                        4 : spectra_data_values[numpy.asarray(self.spectra_data_column, dtype=numpy.intp)], 
+                                        5 : numpy.asarray(self.scan_num_column), 
+                                        6 : numpy.asarray(self.calc_mz_column)})
         return peptides_table
 
+    def skipElement(self, element):
+        pass
+
     """ The following functions parses the SequenceCollection of the mzIdentML
     <SequenceCollection>
         <DBSequence id="DBSeq_1_RRF1_YEAST" searchDatabase_ref="SDB_Sprot" accession="RRF1_YEAST">
@@ -310,21 +403,17 @@ class MzIdentMlReader():
         </Peptide>
         <PeptideEvidence id="PE_844_2_RRF1_YEAST_0_195_200" start="195" end="200" pre="K" post="K" peptide_ref="peptide_844_2" isDecoy="false" dBSequence_ref="DBSeq_1_RRF1_YEAST" />
     """
-    def parseSequenceCollectionElement(self, seq_collection_element):
-        db_seq_element_tag = self.getElementTag(self.DB_SEQUENCE_ELEMENT)
-        for db_seq_element in seq_collection_element.iter(db_seq_element_tag):
-            (db_seq_id, db_seq_value) = self.getDbSequenceInfo(db_seq_element)
-            self.putDbSeq(db_seq_id, db_seq_value)
- 
-        peptide_element_tag = self.getElementTag(self.PEPTIDE_ELEMENT)
-        for peptide_element in seq_collection_element.iter(peptide_element_tag):
-            (peptide_id, peptide_seq, modifications) = self.getPeptideInfo(peptide_element)
-            self.putPeptide(peptide_id, peptide_seq, modifications)
+    def parseDbSequenceElement(self, db_seq_element):
+        (db_seq_id, db_seq_value) = self.getDbSequenceInfo(db_seq_element)
+        self.putDbSeq(db_seq_id, db_seq_value)
 
-        peptide_evidence_element_tag = self.getElementTag(self.PEPTIDE_EVIDENCE_ELEMENT)
-        for peptide_evidence_element in seq_collection_element.iter(peptide_evidence_element_tag):
-            (peptide_evidence_id, db_seq_id, peptide_id) = self.getPeptideEvidenceInfo(peptide_evidence_element)
-            self.putPeptideEvidence(peptide_evidence_id, db_seq_id, peptide_id)
+    def parsePeptideElement(self, peptide_element):
+        (peptide_id, peptide_seq, modifications) = self.getPeptideInfo(peptide_element)
+        self.putPeptide(peptide_id, peptide_seq, modifications)
+
+    def parsePeptideEvidenceElement(self, peptide_evidence_element):
+        (peptide_evidence_id, db_seq_id, peptide_id) = self.getPeptideEvidenceInfo(peptide_evidence_element)
+        self.putPeptideEvidence(peptide_evidence_id, db_seq_id, peptide_id)
 
     def getDbSequenceInfo(self, db_seq_element):
         db_seq_id      = db_seq_element.get(self.ID_TAG)
@@ -340,7 +429,7 @@ class MzIdentMlReader():
     
     def getPeptideSequence(self, peptide_element):
         peptide_seq_element_tag = self.getElementTag(self.PEPTIDE_SEQUENCE_ELEMENT)
-        peptide_seq_element     = peptide_element.iter(peptide_seq_element_tag).next()
+        peptide_seq_element     = next(peptide_element.iter(peptide_seq_element_tag))
         return peptide_seq_element.text
         
     def getModifications(self, peptide_element):
@@ -362,30 +451,21 @@ class MzIdentMlReader():
         return mod_info
 
     def getPeptideEvidenceInfo(self, peptide_evidence_element):
-        peptide_evidence_id   = peptide_evidence_element.get(self.ID_TAG)
+        peptide_evidence_id  = peptide_evidence_element.get(self.ID_TAG)
         db_seq_id            = peptide_evidence_element.get(self.DB_SEQUENCE_REF_TAG)
         peptide_id           = peptide_evidence_element.get(self.PEPTIDE_REF_TAG)
         return (peptide_evidence_id, db_seq_id, peptide_id)
 
-    """ The following functions parses the DataCollection of the mzIdentML
+    """ The following functions parses the Inputs in DataCollection of the mzIdentML
         <DataCollection>
-            <Inputs>..........</Inputs>
+            <Inputs>
+                <SpectraData location="C:\\data\\20140120_001.raw" id="SD_1">..........</SpectraData>
+            </Inputs>
             <AnalysisData>..........</AnalysisData>
     """
-    def parseDataCollectionElement(self, data_collection_element):
-        inputs_element_tag = self.getElementTag(self.INPUTS_ELEMENT)
-        inputs_element    = data_collection_element.iter(inputs_element_tag).next()
-        self.parseInputsElement(inputs_element)
-
-        analysis_data_element_tag = self.getElementTag(self.ANALYSIS_DATA_ELEMENT)
-        analysis_data_element    = data_collection_element.iter(analysis_data_element_tag).next()
-        self.parseAnalysisDataElement(analysis_data_element)
-
-    def parseInputsElement(self, inputs_element):
-        spectra_data_element_tag = self.getElementTag(self.SPECTRA_DATA_ELEMENT)
-        for spectra_data_element in inputs_element.iter(spectra_data_element_tag):
-            (spectra_data_id, spectra_data_location) = self.getSpectraInfo(spectra_data_element)
-            self.putSpectraData(spectra_data_id, spectra_data_location)
+    def parseSpectraDataElement(self, spectra_data_element):
+        (spectra_data_id, spectra_data_location) = self.getSpectraInfo(spectra_data_element)
+        self.putSpectraData(spectra_data_id, spectra_data_location)
 
     def getSpectraInfo(self, spectra_data_element):
         spectra_data_id       = spectra_data_element.get(self.ID_TAG)
@@ -395,11 +475,6 @@ class MzIdentMlReader():
         spectra_data_location = re.sub('.* ', '', spectra_data_location)          ## Format file string. As a slight workaround for heterogeneous names, remove everything before the last whitespace 
         return (spectra_data_id, spectra_data_location)
 
-    def parseAnalysisDataElement(self, analysisDataElement):
-        spectrum_id_list_element_tag = self.getElementTag(self.SPECTRUM_ID_LIST_ELEMENT)
-        spectrum_id_list_element     = analysisDataElement.iter(spectrum_id_list_element_tag).next()
-        self.parseSpectrumIdListElement(spectrum_id_list_element)
-
     """ The following functions parses the SpectrumIdentificationList in DataCollection of the mzIdentML
         <SpectrumIdentificationList id="SIL_1" numSequencesSearched="7900">
             <FragmentationTable>..........</FragmentationTable>
@@ -414,47 +489,40 @@ class MzIdentMlReader():
                 <cvParam accession="MS:1001030" name="number of peptide seqs compared to each spectrum" cvRef="PSI-MS" value="60"/>
                 <cvParam accession="MS:1000796" name="spectrum title" cvRef="PSI-MS" value="Spectrum43447 scans:1916,"/>
     """
-    def parseSpectrumIdListElement(self, spectrum_id_list_element):
-        spectrum_id_result_element_tag = self.getElementTag(self.SPECTRUM_ID_RESULT_ELEMENT)        
-        for spectrum_id_result_element in spectrum_id_list_element.iter(spectrum_id_result_element_tag):
-            (spectrum_result_id, spectra_data_id, scan_num) = self.getSpectrumIdResultInfo(spectrum_id_result_element)            
-            self.putSpectraResult(spectrum_result_id, spectra_data_id, scan_num)
-            
-            self.parseSpectrumIdResultElement(spectrum_id_result_element)
+    def parseSpectrumIdResultElement(self, spectrum_id_result_element):
+        (spectra_data_id, scan_num)  = self.getSpectrumIdResultInfo(spectrum_id_result_element)
+        spectrum_id_item_element_tag = self.getElementTag(self.SPECTRUM_ID_ITEM_ELEMENT)
+        for spectrum_id_item_element in spectrum_id_result_element.iterchildren(spectrum_id_item_element_tag):
+            (calc_mz, charge, peptide_evidence_id) = self.getSpectrumIdItemInfo(spectrum_id_item_element)
+            self.putSpectraItem(spectra_data_id, scan_num, calc_mz, charge, peptide_evidence_id)
 
     def getSpectrumIdResultInfo(self, spectrum_id_result_element):
-        spectrum_result_id   = spectrum_id_result_element.get(self.ID_TAG)
         spectra_data_id      = spectrum_id_result_element.get(self.SPECTRA_DATA_REF_TAG)
-        cv_param_table       = self.getCvParamInfo(spectrum_id_result_element)
+        cv_param_table       = self.getCvParamInfo(spectrum_id_result_element, recursive=False)
         scan_num             = cv_param_table[self.CV_SCAN_ACESSION][0]           ## (value, name) pairs. Scan number is in value
         scan_num             = re.sub('.* scans:(.*),', '\\1', scan_num)          ## Format scan number string
-        return (spectrum_result_id, spectra_data_id, scan_num)
-
-    def parseSpectrumIdResultElement(self, spectrum_id_result_element):
-        spectrum_id_item_element_tag = self.getElementTag(self.SPECTRUM_ID_ITEM_ELEMENT)        
-        for spectrum_id_item_element in spectrum_id_result_element.iter(spectrum_id_item_element_tag):
-            (spectrum_item_id, calc_mz, charge, peptide_evidence_id) = self.getSpectrumIdItemInfo(spectrum_id_item_element)
-            self.putSpectraItem(spectrum_item_id, calc_mz, charge, peptide_evidence_id)
+        return (spectra_data_id, int(scan_num))
 
     def getSpectrumIdItemInfo(self, spectrum_id_item_element):
-        spectrum_item_id     = spectrum_id_item_element.get(self.ID_TAG)
-        calc_mz             = spectrum_id_item_element.get(self.CALC_MZ_TAG)
-        charge               = spectrum_id_item_element.get(self.CHARGE_TAG)
+        calc_mz              = float(spectrum_id_item_element.get(self.CALC_MZ_TAG))
+        charge               = int(spectrum_id_item_element.get(self.CHARGE_TAG))
         peptide_evidence_id  = self.getPeptideEvidenceRef(spectrum_id_item_element)
-        return (spectrum_item_id, calc_mz, charge, peptide_evidence_id)
+        return (calc_mz, charge, peptide_evidence_id)
 
     def getPeptideEvidenceRef(self, spectrum_id_item_element):
         peptide_evidence_ref_element_tag = self.getElementTag(self.PEPTIDE_EVIDENCE_REF_ELEMENT)        
-        peptide_evidence_ref_element     = spectrum_id_item_element.iter(peptide_evidence_ref_element_tag).next()
+        peptide_evidence_ref_element     = next(spectrum_id_item_element.iter(peptide_evidence_ref_element_tag))
         return peptide_evidence_ref_element.get(self.PEPTIDE_EVIDENCE_REF_TAG)
 
     """ The following function parses any cvParam elements in the mzIdentML.
         These are typically nested within a parent element
     """
-    def getCvParamInfo(self, parent_element):
+    def getCvParamInfo(self, parent_element, recursive=True):
         cv_param_table       = {}
         cv_param_element_tag = self.getElementTag(self.CV_PARAM_ELEMENT)
-        for cv_param_element in parent_element.iter(cv_param_element_tag):
+        cv_param_elements    = (parent_element.iter(cv_param_element_tag) if recursive 
+                                else parent_element.iterchildren(cv_param_element_tag))
+        for cv_param_element in cv_param_elements:
             accession = self.getCvParamAccession(cv_param_element)
             value     = cv_param_element.get(self.VALUE_TAG)
             name      = cv_param_element.get(self.NAME_TAG)            
@@ -473,25 +541,143 @@ class MzIdentMlReader():
 """
 class RawReader():
     
-    def __init__(self, raw_file, raw_dirs):
+    def __init__(self, raw_file, raw_dirs, shared_scan_table=None, scan_window=None, cache_budgets=None):
         #check raw file name format for consistency
         assert(".raw" in raw_file)
         raw_path = self.getRawPath(raw_file, raw_dirs)
-        xr       = MSFileReader(raw_path)
+
+        #RAW files may be opened in another thread (See RawPrefetcher), so they keep their own timings
+        self.stage_timings = model.StageTimings()
+        start_time         = model.startTimer()
+        xr                 = openRawFile(raw_path)
+        model.stopTimer(model.STAGE_RAW_OPEN, start_time, stage_timings=self.stage_timings)
 
         self.raw_file = raw_file
-        self.xr_info  = model.XrInfo(xr)
+        self.raw_path = raw_path
+        start_time    = model.startTimer()
+        self.xr_info  = model.XrInfo(xr, shared_scan_table, scan_window, cache_budgets)
+        model.stopTimer(model.STAGE_RAW_INDEX, start_time, len(self.xr_info.scan_table), 
+                        stage_timings=self.stage_timings)
 
     def getRawPath(self, raw_file, raw_dirs):
-        '''There is a slight problem with this (when there's multiple RAW directories with the same RAW file names). 
-           For now, this is OK. But I suspect we need to restructure the interface to accommodate for this. 
-           * Possibly only allow 1 directory to be searched
-        '''
-        f = lambda x: raw_file in raw_dirs[x]
-        raw_dir  = list(filter(f, raw_dirs.keys()))[0]  #get the first RAW file directory we encounter
-        raw_path = raw_dir + "\\" + raw_file            #construct absolute path to raw file
-        return raw_path
+        return getRawPath(raw_file, raw_dirs)
+
+    """ Open a new handle to the RAW file, keeping everything we have already extracted.
+        MSFileReader (COM) handles can only be used by the thread that created them.
+    """
+    def reopenRawReader(self):
+        xr = openRawFile(self.raw_path)
+        self.xr_info.setXr(xr)
 
     def closeRawReader(self):
         gc.collect()                #garbage collect unnecessary memory usage
         self.xr_info.xr.close()
+
+#########################################################################################################
+
+""" Opens (and indexes) RAW files in a background thread, ahead of the RAW file currently being processed.
+
+    Opening a RAW file is mostly waiting on I/O (especially on network drives), 
+    so this can be done while the main thread is busy searching for SILAC pairs.
+    At most prefetch_depth RAW files are opened ahead of time, 
+    so we don't hold too many of them in memory at once.
+"""
+class RawPrefetcher():
+
+    def __init__(self, raw_requests, prefetch_depth):
+        self.raw_requests    = raw_requests                             # List of (Raw file name, Raw dir map)
+        self.raw_queue       = queue.Queue()                            # Queue of (RawReader, exception)
+        self.raw_slots       = threading.Semaphore(prefetch_depth)
+        self.stop_event      = threading.Event()
+        self.prefetch_thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.prefetch_thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.raw_slots.release()    #in case the thread is waiting for a slot
+
+    def run(self):
+        initRawThread()
+        try:
+            for raw_file, raw_dirs in self.raw_requests:
+                self.raw_slots.acquire()
+                if self.stop_event.is_set():
+                    break
+
+                try:
+                    raw_reader = RawReader(raw_file, raw_dirs)
+                    raw_reader.closeRawReader()
+                    self.raw_queue.put((raw_reader, None))
+
+                except Exception as e:
+                    self.raw_queue.put((None, e))
+
+        finally:
+            closeRawThread()
+
+    """ Returns the next RawReader, in the same order as the requests. 
+        If the RAW file couldn't be opened, the exception is raised here instead.
+    """
+    def getNextRawReader(self):
+        (raw_reader, exception) = self.raw_queue.get()
+        self.raw_slots.release()
+        if exception is not None:
+            raise exception
+
+        raw_reader.reopenRawReader()
+        return raw_reader
+
+#########################################################################################################
+
+""" Returns the absolute path to a RAW file
+    
+    There is a slight problem with this (when there's multiple RAW directories with the same RAW file names). 
+    For now, this is OK. But I suspect we need to restructure the interface to accommodate for this. 
+    * Possibly only allow 1 directory to be searched
+
+    Keyword arguments:
+    raw_file -- RAW file name
+    raw_dirs -- Table containing Raw dir paths -> {Raw file names}
+"""
+def getRawPath(raw_file, raw_dirs):
+    f = lambda x: raw_file in raw_dirs[x]
+    raw_dir  = list(filter(f, raw_dirs.keys()))[0]  #get the first RAW file directory we encounter
+    raw_path = os.path.join(raw_dir, raw_file)      #construct absolute path to raw file
+    return raw_path
+
+""" MSFileReader uses COM, which needs to be initialised for each thread that opens RAW files.
+    Every call to initRawThread should be matched by a call to closeRawThread.
+"""
+def initRawThread():
+    try:
+        import comtypes
+    except ImportError:     #no COM, so only synthetic RAW files can be opened (See openRawFile)
+        return
+    comtypes.CoInitialize()
+
+def closeRawThread():
+    try:
+        import comtypes
+    except ImportError:
+        return
+    comtypes.CoUninitialize()
+
+""" Returns a handle to a RAW file: a SyntheticRawFile for synthetic RAW files (See benchmarks/dataset.py),
+    and an MSFileReader otherwise
+"""
+def openRawFile(raw_path):
+    if isSyntheticRaw(raw_path):
+        return SyntheticRawFile(raw_path)
+    return loadMSFileReader()(raw_path)
+
+""" Returns the MSFileReader class. 
+    pymsfilereader (and the COM type library it generates) takes a while to import, 
+    so this is only done the first time a RAW file is opened
+"""
+def loadMSFileReader():
+    from pymsfilereader import MSFileReader
+    return MSFileReader
+
+#########################################################################################################
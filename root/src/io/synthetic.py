@@ -0,0 +1,141 @@
+#--------------------------------------------------------------------------------------------------------------------
+
+#This module contains IO-related classes and functions for synthetic RAW files (See benchmarks/dataset.py)
+
+#------------------ Dependencies ----------------------------#
+
+## External dependencies
+import numpy
+import zipfile
+
+## Internal dependencies
+
+#------------------- Global Variables -----------------------#
+
+SYNTHETIC_RAW_MAGIC   = b"PK\x03\x04"   # Synthetic RAW files are .npz (zip) archives. Thermo RAW files start with 01 A1
+SYNTHETIC_RAW_ARRAYS  = ("scan_rts", "scan_types", "precursor_masses",
+                         "peak_offsets", "peak_masses", "peak_intensities")
+AVERAGE_MASS_TOLERANCE = 5.0            # Peaks within this many ppm are merged when spectra are averaged
+PPM                    = 1000000.0
+
+#------------------ Classes & Functions ---------------------#
+
+""" Synthetic RAW file, with the parts of the MSFileReader interface that XrInfo uses.
+
+    Thermo RAW files can only be written by Thermo instruments, and MSFileReader only runs on Windows,
+    so benchmark datasets keep their spectra in a numpy archive instead (See writeSyntheticRaw).
+    RawReader opens these with SyntheticRawFile (See isSyntheticRaw), so a synthetic run
+    goes through exactly the same search as a real one.
+
+    Scan numbers start at 1. The peaks of scan n are
+    peak_masses[peak_offsets[n - 1]:peak_offsets[n]] (sorted by m/z)
+"""
+class SyntheticRawFile():
+
+    def __init__(self, raw_path):
+        self.raw_path = raw_path
+        with numpy.load(raw_path) as arrays:
+            for array_name in SYNTHETIC_RAW_ARRAYS:
+                setattr(self, array_name, arrays[array_name])
+        self.MS1_scan_nums = numpy.flatnonzero(self.scan_types == 1) + 1
+
+    def SetCurrentController(self, controller_type, controller_num):
+        pass
+
+    def GetNumSpectra(self):
+        return len(self.scan_rts)
+
+    def GetStartTime(self):
+        return float(self.scan_rts[0])
+
+    def GetEndTime(self):
+        return float(self.scan_rts[-1])
+
+    def RTFromScanNum(self, scan_num):
+        return float(self.scan_rts[scan_num - 1])
+
+    """ Returns the scan number closest to a retention time
+    """
+    def ScanNumFromRT(self, retention_time):
+        scan_idx = int(numpy.searchsorted(self.scan_rts, retention_time))
+        if scan_idx == len(self.scan_rts) or (scan_idx > 0 and
+            retention_time - self.scan_rts[scan_idx - 1] <= self.scan_rts[scan_idx] - retention_time):
+            scan_idx -= 1
+        return scan_idx + 1
+
+    def GetMSOrderForScanNum(self, scan_num):
+        return int(self.scan_types[scan_num - 1])
+
+    def GetPrecursorMassForScanNum(self, scan_num, ms_order):
+        return float(self.precursor_masses[scan_num - 1])
+
+    """ Returns ((masses, intensities), None), like MSFileReader (which also returns the peak flags)
+    """
+    def GetMassListFromScanNum(self, scan_num):
+        (start_idx, stop_idx) = self.peak_offsets[scan_num - 1:scan_num + 1]
+        return ((self.peak_masses[start_idx:stop_idx], self.peak_intensities[start_idx:stop_idx]), None)
+
+    """ Returns the average of the MS1 spectra from the first to the last scan number, as ((masses, intensities), None).
+        Peaks of different scans within AVERAGE_MASS_TOLERANCE are merged into one (at their intensity-weighted m/z)
+    """
+    def GetAverageMassList(self, first_scan_num, last_scan_num, scanFilter='ms'):
+        scan_nums = self.MS1_scan_nums[(self.MS1_scan_nums >= first_scan_num) &
+                                       (self.MS1_scan_nums <= last_scan_num)]
+        if len(scan_nums) == 0:
+            return ((numpy.array([]), numpy.array([])), None)
+
+        peak_indices = numpy.concatenate([numpy.arange(self.peak_offsets[s - 1], self.peak_offsets[s])
+                                          for s in scan_nums])
+        masses       = self.peak_masses[peak_indices]
+        intensities  = self.peak_intensities[peak_indices].astype(numpy.float64)
+        sort_order   = numpy.argsort(masses, kind="mergesort")
+        masses       = masses[sort_order]
+        intensities  = intensities[sort_order]
+
+        #a new peak starts wherever the gap to the previous m/z is over the tolerance
+        is_new_peak   = numpy.diff(masses) > masses[1:] * (AVERAGE_MASS_TOLERANCE / PPM)
+        peak_ids      = numpy.concatenate([[0], numpy.cumsum(is_new_peak)])
+        sum_intensity = numpy.bincount(peak_ids, weights=intensities)
+        sum_mass      = numpy.bincount(peak_ids, weights=masses * intensities)
+        average_masses = numpy.where(sum_intensity > 0, sum_mass / numpy.maximum(sum_intensity, 1e-300),
+                                     numpy.bincount(peak_ids, weights=masses) / numpy.bincount(peak_ids))
+        return ((average_masses, sum_intensity / len(scan_nums)), None)
+
+    def close(self):
+        pass
+
+#########################################################################################################
+
+""" Returns True if a RAW file is a synthetic RAW file (See SyntheticRawFile)
+"""
+def isSyntheticRaw(raw_path):
+    try:
+        with open(raw_path, "rb") as raw_file:
+            return raw_file.read(len(SYNTHETIC_RAW_MAGIC)) == SYNTHETIC_RAW_MAGIC
+
+    except (IOError, OSError):
+        return False
+
+""" Writes a synthetic RAW file (See SyntheticRawFile).
+    This is the same archive as numpy.savez writes, but without time stamps, 
+    so the same arrays always give the same file
+
+    Keyword arguments:
+    raw_path         -- Path of the RAW file
+    scan_rts         -- numpy.array of the retention time (minutes) of each scan
+    scan_types       -- numpy.array of the MS order of each scan (1 for MS1, 2 for MS/MS)
+    precursor_masses -- numpy.array of the precursor m/z of each scan (0 for MS1 scans)
+    peak_offsets     -- numpy.array of the position of the first peak of each scan (and the number of peaks at the end)
+    peak_masses      -- numpy.array of the m/z of all peaks, sorted by scan then m/z
+    peak_intensities -- numpy.array of the intensity of all peaks
+"""
+def writeSyntheticRaw(raw_path, scan_rts, scan_types, precursor_masses,
+                      peak_offsets, peak_masses, peak_intensities):
+    arrays = (scan_rts, scan_types, precursor_masses, peak_offsets, peak_masses, peak_intensities)
+    with zipfile.ZipFile(raw_path, "w", zipfile.ZIP_STORED, allowZip64=True) as raw_file:
+        for array_name, array in zip(SYNTHETIC_RAW_ARRAYS, arrays):
+            zip_info = zipfile.ZipInfo(array_name + ".npy", date_time=(1980, 1, 1, 0, 0, 0))
+            with raw_file.open(zip_info, "w", force_zip64=True) as array_file:
+                numpy.lib.format.write_array(array_file, numpy.asanyarray(array), allow_pickle=False)
+
+#########################################################################################################
@@ -6,25 +6,35 @@
 
 ## External dependencies
 import os
+import json
 
 ## Internal dependencies
 
 #------------------- Global Variables -----------------------#
 
+CHECKPOINT_SUFFIX  = ".checkpoint.json"
+CHECKPOINT_VERSION = 1
+
 #------------------ Classes & Functions ---------------------#
 
 """ Sequenced peptides file (.CSV) writer  
 """
 class CsvWriter():
     
-    def __init__(self, seq_peptides_path):
+    """ Keyword arguments:
+        seq_peptides_path -- File path of the sequenced peptides file
+        output_size       -- Number of bytes of the output file to keep. 
+                             This is 0 unless we are resuming a previous run (See CheckpointWriter)
+        output_path       -- File path of the output file (See getOutputPath if None)
+    """
+    def __init__(self, seq_peptides_path, output_size=0, output_path=None):
         #generate the file name for the output file
-        input_dir        = os.path.dirname(seq_peptides_path)
-        input_name       = os.path.basename(seq_peptides_path).split('.')[0]     #get basename without the file extension
-        output_name      = input_name + "_MethylQuant.csv"
-        self.output_path = os.path.join(input_dir, output_name)
+        if output_path is None:
+            output_path  = getOutputPath(seq_peptides_path)
+        self.output_path = output_path
 
-        output_filehandle = open(self.output_path, "w")
+        output_filehandle = open(self.output_path, "ab")
+        output_filehandle.truncate(output_size)
         output_filehandle.close()
 
     def writeFile(self, matched_seq_peptides):
@@ -37,3 +47,80 @@ class CsvWriter():
             matched_seq_peptides.to_csv(self.output_path, mode='a', index=False, header=False)
 
 #########################################################################################################
+
+""" Checkpoint manifest (.JSON) that is written beside an output file. 
+    
+    It records the RAW files whose results have been completely written, 
+    the size of the output file at that point, and a hash of everything that the results 
+    depend on (parameters, input files, etc.). If a run is interrupted, it can be resumed 
+    by truncating the output file to that size and only processing the remaining RAW files. 
+"""
+class CheckpointWriter():
+
+    def __init__(self, output_path, input_hash):
+        self.output_path         = output_path
+        self.checkpoint_path     = output_path + CHECKPOINT_SUFFIX
+        self.input_hash          = input_hash
+        self.completed_raw_files = []
+        self.output_size         = 0
+
+    """ Reads the checkpoint of a previous run. Returns False (and keeps nothing) 
+        if there isn't one, or if it can't be used for the current inputs
+    """
+    def load(self):
+        try:
+            with open(self.checkpoint_path) as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+
+            if (checkpoint["version"] != CHECKPOINT_VERSION or 
+                checkpoint["input_hash"] != self.input_hash or
+                os.path.getsize(self.output_path) < checkpoint["output_size"]):
+                return False
+
+            self.completed_raw_files = list(checkpoint["completed_raw_files"])
+            self.output_size         = int(checkpoint["output_size"])
+            return True
+
+        except (IOError, ValueError, KeyError, TypeError):
+            return False
+
+    def addRawFile(self, raw_file):
+        self.completed_raw_files.append(raw_file)
+        self.output_size = os.path.getsize(self.output_path)
+        self.save()
+
+    def save(self):
+        checkpoint = {"version":             CHECKPOINT_VERSION,
+                      "input_hash":          self.input_hash,
+                      "output_size":         self.output_size,
+                      "completed_raw_files": self.completed_raw_files}
+
+        #write to a temporary file first, so that a crash never leaves a half-written checkpoint
+        temp_path = self.checkpoint_path + ".tmp"
+        with open(temp_path, "w") as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file, indent=2)
+        os.replace(temp_path, self.checkpoint_path)
+
+#########################################################################################################
+
+""" Returns the path of the output file for a given sequenced peptides file
+    
+    The output file is written next to the input file, with "_MethylQuant" appended to its name
+
+    Keyword arguments:
+    seq_peptides_path -- File path of the sequenced peptides file
+"""
+def getOutputPath(seq_peptides_path):
+    input_dir   = os.path.dirname(seq_peptides_path)
+    input_name  = os.path.basename(seq_peptides_path).split('.')[0]     #get basename without the file extension
+    output_name = input_name + "_MethylQuant.csv"
+    return os.path.join(input_dir, output_name)
+
+""" Returns the path of the output file of a parameter sweep for a given sequenced peptides file
+    (See task.SweepTask). This is written next to the normal output file, with "_sweep" appended to its name
+"""
+def getSweepOutputPath(seq_peptides_path):
+    (output_root, output_ext) = os.path.splitext(getOutputPath(seq_peptides_path))
+    return output_root + "_sweep" + output_ext
+
+#########################################################################################################
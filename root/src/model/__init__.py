@@ -9,9 +9,38 @@
 
 ## Internal dependencies
 from .core import Experiment
+from .core import Parameters
 from .core import XrInfo
+from .core import SharedScanTable
 from .menu import LabelList
 from .menu import ModificationList
+from .menu import DEFAULT_LABEL_SET
+from .menu import DEFAULT_MOD_SET
+from .timing import StageTimings
+from .timing import CacheStats
+from .timing import TimingReport
+from .timing import enableTiming
+from .timing import isTimingEnabled
+from .timing import setStageTimings
+from .timing import startTimer
+from .timing import stopTimer
+from .timing import STAGE_NAMES
+from .timing import STAGE_RAW_OPEN
+from .timing import STAGE_RAW_INDEX
+from .timing import STAGE_OUTPUT
+from .trace import PsmTrace
+from .trace import TraceWriter
+from .trace import enableTrace
+from .trace import isTraceEnabled
+from .memory import MemoryUsage
+from .memory import getPeakRss
+from .memory import getTablesSize
+from .memory import MEMORY_PENDING_RESULTS
+from .cache import LruCache
+from .cache import DEFAULT_MEMO_CACHE_BUDGETS
+from .cache import getMassKey
+from .cache import getMassesKey
+from .constants import *
 
 #------------------- Global Variables -----------------------#
 
@@ -0,0 +1,103 @@
+#--------------------------------------------------------------------------------------------------------------------
+
+#This module contains model-related classes and functions for bounded in-memory caches
+
+#------------------ Dependencies ----------------------------#
+
+## External dependencies
+import numpy
+from collections import OrderedDict
+
+## Internal dependencies
+from .timing import CacheStats
+from .timing import getApproximateSize
+from .timing import CACHE_PEPTIDE_SCAN_NUM
+from .timing import CACHE_PRECURSOR_MAX_INTENSITY
+from .timing import CACHE_AVERAGE_MAX_INTENSITY
+from .timing import CACHE_AVERAGE_MASS_LIST
+from .timing import CACHE_MASS_ERROR_BOUNDARY
+
+#------------------- Global Variables -----------------------#
+
+MB                         = 1024 * 1024
+DEFAULT_MEMO_CACHE_BUDGETS = {CACHE_PEPTIDE_SCAN_NUM:        16 * MB,     # Memory budget (bytes) of each memo table of XrInfo
+                              CACHE_PRECURSOR_MAX_INTENSITY: 64 * MB,
+                              CACHE_AVERAGE_MAX_INTENSITY:   32 * MB,
+                              CACHE_AVERAGE_MASS_LIST:       256 * MB,
+                              CACHE_MASS_ERROR_BOUNDARY:     8 * MB}
+MASS_KEY_SCALE             = 1000000    # m/z values in memo keys are quantized to 0.000001 (0.001 ppm at m/z 1000)
+
+#------------------ Classes & Functions ---------------------#
+
+""" Memo table with a memory budget.
+
+    Once the (approximate) size of the entries goes over max_bytes,
+    the least recently used entries are evicted. The newest entry is never evicted,
+    so a value can always be read back straight after it is put.
+
+    Lookups follow the contains -> (put) -> get pattern of XrInfo,
+    and are counted while timing is enabled (See CacheStats)
+"""
+class LruCache():
+
+    def __init__(self, max_bytes):
+        self.max_bytes     = max_bytes
+        self.entry_table   = OrderedDict()  # Table containing key -> (value, size in bytes), oldest first
+        self.num_bytes     = 0
+        self.peak_bytes    = 0              # Largest num_bytes so far (not reset by clear, See XrInfo.getMemoryUsage)
+        self.num_evictions = 0
+        self.cache_stats   = CacheStats()
+
+    def __len__(self):
+        return len(self.entry_table)
+
+    def contains(self, key):
+        is_hit = key in self.entry_table
+        if is_hit:
+            self.entry_table.move_to_end(key)
+        return self.cache_stats.addLookup(is_hit)
+
+    def get(self, key):
+        return self.entry_table[key][0]
+
+    def put(self, key, value):
+        if key in self.entry_table:
+            self.num_bytes -= self.entry_table.pop(key)[1]
+
+        entry_size            = getApproximateSize(key) + getApproximateSize(value)
+        self.entry_table[key] = (value, entry_size)
+        self.num_bytes       += entry_size
+
+        while self.num_bytes > self.max_bytes and len(self.entry_table) > 1:
+            (evicted_key, (evicted_value, evicted_size)) = self.entry_table.popitem(last=False)
+            self.num_bytes     -= evicted_size
+            self.num_evictions += 1
+        self.peak_bytes = max(self.peak_bytes, self.num_bytes)
+
+    def clear(self):
+        self.entry_table.clear()
+        self.num_bytes = 0
+
+    """ Returns the CacheStats of the cache, and resets its hit, miss and eviction counts
+    """
+    def popCacheStats(self):
+        cache_stats        = CacheStats(self.cache_stats.hits, self.cache_stats.misses,
+                                        len(self.entry_table), self.num_bytes, self.num_evictions)
+        self.cache_stats   = CacheStats()
+        self.num_evictions = 0
+        return cache_stats
+
+#########################################################################################################
+
+""" Returns the memo key of an m/z value: the m/z quantized to an integer (See MASS_KEY_SCALE).
+    m/z values that round to the same integer share their memo entries
+"""
+def getMassKey(mass):
+    return int(round(mass * MASS_KEY_SCALE))
+
+""" Returns the memo key of a numpy.array of m/z values, as a tuple of quantized m/z values (See getMassKey)
+"""
+def getMassesKey(masses):
+    return tuple(numpy.rint(numpy.asarray(masses) * MASS_KEY_SCALE).astype(numpy.int64).tolist())
+
+#########################################################################################################
@@ -0,0 +1,24 @@
+#--------------------------------------------------------------------------------------------------------------------
+
+#This module contains model-related constants that are shared by the UI and the tasks
+
+#------------------ Dependencies ----------------------------#
+
+## External dependencies
+
+## Internal dependencies
+
+#------------------- Global Variables -----------------------#
+
+ID_LIGHT    = 1         # Sequenced peptides are light (See FileInfo.silac_map)
+ID_HEAVY    = -1        # Sequenced peptides are heavy
+ID_SUMMARY  = 1         # Summary output (See FileInfo.output_map)
+ID_FULL     = -1        # Full output
+
+DEFAULT_PARAMETER_TUPLE = (10, 0.14, 1, 1, 5, 0.5)      # See Parameters
+PARAMETER_NAMES         = ("mass_error", "time_window_overlap", "time_window", 
+                           "empty_ms_allowed", "min_isotopomers_allowed", "pearson_threshold")
+
+#------------------ Classes & Functions ---------------------#
+
+#########################################################################################################
@@ -5,13 +5,32 @@
 #------------------ Dependencies ----------------------------#
 
 ## External dependencies
+import os
+import sys
 import numpy
-from comtypes.client import * 
-from comtypes.automation import *
+from ctypes import c_long
 
 ## Internal dependencies
 from .menu import DEFAULT_LABEL_LIST
 from .menu import DEFAULT_MOD_LIST
+from .timing import startTimer
+from .timing import stopTimer
+from .timing import STAGE_AVERAGE_MASS
+from .timing import CACHE_PEPTIDE_SCAN_NUM
+from .timing import CACHE_PRECURSOR_MAX_INTENSITY
+from .timing import CACHE_AVERAGE_MAX_INTENSITY
+from .timing import CACHE_AVERAGE_MASS_LIST
+from .timing import CACHE_MASS_ERROR_BOUNDARY
+from .timing import getApproximateSize
+from .trace import addTraceCount
+from .trace import TRACE_AVERAGING_CALLS
+from .trace import TRACE_AVERAGED_SCANS
+from .memory import MemoryUsage
+from .memory import getPeakRss
+from .memory import MEMORY_SCAN_METADATA
+from .memory import MEMORY_PEAK_ARRAYS
+from .cache import LruCache
+from .cache import DEFAULT_MEMO_CACHE_BUDGETS
 
 #------------------- Global Variables -----------------------#
 
@@ -19,8 +38,9 @@ from .menu import DEFAULT_MOD_LIST
 
 class Experiment():
 
-    PASSED = 0
-    FAILED = 1
+    PASSED  = 0
+    FAILED  = 1
+    PARTIAL = 2     # The experiment was cancelled before all rows were searched
     
     def __init__(self, experiment_info, peptides_file_map, raw_dir_map,
                  label_set, mod_set, output_map, silac_map, parameter_tuple):
@@ -116,6 +136,19 @@ class Parameters():
         self.min_isotopomers_allowed = int(parameter_tuple[4])
         self.pearson_threshold       = float(parameter_tuple[5])
 
+    def getParameterTuple(self):
+        return (self.mass_error, self.time_window_overlap, 
+                self.time_window, self.empty_ms_allowed, 
+                self.min_isotopomers_allowed, self.pearson_threshold)
+
+    """ Returns the parameters that the extraction, windowing and correlation stages depend on. 
+        The Pearson threshold is left out, as it is only used for scoring (See task.CorrelationTask)
+    """
+    def getCorrelationParameterTuple(self):
+        return (self.mass_error, self.time_window_overlap, 
+                self.time_window, self.empty_ms_allowed, 
+                self.min_isotopomers_allowed)
+
     def __str__(self):
         return "\t".join([str(self.mass_error), str(self.time_window_overlap), 
                           str(self.time_window), str(self.empty_ms_allowed), 
@@ -123,21 +156,35 @@ class Parameters():
 
 #########################################################################################################
 
+""" Information extracted from a RAW file, and memo tables of the search in that RAW file.
+
+    The memo tables are bounded (See LruCache) and only live as long as the RAW file (See clearTables).
+    cache_budgets can override the memory budget (bytes) of each of them (See DEFAULT_MEMO_CACHE_BUDGETS)
+"""
 class XrInfo():
 
-    def __init__(self, xr):
+    def __init__(self, xr, shared_scan_table=None, scan_window=None, cache_budgets=None):
         self.xr = xr
 
+        cache_budgets = dict(DEFAULT_MEMO_CACHE_BUDGETS, **(cache_budgets or {}))
         self.scan_table                         = {}   # Table of scan objects for a given scan number
-        self.peptide_scan_num_table             = {}   # Table of maximum, start and stop scan numbers for a given peptide
-        self.precursor_max_mass_intensity_table = {}   # Table containing the maximum mass intensity for a given isotope mass based on precursor mass list
-        self.average_max_mass_intensity_table   = {}   # Table containing the maximum mass intensity for a given isotope mass based on average mass list
-        self.average_mass_list_table            = {}   # Table containing the average mass list over a range of scan numbers
+        self.peptide_scan_num_table             = LruCache(cache_budgets[CACHE_PEPTIDE_SCAN_NUM])          # Table of maximum, start and stop scan numbers for a given peptide
+        self.precursor_max_mass_intensity_table = LruCache(cache_budgets[CACHE_PRECURSOR_MAX_INTENSITY])   # Table containing the maximum mass intensity for a given isotope mass based on precursor mass list
+        self.average_max_mass_intensity_table   = LruCache(cache_budgets[CACHE_AVERAGE_MAX_INTENSITY])     # Table containing the maximum mass intensity for a given isotope mass based on average mass list
+        self.average_mass_list_table            = LruCache(cache_budgets[CACHE_AVERAGE_MASS_LIST])         # Table containing the average mass list over a range of scan numbers
+        self.mass_error_boundary_table          = LruCache(cache_budgets[CACHE_MASS_ERROR_BOUNDARY])       # Table containing the mass error boundaries for a given (mass error, isotope mass)
         self.MS1_scan_list                      = []
         self.init()
-        self.initScanTable()
+        if shared_scan_table is None:
+            self.initScanTable()
+        else:
+            self.initSharedScanTable(shared_scan_table, scan_window)
         self.initScanList()
 
+    def setXr(self, xr):
+        self.xr = xr
+        self.init()
+
     def init(self):
         # Don't really understand what this does...
         # But we need to run this so that we can access the data
@@ -163,6 +210,17 @@ class XrInfo():
             scan_info = ScanInfo(scan_num, rt, precursor_mass, scan_type, precursor_mass_list)
             self.scan_table[scan_num] = scan_info
 
+    """ Loads the scan table from a copy shared by another process, instead of 
+        extracting the information for each scan from the RAW file again.
+        
+        Keyword arguments:
+        shared_scan_table -- SharedScanTable containing the information for ALL scan numbers
+        scan_window       -- (Start scan number, stop scan number, margin in minutes). 
+                             If given, only scans around this range are loaded (See SharedScanTable)
+    """
+    def initSharedScanTable(self, shared_scan_table, scan_window):
+        self.scan_table = shared_scan_table.getScanTable(scan_window)
+
     def initScanList(self):
         #check whether scan is MS2 or higher
         #MS1 scan returns 1, MS2 returns 2
@@ -182,40 +240,88 @@ class XrInfo():
         return list(filter(f, self.MS1_scan_list))
 
     def getPeptideScanNumber(self, key):
-        return self.peptide_scan_num_table[key]
+        return self.peptide_scan_num_table.get(key)
 
     def putPeptideScanNumber(self, key, scan_num_table):
-        self.peptide_scan_num_table[key] = scan_num_table
+        self.peptide_scan_num_table.put(key, scan_num_table)
 
     def containsPeptideScanNumber(self, key):
-        return True if key in self.peptide_scan_num_table else False
+        return self.peptide_scan_num_table.contains(key)
 
     def getPrecursorMaxMassIntensity(self, key):
-        return self.precursor_max_mass_intensity_table[key]
+        return self.precursor_max_mass_intensity_table.get(key)
 
     def putPrecursorMaxMassIntensity(self, key, max_isotope_mass_intensity):
-        self.precursor_max_mass_intensity_table[key] = max_isotope_mass_intensity
+        self.precursor_max_mass_intensity_table.put(key, max_isotope_mass_intensity)
 
     def containsPrecursorMaxMassIntensity(self, key):
-        return True if key in self.precursor_max_mass_intensity_table else False
+        return self.precursor_max_mass_intensity_table.contains(key)
 
     def getAverageMaxMassIntensity(self, key):
-        return self.average_max_mass_intensity_table[key]
+        return self.average_max_mass_intensity_table.get(key)
 
     def putAverageMaxMassIntensity(self, key, max_isotope_mass_intensity):
-        self.average_max_mass_intensity_table[key] = max_isotope_mass_intensity
+        self.average_max_mass_intensity_table.put(key, max_isotope_mass_intensity)
 
     def containsAverageMaxMassIntensity(self, key):
-        return True if key in self.average_max_mass_intensity_table else False
+        return self.average_max_mass_intensity_table.contains(key)
 
     def getAverageMassList(self, key):
-        return self.average_mass_list_table[key]
+        return self.average_mass_list_table.get(key)
 
     def putAverageMassList(self, key, average_mass_list):
-        self.average_mass_list_table[key] = average_mass_list
+        self.average_mass_list_table.put(key, average_mass_list)
 
     def containsAverageMassList(self, key):
-        return True if key in self.average_mass_list_table else False
+        return self.average_mass_list_table.contains(key)
+
+    """ Returns a table of cache name -> memo table (LruCache)
+    """
+    def getCacheTables(self):
+        return {CACHE_PEPTIDE_SCAN_NUM:        self.peptide_scan_num_table,
+                CACHE_PRECURSOR_MAX_INTENSITY: self.precursor_max_mass_intensity_table,
+                CACHE_AVERAGE_MAX_INTENSITY:   self.average_max_mass_intensity_table,
+                CACHE_AVERAGE_MASS_LIST:       self.average_mass_list_table,
+                CACHE_MASS_ERROR_BOUNDARY:     self.mass_error_boundary_table}
+
+    """ Returns a table of cache name -> CacheStats of the memo tables, 
+        and resets their hit, miss and eviction counts (See LruCache.popCacheStats)
+    """
+    def popCacheStats(self):
+        return {name: cache.popCacheStats() for (name, cache) in self.getCacheTables().items()}
+
+    """ Clears the tables that depend on the search parameters.
+        
+        The scan table, the average mass lists and the mass error boundaries (which are keyed by mass error) 
+        don't depend on the other parameters, so they can be shared between experiments with different parameters.
+    """
+    def clearPeptideTables(self):
+        self.peptide_scan_num_table.clear()
+        self.precursor_max_mass_intensity_table.clear()
+        self.average_max_mass_intensity_table.clear()
+
+    """ Returns the MemoryUsage of the scan table and the memo tables (at their peak), 
+        and the peak RSS of the process so far
+    """
+    def getMemoryUsage(self):
+        scan_metadata_size = sys.getsizeof(self.scan_table) + getApproximateSize(self.MS1_scan_list)
+        peak_arrays_size   = 0
+        for scan_num, scan_info in self.scan_table.items():
+            scan_metadata_size += sys.getsizeof(scan_num) + scan_info.getMetadataSize()
+            peak_arrays_size   += getApproximateSize(scan_info.getPrecursorMassList())
+
+        memory_usage = MemoryUsage(getPeakRss())
+        memory_usage.add(MEMORY_SCAN_METADATA, scan_metadata_size)
+        memory_usage.add(MEMORY_PEAK_ARRAYS, peak_arrays_size)
+        for cache_name, cache in self.getCacheTables().items():
+            memory_usage.addCache(cache_name, cache.peak_bytes)
+        return memory_usage
+
+    """ Clears all memo tables once we are done with the RAW file
+    """
+    def clearTables(self):
+        for cache in self.getCacheTables().values():
+            cache.clear()
 
     def getNumSpectra(self):
         return self.num_spectra
@@ -267,10 +373,14 @@ class XrInfo():
     """
     def getAverageMassListFromPeptidePair(self, peptide_start_scan_num, peptide_end_scan_num):
         #Get average_mass_list
+        start_time              = startTimer()
         (average_mass_list, pl) = self.xr.GetAverageMassList(peptide_start_scan_num,
             peptide_end_scan_num, scanFilter='ms')
 
         average_masses_intensities = self.__formatMassList(average_mass_list)
+        stopTimer(STAGE_AVERAGE_MASS, start_time, peptide_end_scan_num - peptide_start_scan_num + 1)
+        addTraceCount(TRACE_AVERAGING_CALLS)
+        addTraceCount(TRACE_AVERAGED_SCANS, peptide_end_scan_num - peptide_start_scan_num + 1)
         return average_masses_intensities
 
     """ The following functions get parameters for a specified scan number
@@ -313,6 +423,90 @@ class XrInfo():
 
 #########################################################################################################
 
+""" Read-only copy of a scan table that can be shared between processes.
+
+    The scan table is stored as a set of numpy arrays in a directory. 
+    The arrays are memory-mapped when loaded, so every process that loads
+    them shares the same (read-only) copy of the mass lists.
+"""
+class SharedScanTable():
+
+    ARRAY_NAMES = ("scan_nums", "rts", "precursor_masses", "scan_types", "peak_offsets", "peaks")
+
+    def __init__(self, table_dir):
+        self.table_dir = table_dir
+
+    def getArrayPath(self, array_name):
+        return os.path.join(self.table_dir, array_name + ".npy")
+
+    def save(self, scan_table):
+        scan_info_list = [scan_table[scan_num] for scan_num in sorted(scan_table)]
+        mass_list_lens = [len(s.getPrecursorMassList()) for s in scan_info_list]
+        mass_lists     = [s.getPrecursorMassList() for s in scan_info_list if len(s.getPrecursorMassList()) != 0]
+
+        arrays = {}
+        arrays["scan_nums"]        = numpy.array([s.scan_num for s in scan_info_list], dtype=numpy.int64)
+        arrays["rts"]              = numpy.array([s.getRT() for s in scan_info_list], dtype=numpy.float64)
+        arrays["precursor_masses"] = numpy.array([s.getPrecursorMass() for s in scan_info_list], dtype=numpy.float64)
+        arrays["scan_types"]       = numpy.array([s.scan_type for s in scan_info_list], dtype=numpy.int64)
+        arrays["peak_offsets"]     = numpy.cumsum([0] + mass_list_lens, dtype=numpy.int64)
+        arrays["peaks"]            = numpy.vstack(mass_lists).astype(numpy.float64) \
+                                     if len(mass_lists) != 0 else numpy.empty((0, 2))
+        for array_name in self.ARRAY_NAMES:
+            numpy.save(self.getArrayPath(array_name), arrays[array_name])
+
+    def load(self):
+        arrays = {}
+        for array_name in self.ARRAY_NAMES:
+            arrays[array_name] = numpy.load(self.getArrayPath(array_name), mmap_mode='r')
+        return arrays
+
+    """ Returns a table of ScanInfo objects for a given scan number -> ScanInfo
+        
+        Keyword arguments:
+        scan_window -- (Start scan number, stop scan number, margin in minutes).
+                       Only scans with RTs within the margin of the start/stop scans are included, 
+                       together with the first MS1 scan on either side (so that searches 
+                       which stop at the edge of a time window end at the same scan). 
+                       If None, all scans are included.
+    """
+    def getScanTable(self, scan_window=None):
+        arrays    = self.load()
+        scan_nums = arrays["scan_nums"]
+        (start_idx, stop_idx) = (0, len(scan_nums))
+        if scan_window is not None:
+            (scan_start, scan_stop, margin) = scan_window
+            rts       = arrays["rts"]
+            rt_start  = rts[numpy.searchsorted(scan_nums, scan_start)] - margin
+            rt_stop   = rts[numpy.searchsorted(scan_nums, scan_stop)] + margin
+            start_idx = numpy.searchsorted(rts, rt_start, side='left')
+            stop_idx  = numpy.searchsorted(rts, rt_stop, side='right')
+
+            MS1_indices    = numpy.flatnonzero(arrays["scan_types"] < 2)
+            before_indices = MS1_indices[MS1_indices < start_idx]
+            after_indices  = MS1_indices[MS1_indices >= stop_idx]
+            start_idx      = before_indices[-1] if len(before_indices) != 0 else start_idx
+            stop_idx       = after_indices[0] + 1 if len(after_indices) != 0 else stop_idx
+
+        scan_table = {}
+        for idx in range(start_idx, stop_idx):
+            scan_num = int(scan_nums[idx])
+            scan_table[scan_num] = self.getScanInfo(arrays, idx)
+        return scan_table
+
+    def getScanInfo(self, arrays, idx):
+        (peak_start_idx, peak_stop_idx) = arrays["peak_offsets"][idx:idx + 2]
+        if peak_start_idx != peak_stop_idx:
+            precursor_mass_list = arrays["peaks"][peak_start_idx:peak_stop_idx]
+        else:
+            precursor_mass_list = numpy.array([])
+
+        return ScanInfo(int(arrays["scan_nums"][idx]), float(arrays["rts"][idx]), 
+                        float(arrays["precursor_masses"][idx]), int(arrays["scan_types"][idx]), 
+                        precursor_mass_list)
+
+#########################################################################################################
+
 class ScanInfo():
     
     def __init__(self, scan_num, retention_time, precursor_mass, scan_type, precursor_mass_list):
@@ -340,5 +534,11 @@ class ScanInfo():
     def getPrecursorMassList(self):
         return self.precursor_mass_list
 
+    """ Returns the approximate size (in bytes) of the scan information, without the precursor mass list
+    """
+    def getMetadataSize(self):
+        return sys.getsizeof(self) + sum(map(sys.getsizeof, (self.scan_num, self.RT, self.precursor_mass, 
+                                                             self.scan_type)))
+
 #########################################################################################################
 
@@ -0,0 +1,140 @@
+#--------------------------------------------------------------------------------------------------------------------
+
+#This module contains model-related classes and functions for accounting the memory used by a search
+
+#------------------ Dependencies ----------------------------#
+
+## External dependencies
+import sys
+import ctypes
+
+## Internal dependencies
+
+#------------------- Global Variables -----------------------#
+
+MEMORY_SCAN_METADATA   = "Scan metadata"    # ScanInfo objects of the scan table (without their mass lists)
+MEMORY_PEAK_ARRAYS     = "Peak arrays"      # Precursor mass lists of the scan table
+MEMORY_PENDING_RESULTS = "Pending results"  # Matched tables of the RAW file waiting to be written
+MB                     = 1024 * 1024
+
+#------------------ Classes & Functions ---------------------#
+
+""" Approximate bytes held by each part of the search of a RAW file (See XrInfo.getMemoryUsage):
+    the scan table, each memo table and the pending results, 
+    and the peak RSS of the process that searched it (None if it can't be measured, See getPeakRss).
+
+    Sizes are peaks (e.g., of each memo table over the RAW file), so merging keeps the largest size.
+    A sharded RAW file is searched by several processes, so its sizes are those of the largest shard.
+    Peak arrays of sharded RAW files are memory-mapped, so they are shared by the processes
+"""
+class MemoryUsage():
+
+    def __init__(self, peak_rss=None):
+        self.bytes_table      = {}          # Table containing memory name (See MEMORY_SCAN_METADATA, ...) -> bytes
+        self.cache_table      = {}          # Table containing cache name -> bytes of the memo table
+        self.peak_rss         = peak_rss    # Peak RSS (bytes) of the process that searched the RAW file
+        self.session_peak_rss = None        # Peak RSS (bytes) of the session, if it ran in another process
+
+    def add(self, memory_name, num_bytes):
+        self.bytes_table[memory_name] = max(self.bytes_table.get(memory_name, 0), int(num_bytes))
+
+    def addCache(self, cache_name, num_bytes):
+        self.cache_table[cache_name] = max(self.cache_table.get(cache_name, 0), int(num_bytes))
+
+    def merge(self, memory_usage):
+        for memory_name, num_bytes in memory_usage.bytes_table.items():
+            self.add(memory_name, num_bytes)
+        for cache_name, num_bytes in memory_usage.cache_table.items():
+            self.addCache(cache_name, num_bytes)
+        self.peak_rss         = getMaxBytes(self.peak_rss, memory_usage.peak_rss)
+        self.session_peak_rss = getMaxBytes(self.session_peak_rss, memory_usage.session_peak_rss)
+
+    def isEmpty(self):
+        return len(self.bytes_table) == 0 and len(self.cache_table) == 0 and self.peak_rss is None
+
+    def getBytes(self, memory_name):
+        return self.bytes_table.get(memory_name, 0)
+
+    def getCacheBytes(self):
+        return sum(self.cache_table.values())
+
+    """ Returns a short description, e.g., for the status bar:
+        the peak RSS, then the scan table, peak arrays, memo tables (together) and pending results
+    """
+    def formatSummary(self):
+        return "%s | scans %.1f MB, peaks %.1f MB, caches %.1f MB, results %.1f MB" % (
+               self.formatPeakRss(), self.getBytes(MEMORY_SCAN_METADATA) / MB, self.getBytes(MEMORY_PEAK_ARRAYS) / MB,
+               self.getCacheBytes() / MB, self.getBytes(MEMORY_PENDING_RESULTS) / MB)
+
+    """ Returns the peak RSS and the size of each part on one line
+    """
+    def formatDetails(self):
+        memory_sizes = [(n, self.getBytes(n)) for n in (MEMORY_SCAN_METADATA, MEMORY_PEAK_ARRAYS)]
+        memory_sizes.extend(self.cache_table.items())
+        memory_sizes.append((MEMORY_PENDING_RESULTS, self.getBytes(MEMORY_PENDING_RESULTS)))
+        return "; ".join([self.formatPeakRss()] + ["%s %.1f MB" % (n, s / MB) for (n, s) in memory_sizes])
+
+    def formatPeakRss(self):
+        peak_rss_text = "peak RSS %s" % ("%.1f MB" % (self.peak_rss / MB) if self.peak_rss is not None else "n/a")
+        if self.session_peak_rss is not None:
+            peak_rss_text += " (session %.1f MB)" % (self.session_peak_rss / MB)
+        return peak_rss_text
+
+#########################################################################################################
+
+def getMaxBytes(num_bytes, other_num_bytes):
+    if num_bytes is None or other_num_bytes is None:
+        return other_num_bytes if num_bytes is None else num_bytes
+    return max(num_bytes, other_num_bytes)
+
+""" Returns the bytes held by a list of pandas tables (including the text in them)
+"""
+def getTablesSize(tables):
+    return sum([int(t.memory_usage(index=True, deep=True).sum()) for t in tables])
+
+""" Returns the peak resident set size (bytes) of the current process so far, or None if it can't be measured.
+    This is the peak working set on Windows
+"""
+def getPeakRss():
+    if sys.platform == "win32":
+        return getPeakWorkingSet()
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    #ru_maxrss is in KB, except on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+""" Returned by GetProcessMemoryInfo (Windows)
+"""
+class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+    _fields_ = [("cb",                         ctypes.c_ulong),
+                ("PageFaultCount",             ctypes.c_ulong),
+                ("PeakWorkingSetSize",         ctypes.c_size_t),
+                ("WorkingSetSize",             ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage",    ctypes.c_size_t),
+                ("QuotaPagedPoolUsage",        ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage",     ctypes.c_size_t),
+                ("PagefileUsage",              ctypes.c_size_t),
+                ("PeakPagefileUsage",          ctypes.c_size_t)]
+
+def getPeakWorkingSet():
+    try:
+        get_current_process = ctypes.windll.kernel32.GetCurrentProcess
+        get_memory_info     = ctypes.windll.psapi.GetProcessMemoryInfo
+    except (AttributeError, OSError):
+        return None
+
+    get_current_process.restype  = ctypes.c_void_p
+    get_memory_info.argtypes     = [ctypes.c_void_p, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), ctypes.c_ulong]
+    memory_counters              = PROCESS_MEMORY_COUNTERS()
+    memory_counters.cb           = ctypes.sizeof(memory_counters)
+    if not get_memory_info(get_current_process(), ctypes.byref(memory_counters), memory_counters.cb):
+        return None
+    return memory_counters.PeakWorkingSetSize
+
+#########################################################################################################
@@ -17,6 +17,10 @@ DEFAULT_MOD_LIST   = [('Methyl', 4.022185),
 DEFAULT_LABEL_LIST = [('13CD3', 'M', 4.022185), 
                       ('13C4',  'M', 0.008766)]
 
+## Labels and modifications that are checked by default (in the 'Add experiment' dialog)
+DEFAULT_LABEL_SET  = set([(r, m) for (n, r, m) in DEFAULT_LABEL_LIST if n == '13CD3'])
+DEFAULT_MOD_SET    = set(DEFAULT_MOD_LIST)
+
 #------------------ Classes & Functions ---------------------#
 
 class ModificationList():
@@ -0,0 +1,257 @@
+#--------------------------------------------------------------------------------------------------------------------
+
+#This module contains model-related classes and functions for timing the stages of a search
+
+#------------------ Dependencies ----------------------------#
+
+## External dependencies
+import sys
+import time
+import threading
+import numpy
+
+## Internal dependencies
+from .memory import MemoryUsage
+
+#------------------- Global Variables -----------------------#
+
+STAGE_RAW_OPEN     = "RAW open"
+STAGE_RAW_INDEX    = "RAW index"
+STAGE_SEARCH       = "PSM search"               # Everything below, for each row
+STAGE_OVERLAP      = "Overlap search"
+STAGE_BOUNDARY     = "Elution boundaries"
+STAGE_AVERAGE_MASS = "Average mass lists"
+STAGE_PROFILE      = "Intensity profiles"
+STAGE_PEARSON      = "Pearson correlation"
+STAGE_SCORING      = "Scoring"
+STAGE_OUTPUT       = "Output writing"
+STAGE_NAMES        = (STAGE_RAW_OPEN, STAGE_RAW_INDEX, STAGE_SEARCH, STAGE_OVERLAP, STAGE_BOUNDARY,
+                      STAGE_AVERAGE_MASS, STAGE_PROFILE, STAGE_PEARSON, STAGE_SCORING, STAGE_OUTPUT)
+
+CACHE_PEPTIDE_SCAN_NUM        = "Peptide scan numbers"       # See XrInfo
+CACHE_PRECURSOR_MAX_INTENSITY = "Precursor max intensities"
+CACHE_AVERAGE_MAX_INTENSITY   = "Average max intensities"
+CACHE_AVERAGE_MASS_LIST       = "Average mass lists"
+CACHE_MASS_ERROR_BOUNDARY     = "Mass error boundaries"      # See task.calculateIsotopeMassErrorBoundary
+CACHE_NAMES                   = (CACHE_PEPTIDE_SCAN_NUM, CACHE_PRECURSOR_MAX_INTENSITY, CACHE_AVERAGE_MAX_INTENSITY,
+                                 CACHE_AVERAGE_MASS_LIST, CACHE_MASS_ERROR_BOUNDARY)
+
+TIMING_ENABLED     = False                      # See enableTiming
+TIMING_STATE       = threading.local()          # Current StageTimings (and PsmTrace) of each thread (See setStageTimings)
+
+#------------------ Classes & Functions ---------------------#
+
+""" Counters and timers for each stage of a search:
+    the number of calls, total and maximum time (seconds) and number of items processed.
+    Also holds the records of traced PSMs (See model.trace) until they are written, 
+    and the memory used by the search of a RAW file (See model.memory)
+"""
+class StageTimings():
+
+    def __init__(self):
+        self.stage_table = {}   # Table containing stage name -> [count, total time, max time, num items]
+        self.cache_table = {}   # Table containing cache name -> CacheStats
+        self.psm_traces  = []   # List of PSM trace records (See model.trace.finishPsmTrace)
+        self.memory_usage = MemoryUsage()
+
+    def add(self, stage, elapsed_time, num_items=1):
+        stage_counts = self.stage_table.get(stage)
+        if stage_counts is None:
+            stage_counts = self.stage_table[stage] = [0, 0.0, 0.0, 0]
+
+        stage_counts[0] += 1
+        stage_counts[1] += elapsed_time
+        stage_counts[2]  = max(stage_counts[2], elapsed_time)
+        stage_counts[3] += num_items
+
+    def merge(self, stage_timings):
+        for stage, (count, total_time, max_time, num_items) in stage_timings.stage_table.items():
+            stage_counts = self.stage_table.setdefault(stage, [0, 0.0, 0.0, 0])
+            stage_counts[0] += count
+            stage_counts[1] += total_time
+            stage_counts[2]  = max(stage_counts[2], max_time)
+            stage_counts[3] += num_items
+
+        for cache_name, cache_stats in stage_timings.cache_table.items():
+            self.addCacheStats(cache_name, cache_stats)
+
+        self.psm_traces.extend(stage_timings.psm_traces)
+        self.memory_usage.merge(stage_timings.memory_usage)
+
+    def addCacheStats(self, cache_name, cache_stats):
+        self.cache_table.setdefault(cache_name, CacheStats()).merge(cache_stats)
+
+    def addPsmTrace(self, psm_record):
+        self.psm_traces.append(psm_record)
+
+    """ Returns the PSM trace records, and removes them
+    """
+    def popPsmTraces(self):
+        (psm_traces, self.psm_traces) = (self.psm_traces, [])
+        return psm_traces
+
+    def isEmpty(self):
+        return len(self.stage_table) == 0 and len(self.cache_table) == 0
+
+    """ Returns a list of (stage name, count, total time, max time, num items), in the order of the pipeline
+    """
+    def getRows(self):
+        f = lambda x: (STAGE_NAMES.index(x) if x in STAGE_NAMES else len(STAGE_NAMES), x)
+        return [tuple([stage] + self.stage_table[stage]) for stage in sorted(self.stage_table, key=f)]
+
+    """ Returns the timings as a text table.
+        Stages can be nested (e.g., Pearson correlation is part of the PSM search), so totals don't add up
+    """
+    def formatTable(self, title):
+        lines = [title, "  %-20s %10s %12s %12s %12s" % ("Stage", "Calls", "Total (s)", "Max (ms)", "Items")]
+        for (stage, count, total_time, max_time, num_items) in self.getRows():
+            lines.append("  %-20s %10d %12.3f %12.3f %12d" % (stage, count, total_time, max_time * 1000, num_items))
+
+        if len(self.cache_table) != 0:
+            lines.append("  %-26s %10s %10s %8s %12s %12s %10s" % ("Cache", "Hits", "Misses", "Hit %", 
+                                                                   "Peak entries", "Peak KB", "Evictions"))
+        f = lambda x: (CACHE_NAMES.index(x) if x in CACHE_NAMES else len(CACHE_NAMES), x)
+        for cache_name in sorted(self.cache_table, key=f):
+            cache_stats = self.cache_table[cache_name]
+            lines.append("  %-26s %10d %10d %8.1f %12d %12.1f %10d" % (cache_name, cache_stats.hits, cache_stats.misses, 
+                                                                       cache_stats.getHitRate() * 100, 
+                                                                       cache_stats.num_entries, 
+                                                                       cache_stats.num_bytes / 1024.0, 
+                                                                       cache_stats.num_evictions))
+        return "\n".join(lines)
+
+#########################################################################################################
+
+""" Hits and misses of a memo table (only counted while timing is enabled), 
+    its number of entries, approximate size in bytes (See getApproximateSize) and evictions (See LruCache).
+
+    Sizes are snapshots (e.g., at the end of each peptides job), so merging keeps the peak size
+"""
+class CacheStats():
+
+    def __init__(self, hits=0, misses=0, num_entries=0, num_bytes=0, num_evictions=0):
+        self.hits          = hits
+        self.misses        = misses
+        self.num_entries   = num_entries
+        self.num_bytes     = num_bytes
+        self.num_evictions = num_evictions
+
+    """ Counts a lookup, and returns whether it was a hit
+    """
+    def addLookup(self, is_hit):
+        if TIMING_ENABLED:
+            if is_hit:
+                self.hits   += 1
+            else:
+                self.misses += 1
+        return is_hit
+
+    def merge(self, cache_stats):
+        self.hits          += cache_stats.hits
+        self.misses        += cache_stats.misses
+        self.num_entries    = max(self.num_entries, cache_stats.num_entries)
+        self.num_bytes      = max(self.num_bytes, cache_stats.num_bytes)
+        self.num_evictions += cache_stats.num_evictions
+
+    def getHitRate(self):
+        num_lookups = self.hits + self.misses
+        return self.hits / float(num_lookups) if num_lookups != 0 else 0.0
+
+
+#########################################################################################################
+
+""" Timings of a session, for each RAW file and each experiment
+"""
+class TimingReport():
+
+    def __init__(self):
+        self.raw_timings_table        = {}      # Table containing Raw file name -> StageTimings
+        self.experiment_timings_table = {}      # Table containing experiment name -> StageTimings
+
+    def addRaw(self, raw_file, stage_timings):
+        if not stage_timings.isEmpty():
+            self.raw_timings_table.setdefault(raw_file, StageTimings()).merge(stage_timings)
+
+    def addExperiment(self, experiment_name, stage_timings):
+        if not stage_timings.isEmpty():
+            self.experiment_timings_table.setdefault(experiment_name, StageTimings()).merge(stage_timings)
+
+    def isEmpty(self):
+        return len(self.raw_timings_table) == 0 and len(self.experiment_timings_table) == 0
+
+    def formatReport(self):
+        tables = []
+        for raw_file in sorted(self.raw_timings_table):
+            tables.append(self.raw_timings_table[raw_file].formatTable("RAW file: %s" % raw_file))
+        for experiment_name in sorted(self.experiment_timings_table):
+            tables.append(self.experiment_timings_table[experiment_name].formatTable("Experiment: %s" % experiment_name))
+        return "\n\n".join(tables)
+
+#########################################################################################################
+
+""" Switches the timing of stages on or off (off by default).
+    When off, startTimer and stopTimer return straight away
+"""
+def enableTiming(is_enabled=True):
+    global TIMING_ENABLED
+    TIMING_ENABLED = bool(is_enabled)
+
+def isTimingEnabled():
+    return TIMING_ENABLED
+
+""" Sets the StageTimings that stopTimer adds to in the current thread, and returns the previous one
+"""
+def setStageTimings(stage_timings):
+    previous_timings           = getattr(TIMING_STATE, "stage_timings", None)
+    TIMING_STATE.stage_timings = stage_timings
+    return previous_timings
+
+""" Returns the start time of a stage, or None if timing is off (and no PSM is being traced in the thread)
+"""
+def startTimer():
+    if not TIMING_ENABLED and getattr(TIMING_STATE, "psm_trace", None) is None:
+        return None
+    return time.perf_counter()
+
+""" Adds the time since start_time to a stage (and to the PSM being traced in the thread, if any)
+
+    Keyword arguments:
+    stage         -- Stage name (See STAGE_NAMES)
+    start_time    -- Returned by startTimer. Nothing is added if this is None
+    num_items     -- Number of items (e.g., rows or scans) processed by the stage
+    stage_timings -- StageTimings to add to (the current StageTimings of the thread if None)
+"""
+def stopTimer(stage, start_time, num_items=1, stage_timings=None):
+    if start_time is None:
+        return
+
+    elapsed_time = time.perf_counter() - start_time
+    psm_trace    = getattr(TIMING_STATE, "psm_trace", None)
+    if psm_trace is not None:
+        psm_trace.addPhaseTime(stage, elapsed_time)
+    if not TIMING_ENABLED:
+        return
+
+    if stage_timings is None:
+        stage_timings = getattr(TIMING_STATE, "stage_timings", None)
+        if stage_timings is None:
+            return
+    stage_timings.add(stage, elapsed_time, num_items)
+
+""" Returns the approximate size (in bytes) of a value, including everything that it contains. 
+    Containers are followed, but shared objects are counted each time they are referenced
+"""
+def getApproximateSize(value):
+    if isinstance(value, numpy.ndarray):
+        #arrays that don't own their data don't include it in getsizeof
+        return sys.getsizeof(value) + (value.nbytes if value.base is not None else 0)
+
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum([getApproximateSize(k) + getApproximateSize(v) for (k, v) in value.items()])
+
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(map(getApproximateSize, value))
+
+    return sys.getsizeof(value)
+
+#########################################################################################################
@@ -0,0 +1,164 @@
+#--------------------------------------------------------------------------------------------------------------------
+
+#This module contains model-related classes and functions for tracing the search of each PSM
+
+#------------------ Dependencies ----------------------------#
+
+## External dependencies
+import json
+import time
+import threading
+import queue
+
+## Internal dependencies
+from .timing import TIMING_STATE
+
+#------------------- Global Variables -----------------------#
+
+TRACE_ENABLED         = False
+TRACE_SCANS_VISITED   = "scans_visited"     # Scans looked at by the overlap, boundary and profile searches
+TRACE_PEAK_LOOKUPS    = "peak_lookups"      # Isotope peaks looked up in a scan or averaged spectrum (memoised or not)
+TRACE_PEAK_SEARCHES   = "peak_searches"     # Peak lookups that had to search a mass list (not memoised)
+TRACE_AVERAGING_CALLS = "averaging_calls"   # Spectra averaged by the RAW file (not memoised)
+TRACE_AVERAGED_SCANS  = "averaged_scans"    # Scans over all the averaged spectra
+TRACE_COUNT_NAMES     = (TRACE_SCANS_VISITED, TRACE_PEAK_LOOKUPS, TRACE_PEAK_SEARCHES,
+                         TRACE_AVERAGING_CALLS, TRACE_AVERAGED_SCANS)
+TRACE_QUEUE_SIZE      = 64                  # Batches of records waiting to be written (See TraceWriter)
+
+#------------------ Classes & Functions ---------------------#
+
+""" Trace of the search of one PSM (row of a peptides file): the work it did, the time of each stage
+    (See model.timing) and the boundaries it found.
+
+    The record is a dict that is written as one JSON line (See TraceWriter), e.g.
+    {"raw_file": ..., "scan": ..., "sequence": ..., "elapsed": seconds, "phases": {stage: seconds},
+     "scans_visited": ..., "peak_lookups": ..., ..., "boundaries": {name: scan number(s)}}
+"""
+class PsmTrace():
+
+    def __init__(self, raw_file, scan_num, peptide_seq):
+        self.record = {"raw_file": raw_file, "scan": int(scan_num), "sequence": peptide_seq,
+                       "elapsed": 0.0, "phases": {}}
+        self.record.update([(count_name, 0) for count_name in TRACE_COUNT_NAMES])
+        self.record["boundaries"] = {}
+        self.start_time           = time.perf_counter()
+
+    def addCount(self, count_name, num=1):
+        self.record[count_name] += int(num)
+
+    def addPhaseTime(self, stage, elapsed_time):
+        phases        = self.record["phases"]
+        phases[stage] = phases.get(stage, 0.0) + elapsed_time
+
+    """ Sets a boundary (a scan number), or appends to it if is_list (e.g., the window of each isotope)
+    """
+    def setBoundary(self, boundary_name, value, is_list=False):
+        value = [int(v) for v in value] if isinstance(value, (list, tuple)) else int(value)
+        if is_list:
+            self.record["boundaries"].setdefault(boundary_name, []).append(value)
+        else:
+            self.record["boundaries"][boundary_name] = value
+
+    """ Returns the record, with the time since the trace started
+    """
+    def finish(self):
+        self.record["elapsed"] = time.perf_counter() - self.start_time
+        return self.record
+
+#########################################################################################################
+
+""" Writes trace records (See PsmTrace) to a file as JSON lines, in a background thread,
+    so the search doesn't wait for the file. Records are written in the order they are given
+"""
+class TraceWriter():
+
+    def __init__(self, trace_path):
+        self.trace_path   = trace_path
+        self.trace_file   = open(trace_path, "w")
+        self.record_queue = queue.Queue(TRACE_QUEUE_SIZE)
+        self.num_records  = 0
+        self.error        = None
+        self.thread       = threading.Thread(target=self.__writeRecords, name="TraceWriter", daemon=True)
+        self.thread.start()
+
+    """ Queues a list of records (dicts) to be written
+    """
+    def writeRecords(self, records):
+        if len(records) != 0:
+            self.record_queue.put(records)
+
+    """ Waits for the queued records to be written and closes the file. Raises any error of the writer thread
+    """
+    def close(self):
+        if self.thread is not None:
+            self.record_queue.put(None)
+            self.thread.join()
+            self.thread = None
+            self.trace_file.close()
+
+        if self.error is not None:
+            raise self.error
+
+    def __writeRecords(self):
+        while True:
+            records = self.record_queue.get()
+            if records is None:
+                break
+            if self.error is not None:
+                continue
+
+            try:
+                self.trace_file.write("".join([json.dumps(r) + "\n" for r in records]))
+                self.num_records += len(records)
+            except (IOError, OSError, TypeError, ValueError) as e:
+                self.error = e
+
+#########################################################################################################
+
+""" Switches the tracing of PSMs on or off (off by default).
+    When off, startPsmTrace returns None and the trace counters do nothing
+"""
+def enableTrace(is_enabled=True):
+    global TRACE_ENABLED
+    TRACE_ENABLED = bool(is_enabled)
+
+def isTraceEnabled():
+    return TRACE_ENABLED
+
+""" Starts the trace of a PSM in the current thread, and returns it (or None if tracing is off).
+    Stages timed in the thread (See model.timing.stopTimer) are added to the trace until finishPsmTrace
+"""
+def startPsmTrace(raw_file, scan_num, peptide_seq):
+    if not TRACE_ENABLED:
+        return None
+
+    psm_trace              = PsmTrace(raw_file, scan_num, peptide_seq)
+    TIMING_STATE.psm_trace = psm_trace
+    return psm_trace
+
+""" Finishes the trace of a PSM, and adds its record to the current StageTimings of the thread (See setStageTimings)
+"""
+def finishPsmTrace(psm_trace):
+    if psm_trace is None:
+        return
+
+    TIMING_STATE.psm_trace = None
+    stage_timings          = getattr(TIMING_STATE, "stage_timings", None)
+    if stage_timings is not None:
+        stage_timings.addPsmTrace(psm_trace.finish())
+
+""" Adds to a counter of the current PSM trace of the thread, if any (See TRACE_COUNT_NAMES)
+"""
+def addTraceCount(count_name, num=1):
+    psm_trace = getattr(TIMING_STATE, "psm_trace", None)
+    if psm_trace is not None:
+        psm_trace.addCount(count_name, num)
+
+""" Sets a boundary of the current PSM trace of the thread, if any (See PsmTrace.setBoundary)
+"""
+def setTraceBoundary(boundary_name, value, is_list=False):
+    psm_trace = getattr(TIMING_STATE, "psm_trace", None)
+    if psm_trace is not None:
+        psm_trace.setBoundary(boundary_name, value, is_list)
+
+#########################################################################################################
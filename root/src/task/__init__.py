@@ -10,6 +10,8 @@
 
 # Internal imports
 from .experiment import ExperimentTask
+from .session import SessionTask
+from .sweep import SweepTask
 from .constants import *
 
 #------------------ Global Variables ------------------------#
@@ -6,14 +6,16 @@
 
 ## External dependencies
 import numpy
-from scipy.stats.stats import pearsonr
  
 ## Internal dependencies
+from ..model.timing import startTimer
+from ..model.timing import stopTimer
+from ..model.timing import STAGE_PEARSON
+from ..model.cache import getMassKey
 
 #------------------ Global Variables ------------------------#
 
-ISOTOPE_MASS_ERROR_BOUNDARY_TABLE = {}
-PPM                               = 1000000.0
+PPM                             = 1000000.0
 
 MASS_DIFFERENCE_COLUMN_NAME     = 'Mass Difference'
 ISOTOPE_CORRELATION_COLUMN_NAME = 'Isotope Distribution Correlation'
@@ -22,6 +24,11 @@ ELUTION_CORRELATION_COLUMN_NAME = 'Elution Profile Correlation'
 ELUTION_COUNT_COLUMN_NAME       = '# Good Elution Profile Correlations' 
 MQ_CONFIDENCE_COLUMN_NAME       = 'MethylQuant Confidence'
 MQ_SCORE_COLUMN_NAME            = 'MethylQuant Score'
+CORRELATION_RESULT_COLUMN_NAME  = 'Correlation Result'     # Only kept for the result cache, never written
+PARAMETER_SET_COLUMN_NAME       = 'Parameter Set'          # Parameter sweeps only (See SweepTask)
+PARAMETER_COLUMN_NAMES          = ('Mass Error (ppm)', 'Pair Overlap Search Window (min)', 
+                                   'Pair Elution Search Window (min)', 'Empty MS Allowed', 
+                                   'Minimum Isotopomers', 'Pearson Threshold')   # See Parameters.getParameterTuple
 
 #------------------ Classes & Functions ---------------------#
 
@@ -122,19 +129,23 @@ def calculateTimeWindow(time_window_overlap, RT_MSMS, run_start_time, run_end_ti
     This is +- the mass error ppm for a given isotope
          
     Keyword arguments:
-    mass_error -- Error tolerance
-    isotope    -- Isotopic mass of a peptide
+    mass_error     -- Error tolerance
+    isotope        -- Isotopic mass of a peptide
+    boundary_table -- Memo table of the boundaries (e.g., XrInfo.mass_error_boundary_table), if any
 """
-def calculateIsotopeMassErrorBoundary(mass_error, isotope):
-    if isotope not in ISOTOPE_MASS_ERROR_BOUNDARY_TABLE:
-        #calculate upper and lower mass errors when searching for signals matching the predicted
-        #masses of the peptide isotopomers, was set to 20ppm
-        isotope_mass_error_ppm = (isotope/PPM) * mass_error
-        mass_upper = isotope + isotope_mass_error_ppm
-        mass_lower = isotope - isotope_mass_error_ppm            
-        ISOTOPE_MASS_ERROR_BOUNDARY_TABLE[isotope] = (mass_upper, mass_lower)
- 
-    (mass_upper, mass_lower) = ISOTOPE_MASS_ERROR_BOUNDARY_TABLE[isotope]
+def calculateIsotopeMassErrorBoundary(mass_error, isotope, boundary_table=None):
+    #experiments in the same session can use different mass errors
+    key = (mass_error, getMassKey(isotope))
+    if boundary_table is not None and boundary_table.contains(key):
+        return boundary_table.get(key)
+
+    #calculate upper and lower mass errors when searching for signals matching the predicted
+    #masses of the peptide isotopomers, was set to 20ppm
+    isotope_mass_error_ppm = (isotope/PPM) * mass_error
+    mass_upper = isotope + isotope_mass_error_ppm
+    mass_lower = isotope - isotope_mass_error_ppm            
+    if boundary_table is not None:
+        boundary_table.put(key, (mass_upper, mass_lower))
     return (mass_upper, mass_lower)
 
 #########################################################################################################
@@ -175,11 +186,16 @@ def calculateHtoLRatio(light_average_mass_intensities, heavy_average_mass_intens
     heavy_average_mass_intensities -- numpy.array of averaged intensities for each heavy isotope envelopes
 """
 def calculatePearsonCorrelationCoefficient(light_average_mass_intensities, heavy_average_mass_intensities):
+    start_time                = startTimer()
     light_average_intensities = light_average_mass_intensities[:, 1]
     heavy_average_intensities = heavy_average_mass_intensities[:, 1]
 
+    #scipy is slow to import, so we only import it once we actually need it
+    from scipy.stats.stats import pearsonr
+
     #the function returns a (coefficient, p-value) tuple
     pearson_correlation_coefficient = pearsonr(light_average_intensities, heavy_average_intensities)[0]
+    stopTimer(STAGE_PEARSON, start_time)
     if (pearson_correlation_coefficient is not None and not numpy.isnan(pearson_correlation_coefficient)):
         return pearson_correlation_coefficient
     
@@ -13,9 +13,17 @@
 
 #------------------- Global Variables -----------------------#
 
-UPDATE_STATUS_LISTENER          = "UpdateStatusListener"
-UPDATE_GAUGE_LISTENER           = "UpdateGaugeListener" 
-UPDATE_GAUGE_STEPSIZE_LISTENER  = "UpdateGaugeStepsizeListener"
-INCREMENT_GAUGE_LISTENER        = "IncrementGaugeListener"
+UPDATE_STATUS_LISTENER            = "UpdateStatusListener"
+UPDATE_GAUGE_LISTENER             = "UpdateGaugeListener" 
+UPDATE_PROGRESS_LISTENER          = "UpdateProgressListener"
+UPDATE_EXPERIMENT_STATUS_LISTENER = "UpdateExperimentStatusListener"
+UPDATE_MEMORY_LISTENER            = "UpdateMemoryListener"
+
+DEFAULT_NUM_WORKERS               = 1       # Number of worker processes (1 = run serially)
+MAX_PENDING_RAWS_PER_WORKER       = 2       # Number of RAW files submitted to each worker at once
+MIN_ROWS_PER_SHARD                = 5000    # Minimum number of rows before a RAW file is split between workers
+SHARED_SCAN_TABLE_PREFIX          = "MethylQuant_"
+DEFAULT_PREFETCH_DEPTH            = 1       # Number of RAW files opened ahead of time (0 = no prefetching)
+PROGRESS_INTERVAL_MS              = 250     # Minimum time between progress updates
 
 #------------------ Classes & Functions ---------------------#
\ No newline at end of file
@@ -0,0 +1,86 @@
+#--------------------------------------------------------------------------------------------------------------------
+
+#This module contains task-related classes and functions for pausing and cancelling a session
+
+#------------------ Dependencies ----------------------------#
+
+# Standard library imports
+import threading
+
+# External imports
+
+# Internal imports
+
+#------------------ Global Variables ------------------------#
+
+#------------------ Classes & Functions ---------------------#
+
+""" Lets the UI pause, resume or cancel a running session.
+    
+    The task layer calls checkPoint between rows. While paused, checkPoint blocks 
+    (without using any CPU), so everything that is open stays open. 
+    Once cancelled, checkPoint returns True and the task should stop and 
+    return whatever it has done so far.
+
+    Worker processes can't see threading events, so a copy backed 
+    by multiprocessing.Manager events can be made with share().
+"""
+class TaskControl():
+
+    def __init__(self, cancel_event=None, resume_event=None):
+        self.cancel_event    = threading.Event() if cancel_event is None else cancel_event
+        self.resume_event    = threading.Event() if resume_event is None else resume_event
+        self.shared_controls = []
+        self.resume_event.set()
+
+    def __getstate__(self):
+        #only shared controls are sent to worker processes
+        state = self.__dict__.copy()
+        state['shared_controls'] = []
+        return state
+
+    """ Returns a copy of the control that can be sent to worker processes
+        
+        Keyword arguments:
+        manager -- multiprocessing.Manager that creates the (shared) events
+    """
+    def share(self, manager):
+        shared_control = TaskControl(manager.Event(), manager.Event())
+        if self.isCancelled():
+            shared_control.cancel_event.set()
+        if self.isPaused():
+            shared_control.resume_event.clear()
+
+        self.shared_controls.append(shared_control)
+        return shared_control
+
+    def getControls(self):
+        return [self] + self.shared_controls
+
+    def pause(self):
+        for task_control in self.getControls():
+            task_control.resume_event.clear()
+
+    def resume(self):
+        for task_control in self.getControls():
+            task_control.resume_event.set()
+
+    def cancel(self):
+        #a paused task needs to wake up to see that it has been cancelled
+        for task_control in self.getControls():
+            task_control.cancel_event.set()
+            task_control.resume_event.set()
+
+    def isPaused(self):
+        return not self.resume_event.is_set()
+
+    def isCancelled(self):
+        return self.cancel_event.is_set()
+
+    """ Blocks while the task is paused. Returns True if the task has been cancelled
+    """
+    def checkPoint(self):
+        self.resume_event.wait()
+        return self.isCancelled()
+
+#########################################################################################################
@@ -7,9 +7,20 @@
 ## External dependencies
 import numpy
 import pandas
-from matplotlib import pyplot
 
 ## Internal dependencies
+from ..model.cache import getMassKey
+from ..model.cache import getMassesKey
+from ..model.timing import startTimer
+from ..model.timing import stopTimer
+from ..model.trace import addTraceCount
+from ..model.trace import setTraceBoundary
+from ..model.trace import TRACE_SCANS_VISITED
+from ..model.trace import TRACE_PEAK_LOOKUPS
+from ..model.trace import TRACE_PEAK_SEARCHES
+from ..model.timing import STAGE_OVERLAP
+from ..model.timing import STAGE_BOUNDARY
+from ..model.timing import STAGE_PROFILE
 from .common import *
 
 #------------------ Global Variables ------------------------#
@@ -47,13 +58,15 @@ class Task():
         between light and heavy peptides (See below)
     """
     def getPointOfMaximumOverlap(self, light_isotope_masses, heavy_isotope_masses):
-        key = (light_isotope_masses.__str__(), heavy_isotope_masses.__str__(), 
+        key = (getMassesKey(light_isotope_masses), getMassesKey(heavy_isotope_masses), 
                self.MS_MS_scan_num, SCAN_OVERLAP)
  
         if not self.xr_info.containsPeptideScanNumber(key):
+            start_time           = startTimer()
             maximum_overlap_scan \
                 = self.calculatePointOfMaximumOverlap(light_isotope_masses, heavy_isotope_masses)
             self.xr_info.putPeptideScanNumber(key, maximum_overlap_scan)
+            stopTimer(STAGE_OVERLAP, start_time)
  
         maximum_overlap_scan = self.xr_info.getPeptideScanNumber(key)
         return maximum_overlap_scan
@@ -78,6 +91,7 @@ class Task():
         #we do this by calculating the total intensity of light and heavy isotopes
         #this is based on the assumption that there is extensive overlap between light and heavy
         for scan_num in self.__getScanRangeForRT():
+            addTraceCount(TRACE_SCANS_VISITED)
             total_overlap_intensity \
                 = self.__getTotalOverlapIntensity(light_isotope_masses, heavy_isotope_masses, scan_num)
 
@@ -107,9 +121,10 @@ class Task():
 
         #get the precursor mass list
         precursor_masses_intensities = self.xr_info.getScanInfo(scan_num).getPrecursorMassList()
+        addTraceCount(TRACE_PEAK_LOOKUPS, len(light_or_heavy_isotope_masses))
      
         for isotope in light_or_heavy_isotope_masses:
-            key = (isotope, scan_num)
+            key = (getMassKey(isotope), scan_num)
             if not self.xr_info.containsPrecursorMaxMassIntensity(key):
                 max_isotope_mass_intensity \
                     = self.getMaxMassIntensityForIsotope(isotope, precursor_masses_intensities)
@@ -127,13 +142,15 @@ class Task():
     def getStartOrStopElutionForPeptide(self, light_isotope_masses, heavy_isotope_masses, 
                                         max_overlap_scan_num, start_or_stop):
         
-        key = (light_isotope_masses.__str__(), heavy_isotope_masses.__str__(), 
+        key = (getMassesKey(light_isotope_masses), getMassesKey(heavy_isotope_masses), 
                self.MS_MS_scan_num, start_or_stop)
         if not self.xr_info.containsPeptideScanNumber(key):
+            start_time            = startTimer()
             peptide_start_or_stop \
                 = self.calculateStartOrStopElutionForPeptide(light_isotope_masses, heavy_isotope_masses, 
                                                              max_overlap_scan_num, start_or_stop)
             self.xr_info.putPeptideScanNumber(key, peptide_start_or_stop)
+            stopTimer(STAGE_BOUNDARY, start_time)
          
         peptide_start_or_stop = self.xr_info.getPeptideScanNumber(key)
         return peptide_start_or_stop
@@ -162,6 +179,8 @@ class Task():
 
         #scan either forwards or backwards from MS/MS depending on whether we are finding "start" or "stop"
         for scan_num in self.__getScanRangeForStartOrStop(max_overlap_scan_num, start_or_stop):
+            addTraceCount(TRACE_SCANS_VISITED)
+
             #limit how far back or forward in RT we look for the peptide to +- 1 minute
             if not self.__isWithinTimeWindow(scan_num):
                 peptide_start_or_stop = scan_num
@@ -221,9 +240,10 @@ class Task():
         #get the average mass list
         average_masses_intensities \
             = self.xr_info.getAverageMassListForPeptide(peptide_start_scan_num, peptide_stop_scan_num)
+        addTraceCount(TRACE_PEAK_LOOKUPS, len(light_or_heavy_isotope_masses))
      
         for isotope in light_or_heavy_isotope_masses:
-            key = (isotope, peptide_start_scan_num, peptide_stop_scan_num)
+            key = (getMassKey(isotope), peptide_start_scan_num, peptide_stop_scan_num)
             if not self.xr_info.containsAverageMaxMassIntensity(key):
                 max_isotope_mass_intensity \
                     = self.getMaxMassIntensityForIsotope(isotope, average_masses_intensities)
@@ -246,9 +266,11 @@ class Task():
     """
     def getMaxMassIntensityForIsotope(self, isotope_mass, masses_intensities):
         assert(len(masses_intensities) != 0)        
+        addTraceCount(TRACE_PEAK_SEARCHES)
         if (len(masses_intensities) > 0):
             #calculates the upper and lower mass error boundaries for a given isotope
-            (mass_upper, mass_lower) = calculateIsotopeMassErrorBoundary(self.mass_error, isotope_mass)
+            (mass_upper, mass_lower) = calculateIsotopeMassErrorBoundary(self.mass_error, isotope_mass, 
+                                                                         self.xr_info.mass_error_boundary_table)
          
             #look for isotopomers of isotope in mass list that are within the mass boundaries
             within_mass_boundaries   = numpy.logical_and(mass_lower < masses_intensities[:,0], 
@@ -283,6 +305,8 @@ class Task():
 
         #scan either forwards or backwards from MS/MS depending on whether we are finding "start" or "Stop"
         for scan_num in self.__getScanRangeForStartOrStop(MS_MS_scan_num, start_or_stop):
+            addTraceCount(TRACE_SCANS_VISITED)
+
             #limit how far back or forward in RT we look for the peptide to +- 1 minute
             if not self.__isWithinTimeWindow(scan_num):
                 peptide_start_or_stop = scan_num
@@ -311,6 +335,7 @@ class Task():
         scan_range = self.xr_info.getScanRange(start_scan_num, stop_scan_num)
         isotope_RT_intensities = numpy.array([]).reshape(0, 2)
         for scan_num in scan_range:
+            addTraceCount(TRACE_SCANS_VISITED)
             RT_MS          = self.xr_info.getScanInfo(scan_num).getRT()
             mass_intensity = self.getMaxMassIntensityFromPrecursorMasses(isotope, scan_num)
  
@@ -438,6 +463,9 @@ class IsotopeCorrelationTask(Task):
         peptide_stop_scan_num  \
             = self.getStartOrStopElutionForPeptide(light_isotope_masses, heavy_isotope_masses, 
                                                    max_overlap_scan_num, SCAN_STOP)
+        setTraceBoundary("max_overlap_scan", max_overlap_scan_num)
+        setTraceBoundary("peptide_start_scan", peptide_start_scan_num)
+        setTraceBoundary("peptide_stop_scan", peptide_stop_scan_num)
 
         #get average mass intensities for light and heavy isotopes
         light_average_mass_intensities \
@@ -480,16 +508,24 @@ class IsotopeCorrelationTask(Task):
         (heavy_intensity_1, heavy_intensity_2, heavy_intensity_3) \
             = heavy_average_mass_intensities[:, 1].tolist()
  
-        self.outputRow = pandas.DataFrame([[peptide_start_scan_num, peptide_stop_scan_num, 
-                                            peptide_start_RT, peptide_stop_RT, 
-                                            light_mass_1, light_intensity_1,
-                                            light_mass_2, light_intensity_2, 
-                                            light_mass_3, light_intensity_3, 
-                                            heavy_mass_1, heavy_intensity_1, 
-                                            heavy_mass_2, heavy_intensity_2,
-                                            heavy_mass_3, heavy_intensity_3, 
-                                            pearson_isotope_correlation, H_to_L_ratio]],
-                                            columns=self.columnnames)
+        self.setOutputValues([peptide_start_scan_num, peptide_stop_scan_num, 
+                              peptide_start_RT, peptide_stop_RT, 
+                              light_mass_1, light_intensity_1,
+                              light_mass_2, light_intensity_2, 
+                              light_mass_3, light_intensity_3, 
+                              heavy_mass_1, heavy_intensity_1, 
+                              heavy_mass_2, heavy_intensity_2,
+                              heavy_mass_3, heavy_intensity_3, 
+                              pearson_isotope_correlation, H_to_L_ratio])
+
+    """ The output values are kept so that the row can be rebuilt without the RAW file (See CorrelationTask)
+    """
+    def getOutputValues(self):
+        return self.output_values
+
+    def setOutputValues(self, output_values):
+        self.output_values = tuple(output_values)
+        self.outputRow     = pandas.DataFrame([list(output_values)], columns=self.columnnames)
 
 #########################################################################################################
 
@@ -512,6 +548,14 @@ class ElutionCorrelationTask(Task):
 
     """ Identify SILAC pairs based on Pearson correlation of RT-intensity profiles (Original algorithm by Aidan) """
     def runTask(self):
+        self.runCorrelation()
+        self.runScoring()
+
+    """ Extraction, windowing and correlation stages: 
+        the RT-intensity profile, Pearson correlation and average mass intensities of each isotope.
+        These read the RAW file, but don't depend on the Pearson threshold
+    """
+    def runCorrelation(self):
         #separate the light and heavy isotope masses
         light_isotope_masses = self.getLightIsotopeMasses()
         heavy_isotope_masses = self.getHeavyIsotopeMasses()
@@ -552,7 +596,18 @@ class ElutionCorrelationTask(Task):
 
             light_average_mass_intensities = numpy.vstack([light_average_mass_intensities, light_isotope_average_mass_intensities])
             heavy_average_mass_intensities = numpy.vstack([heavy_average_mass_intensities, heavy_isotope_average_mass_intensities])
-     
+
+        self.setCorrelationResult((light_average_mass_intensities, heavy_average_mass_intensities, 
+                                   pearson_isotope_correlations))
+
+        #self.__plotRTIntensities(light_RT_intensities, heavy_RT_intensities)
+
+    """ Scoring stage: only needs the result of runCorrelation (See getCorrelationResult) 
+    """
+    def runScoring(self):
+        (light_average_mass_intensities, heavy_average_mass_intensities, 
+         pearson_isotope_correlations) = self.correlation_result
+
         # Calculate the H/L ratio for isotopes with a good Pearson's correlation (non-NA values that are > pearson threshold input)
         good_correlation_indicies = [i for i, x in enumerate(pearson_isotope_correlations) if x != "NA" and x > self.pearson_threshold]
         num_good_correlations     = len(good_correlation_indicies) 
@@ -562,9 +617,17 @@ class ElutionCorrelationTask(Task):
         self.formatRow(light_average_mass_intensities, heavy_average_mass_intensities, 
                        pearson_isotope_correlations, num_good_correlations, H_to_L_ratio);
 
-        #self.__plotRTIntensities(light_RT_intensities, heavy_RT_intensities)
+    """ Returns (light average mass intensities, heavy average mass intensities, Pearson correlations) 
+    """
+    def getCorrelationResult(self):
+        return self.correlation_result
+
+    def setCorrelationResult(self, correlation_result):
+        self.correlation_result = correlation_result
 
     def getIsotopeStartAndStop(self, light_isotope, heavy_isotope, max_overlap_scan_num):
+        start_time = startTimer()
+
         #get the start and stop scan numbers for methylSILAC pair using the MS scan number returned above as the starting point
         light_peptide_start_scan_num \
             = self.calculateStartOrStopElutionForIsotope(light_isotope, max_overlap_scan_num, SCAN_START)
@@ -579,9 +642,12 @@ class ElutionCorrelationTask(Task):
         ## We need the same number of points for pearson, so our waveforms should be taken over the same scan range
         isotope_start_scan_num = min(light_peptide_start_scan_num, heavy_peptide_start_scan_num)
         isotope_stop_scan_num  = max(light_peptide_stop_scan_num, heavy_peptide_stop_scan_num)
+        stopTimer(STAGE_BOUNDARY, start_time)
+        setTraceBoundary("isotope_windows", [isotope_start_scan_num, isotope_stop_scan_num], is_list=True)
         return (isotope_start_scan_num, isotope_stop_scan_num)
 
     def getIsotopeRTIntensities(self, light_isotope, heavy_isotope, isotope_start_scan_num, isotope_stop_scan_num):
+        start_time = startTimer()
         light_isotope_RT_intensities \
             = self.getIntensityProfileForIsotope(light_isotope, isotope_start_scan_num, isotope_stop_scan_num)
         heavy_isotope_RT_intensities \
@@ -590,6 +656,7 @@ class ElutionCorrelationTask(Task):
         # For testing purposes
         self.light_RT_intensities.append(light_isotope_RT_intensities)
         self.heavy_RT_intensities.append(heavy_isotope_RT_intensities)
+        stopTimer(STAGE_PROFILE, start_time)
         return (light_isotope_RT_intensities, heavy_isotope_RT_intensities)
 
     """ Format output for printing out to CSV file
@@ -629,6 +696,8 @@ class ElutionCorrelationTask(Task):
         NOTE: This is mostly for testing and debugging purposes
     """  
     def __plotRTIntensities(self, light_RT_intensities, heavy_RT_intensities):
+        from matplotlib import pyplot
+
         fig        = pyplot.figure()
         subplot_id = 611
         for i in range(0, len(light_RT_intensities)):
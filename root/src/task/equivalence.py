@@ -0,0 +1,269 @@
+#--------------------------------------------------------------------------------------------------------------------
+
+#This module contains classes and functions for checking that a search engine gives the same output 
+#as a golden output file or the legacy engine
+
+#------------------ Dependencies ----------------------------#
+
+# Standard library imports
+import os
+import shutil
+import tempfile
+
+# External imports
+import numpy
+import pandas
+
+# Internal imports
+from ..model import Experiment
+from ..io.reader import PeptidesReader
+from ..io.reader import RawReader
+from ..io.reader import initRawThread
+from ..io.reader import closeRawThread
+from ..io.writer import CsvWriter
+from ..io.writer import getOutputPath
+from ..io.experiments import getDefinition
+from ..io.experiments import createExperiment
+from .experiment import ExperimentTask
+from .session import SessionTask
+from .constants import *
+from .common import *
+
+#------------------ Global Variables ------------------------#
+
+LEGACY_ENGINE       = "legacy"
+DEFAULT_RTOL        = 1e-6      # Relative tolerance of floating point columns (See OutputDiff)
+DEFAULT_ATOL        = 1e-9      # Absolute tolerance of floating point columns
+SORT_COLUMN_NAMES   = ['Data File', 'Start Scan']
+# Columns that have to match exactly (as do columns that aren't numbers)
+EXACT_COLUMN_NAMES  = ('Sequence', 'Modifications', 'Charge', 'Data File', 'Start Scan',
+                       'Peptide Start Scan', 'Peptide Stop Scan',
+                       ELUTION_COUNT_COLUMN_NAME, MQ_CONFIDENCE_COLUMN_NAME)
+
+#------------------ Classes & Functions ---------------------#
+
+""" Differences between an expected (legacy) output file and the output file of another engine.
+
+    Rows are matched up in ('Data File', 'Start Scan') order (engines may write the RAW files in any order),
+    and every column is compared. Scan numbers, counts, confidence calls and text must match exactly.
+    Other numbers must be within rtol * |expected| + atol (as in numpy.isclose).
+"""
+class OutputDiff():
+
+    def __init__(self, expected_path, actual_path, rtol=DEFAULT_RTOL, atol=DEFAULT_ATOL):
+        self.expected_path   = expected_path
+        self.actual_path     = actual_path
+        self.rtol            = rtol
+        self.atol            = atol
+        self.num_rows        = (0, 0)       # (expected, actual)
+        self.missing_columns = []
+        self.extra_columns   = []
+        self.mismatch_table  = pandas.DataFrame(columns=['Row'] + SORT_COLUMN_NAMES +
+                                                ['Sequence', 'Column', 'Expected', 'Actual'])
+
+    def compare(self):
+        expected_table = readOutput(self.expected_path)
+        actual_table   = readOutput(self.actual_path)
+        self.num_rows  = (len(expected_table), len(actual_table))
+        self.missing_columns = [c for c in expected_table.columns if c not in actual_table.columns]
+        self.extra_columns   = [c for c in actual_table.columns if c not in expected_table.columns]
+        if self.num_rows[0] != self.num_rows[1]:
+            return self
+
+        mismatch_tables = []
+        for column_name in expected_table.columns:
+            if column_name in self.missing_columns:
+                continue
+
+            expected_values = expected_table[column_name].values
+            actual_values   = actual_table[column_name].values
+            is_mismatch     = expected_values != actual_values
+            if column_name not in EXACT_COLUMN_NAMES and is_mismatch.any():
+                is_mismatch[is_mismatch] = ~self.isClose(expected_values[is_mismatch], actual_values[is_mismatch])
+            if not is_mismatch.any():
+                continue
+
+            mismatch_table = expected_table.loc[is_mismatch, SORT_COLUMN_NAMES + ['Sequence']].copy()
+            mismatch_table.insert(0, 'Row', numpy.flatnonzero(is_mismatch) + 1)
+            mismatch_table['Column']   = column_name
+            mismatch_table['Expected'] = expected_values[is_mismatch]
+            mismatch_table['Actual']   = actual_values[is_mismatch]
+            mismatch_tables.append(mismatch_table)
+
+        if len(mismatch_tables) != 0:
+            self.mismatch_table = pandas.concat(mismatch_tables).sort_values(['Row', 'Column'], kind='mergesort')
+        return self
+
+    """ Returns a numpy.array of whether each pair of values are the same number (within the tolerance).
+        Values that aren't numbers are never close (they were already compared as text)
+    """
+    def isClose(self, expected_values, actual_values):
+        expected_numbers = pandas.to_numeric(pandas.Series(expected_values), errors='coerce').values
+        actual_numbers   = pandas.to_numeric(pandas.Series(actual_values), errors='coerce').values
+        return numpy.isclose(actual_numbers, expected_numbers, rtol=self.rtol, atol=self.atol, equal_nan=False)
+
+    def isEqual(self):
+        return (self.num_rows[0] == self.num_rows[1] and len(self.missing_columns) == 0 and
+                len(self.extra_columns) == 0 and len(self.mismatch_table) == 0)
+
+    """ Returns the number of PSMs (rows) with at least one mismatching column
+    """
+    def getNumMismatchingRows(self):
+        return self.mismatch_table['Row'].nunique()
+
+    """ Returns a text report of the differences, with up to max_mismatches mismatching values
+    """
+    def formatReport(self, max_mismatches=50):
+        lines = ["Expected: %s" % self.expected_path, "Actual:   %s" % self.actual_path]
+        if self.isEqual():
+            lines.append("  %d rows, no differences (rtol=%g, atol=%g)" % (self.num_rows[0], self.rtol, self.atol))
+            return "\n".join(lines)
+
+        if self.num_rows[0] != self.num_rows[1]:
+            lines.append("  Number of rows differs: %d expected, %d actual" % self.num_rows)
+        if len(self.missing_columns) != 0:
+            lines.append("  Missing columns: %s" % ", ".join(self.missing_columns))
+        if len(self.extra_columns) != 0:
+            lines.append("  Extra columns: %s" % ", ".join(self.extra_columns))
+        if len(self.mismatch_table) == 0:
+            return "\n".join(lines)
+
+        lines.append("  %d of %d PSMs differ (rtol=%g, atol=%g)" % (self.getNumMismatchingRows(), self.num_rows[0],
+                                                                    self.rtol, self.atol))
+        for column_name, num_mismatches in self.mismatch_table['Column'].value_counts(sort=False).items():
+            lines.append("  %-40s %8d" % (column_name, num_mismatches))
+
+        lines.append("  %6s  %-20s %10s  %-24s %-40s %20s %20s" % ('Row', 'Data File', 'Start Scan', 'Sequence',
+                                                                  'Column', 'Expected', 'Actual'))
+        for row in self.mismatch_table.head(max_mismatches).itertuples(index=False):
+            lines.append("  %6d  %-20s %10s  %-24s %-40s %20s %20s" % tuple(row))
+        if len(self.mismatch_table) > max_mismatches:
+            lines.append("  ... %d more" % (len(self.mismatch_table) - max_mismatches))
+        return "\n".join(lines)
+
+#########################################################################################################
+
+""" Returns an output file as a table of text values (so nothing is lost in parsing),
+    sorted by ('Data File', 'Start Scan'). Rows of the same scan keep their order
+"""
+def readOutput(output_path):
+    output_table = pandas.read_csv(output_path, dtype=str, keep_default_na=False)
+    sort_table   = output_table.loc[:, SORT_COLUMN_NAMES]
+    sort_table['Start Scan'] = pandas.to_numeric(sort_table['Start Scan'], errors='coerce')
+    sort_order   = sort_table.sort_values(SORT_COLUMN_NAMES, kind='mergesort').index
+    return output_table.loc[sort_order].reset_index(drop=True)
+
+#########################################################################################################
+
+""" Legacy engine: every peptides file of every experiment is searched one RAW file at a time,
+    with ExperimentTask (row by row), a plain RawReader and no result cache.
+
+    This shares the search with the other engines (memo tables, LRU caches, mass keys, ...), 
+    so it only catches differences between engines. Changes to the search itself are caught by 
+    comparing with golden outputs instead (See runEquivalence)
+"""
+def runLegacyEngine(experiment_list, num_workers=1):
+    initRawThread()
+    try:
+        for experiment in experiment_list:
+            for seq_peptides_path in experiment.file_info.getPeptideFiles():
+                experiment_task     = ExperimentTask(experiment)
+                experiment_task.initPeptidesFile(seq_peptides_path)
+                seq_peptides_reader = PeptidesReader(seq_peptides_path)
+                seq_peptides_writer = CsvWriter(seq_peptides_path)
+                for raw_file in sorted(seq_peptides_reader.getDataFiles()):
+                    raw_reader    = RawReader(raw_file, experiment.file_info.raw_dir_map)
+                    matched_table = experiment_task.identifyPairsInRaw(seq_peptides_reader, raw_reader)
+                    raw_reader.closeRawReader()
+                    if len(matched_table) != 0:
+                        seq_peptides_writer.writeFile(matched_table)
+    finally:
+        closeRawThread()
+
+""" Session engine (See SessionTask), with the given number of workers
+"""
+def runSessionEngine(experiment_list, num_workers=1, **kwargs):
+    experiment_statuses = {}
+    def sendMessage(topic, **message):
+        if topic == UPDATE_EXPERIMENT_STATUS_LISTENER:
+            experiment_statuses[message["experiment_idx"]] = message["experiment_status"]
+
+    SessionTask(experiment_list, num_workers, send_message=sendMessage, **kwargs).run()
+    if any(s != Experiment.PASSED for s in experiment_statuses.values()):
+        raise RuntimeError("the session did not finish")
+
+""" Session engine, with each RAW file split into shards of (at least) 100 rows between workers
+"""
+def runShardedEngine(experiment_list, num_workers=2):
+    runSessionEngine(experiment_list, max(num_workers, 2), min_shard_size=100)
+
+""" Session engine, run twice with the same result cache, so the second output comes from the cache
+"""
+def runCachedEngine(experiment_list, num_workers=1):
+    cache_dir = tempfile.mkdtemp()
+    try:
+        for i in range(2):
+            runSessionEngine(experiment_list, num_workers, cache_path=os.path.join(cache_dir, "cache.sqlite"))
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+# Table containing engine name -> function(experiment list, number of workers) that writes the output files
+ENGINE_TABLE = {LEGACY_ENGINE: runLegacyEngine,
+                "session":     runSessionEngine,
+                "sharded":     runShardedEngine,
+                "cached":      runCachedEngine}
+
+#########################################################################################################
+
+""" Returns a copy of the experiments whose peptides files are copied into output_dir,
+    so each engine writes its output files into its own directory (RAW files are not copied)
+"""
+def copyExperiments(experiment_list, output_dir):
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    copied_paths           = {}     # Table containing peptides file path -> copied path
+    copied_experiment_list = []
+    for experiment in experiment_list:
+        definition = getDefinition(experiment)
+        for entry in definition["peptides_files"]:
+            if entry["path"] not in copied_paths:
+                copied_path = os.path.join(output_dir, "%d_%s" % (len(copied_paths), os.path.basename(entry["path"])))
+                shutil.copyfile(entry["path"], copied_path)
+                copied_paths[entry["path"]] = copied_path
+            entry["path"] = copied_paths[entry["path"]]
+        copied_experiment_list.append(createExperiment(definition))
+    return (copied_experiment_list, copied_paths)
+
+""" Runs a candidate engine on the experiments, and returns an OutputDiff for each peptides file 
+    (in the order of the experiments).
+
+    Each output is compared with its golden output, if golden_paths is given. 
+    Golden outputs are written by a tree that is known to be right (e.g., before an optimisation), 
+    so they don't share any code with the candidate. Otherwise, the legacy engine is run on the same 
+    experiments and each output is compared with its output (See runLegacyEngine)
+
+    Keyword arguments:
+    experiment_list  -- List of Experiments
+    candidate_engine -- Name of the engine to check (See ENGINE_TABLE)
+    work_dir         -- Directory that the outputs of the engines are written into
+    num_workers      -- Number of workers of the candidate engine
+    rtol, atol       -- Tolerance of floating point columns (See OutputDiff)
+    golden_paths     -- Table containing peptides file path -> golden output path (or None)
+"""
+def runEquivalence(experiment_list, candidate_engine, work_dir, num_workers=1, rtol=DEFAULT_RTOL, atol=DEFAULT_ATOL,
+                   golden_paths=None):
+    (engine_experiment_list, actual_paths) = copyExperiments(experiment_list, os.path.join(work_dir, candidate_engine))
+    ENGINE_TABLE[candidate_engine](engine_experiment_list, num_workers)
+
+    if golden_paths is None:
+        (legacy_experiment_list, legacy_paths) = copyExperiments(experiment_list, os.path.join(work_dir, LEGACY_ENGINE))
+        runLegacyEngine(legacy_experiment_list)
+        golden_paths = {p: getOutputPath(legacy_paths[p]) for p in legacy_paths}
+
+    missing_paths = [p for p in actual_paths if p not in golden_paths]
+    if len(missing_paths) != 0:
+        raise ValueError("no golden output for " + ", ".join(missing_paths))
+    return [OutputDiff(golden_paths[p], getOutputPath(actual_paths[p]), rtol, atol).compare() for p in actual_paths]
+
+#########################################################################################################
@@ -6,17 +6,20 @@
 
 # Standard library imports
 import math
-import os
 
 # External imports
+import numpy
 import pandas
-from pubsub import pub
 
 # Internal imports
-from ..io.reader import PeptidesReader
-from ..io.reader import RawReader
-from ..io.writer import CsvWriter
-from ..view.constants import *
+from ..model.constants import *
+from ..io.cache import getResultKey
+from ..model.timing import startTimer
+from ..model.timing import stopTimer
+from ..model.timing import STAGE_SEARCH
+from ..model.timing import STAGE_SCORING
+from ..model.trace import startPsmTrace
+from ..model.trace import finishPsmTrace
 from .correlation import IsotopeCorrelationTask
 from .correlation import ElutionCorrelationTask
 from .constants import *
@@ -33,80 +36,21 @@ MQ_LOW_CONFIDENCE       = 'Low'
 class ExperimentTask():
 
     def __init__(self, experiment):
-        self.file_info   = experiment.file_info
-        self.mass_shifts = experiment.mass_shifts
-        self.parameters  = experiment.parameters
-
-    def initGauge(self, seq_peptides_reader):
-        #reset the gauge (progress bar) 
-        pub.sendMessage(UPDATE_GAUGE_LISTENER, filled=False)
-        pub.sendMessage(UPDATE_GAUGE_STEPSIZE_LISTENER, seq_peptides_reader=seq_peptides_reader)
-        
-    def initStatus(self, seq_peptides_path):
-        #update the status text
-        file_path   = seq_peptides_path.split("\\")[0]
-        file_path   = file_path + "\\...\\" + os.path.basename(seq_peptides_path)    
-        status_text = "Processing %s" % (file_path)
-        pub.sendMessage(UPDATE_STATUS_LISTENER, status_box_id=0, status_text=status_text)
-        pub.sendMessage(UPDATE_STATUS_LISTENER, status_box_id=1, status_text="")
-        
-    def updateProgress(self, peptide_seq, raw_file):
-        #update gauge (progress bar) and status text
-        status_text = "Searching for %s in %s" % (peptide_seq, raw_file)
-        pub.sendMessage(INCREMENT_GAUGE_LISTENER)
-        pub.sendMessage(UPDATE_STATUS_LISTENER, status_box_id=1, status_text=status_text)
+        self.file_info                = experiment.file_info
+        self.mass_shifts              = experiment.mass_shifts
+        self.parameters               = experiment.parameters
+        self.keep_correlation_results = False   # Add the correlation result of each row for the result cache
+
+    """ Initialise the task for a given sequenced peptides file
 
-    def run(self):
-        for seq_peptides_path in self.file_info.getPeptideFiles():
-            self.raw_dir_map        = self.file_info.raw_dir_map
-            self.silac_type         = self.file_info.silac_map[seq_peptides_path]
-            self.output_style       = self.file_info.output_map[seq_peptides_path]
-            self.default_mass_shift = self.mass_shifts.isDefault()
-
-            #------------------ This is the heart of MethylQuant ----------------------------#
-            self.identifyPairsInCsv(seq_peptides_path)
-
-            #due to calculations with floating point numbers, 
-            #the task will finish before the gauge (progress bar) gets to the end. 
-            #this (attempts to) ensure that they occur simultaneously
-            pub.sendMessage(UPDATE_GAUGE_LISTENER, filled=True)
-
-    """ Begin quantification on a given CSV file
-       
-        NOTE: There is an issue where if we have multiple CSV files 
-        that are using information from the same RAW file/s.
-        Due to memory and run-time efficiency, we can't really avoid this....
-        
         Keyword arguments:
         seq_peptides_path -- File path of CSV file 
-        raw_dirs          -- Map of file paths to each MS raw files
-        labelling         -- Labelling used as defined by user
-        silac_type        -- Light or heavy peptide sequenced
     """
-    def identifyPairsInCsv(self, seq_peptides_path):
-        #parse sequenced peptides file and create the output table for results
-        #reading the file SHOULD NOT error. 
-        #We already checked for this when the user inputs their files
-        seq_peptides_reader = PeptidesReader(seq_peptides_path)
-        seq_peptides_writer = CsvWriter(seq_peptides_path)
-
-        #send intialisation messages to status and gauge panels
-        self.initGauge(seq_peptides_reader)
-        self.initStatus(seq_peptides_path)
-
-        #iterate through the list of all raw files in the sequenced peptides file
-        raw_files_in_csv = seq_peptides_reader.getDataFiles()
-        for raw_file in sorted(raw_files_in_csv):
-            #get a XR object containing all the RAW file information
-            raw_reader = RawReader(raw_file, self.raw_dir_map)
-
-            # Find matched peptides and write the results for a RAW to file 
-            # This is based on original sequenced peptides file, just with extra columns
-            matched_seq_peptides_in_raw = self.identifyPairsInRaw(seq_peptides_reader, raw_reader)
-            seq_peptides_writer.writeFile(matched_seq_peptides_in_raw)
-
-            # #since we are done with xr_info, close it
-            # raw_reader.closeRawReader()
+    def initPeptidesFile(self, seq_peptides_path):
+        self.raw_dir_map        = self.file_info.raw_dir_map
+        self.silac_type         = self.file_info.silac_map[seq_peptides_path]
+        self.output_style       = self.file_info.output_map[seq_peptides_path]
+        self.default_mass_shift = self.mass_shifts.isDefault()
 
     """ Search for SILAC pairs in subsets of the sequenced peptides file.
         These are based on the peptides that are in a specified RAW file
@@ -117,14 +61,37 @@ class ExperimentTask():
         xr_info             -- XR object containing all information for a specified RAW file    
         labelling           -- Labelling used as defined by user
         silac_type          -- Light or heavy peptide sequenced
+        update_progress     -- Function called with (peptide sequence, Raw file) before searching each row
+        task_control        -- TaskControl that can pause or cancel the search
     """
-    def identifyPairsInRaw(self, seq_peptides_reader, raw_reader):
+    def identifyPairsInRaw(self, seq_peptides_reader, raw_reader, update_progress=None, task_control=None):
         #Reset indexes so that we can join the tables correctly
         sorted_seq_peptides_in_raw       = seq_peptides_reader.getSortedRowsInRaw(raw_reader.raw_file)
         sorted_seq_peptides_in_raw.index = range(len(sorted_seq_peptides_in_raw))
-        matched_table                    = pandas.DataFrame()
+
+        matched_table = self.identifyPairsInRows(seq_peptides_reader, raw_reader, 
+                                                 sorted_seq_peptides_in_raw, update_progress, task_control)
+        return self.rearrangeOutput(seq_peptides_reader, sorted_seq_peptides_in_raw, matched_table)
+
+    """ Search for SILAC pairs for each row in a (sorted) subset of the sequenced peptides file.
+        The rows must all come from the same RAW file. 
+        
+        Keyword arguments:
+        seq_peptides_reader        -- Sequenced peptides file reader
+        raw_reader                 -- Raw file reader for the RAW file of the rows
+        sorted_seq_peptides_in_raw -- Rows of the sequenced peptides file
+        update_progress            -- Function called with (peptide sequence, Raw file) before searching each row
+        task_control               -- TaskControl that can pause or cancel the search. 
+                                      If cancelled, only the rows searched so far are returned
+    """
+    def identifyPairsInRows(self, seq_peptides_reader, raw_reader, sorted_seq_peptides_in_raw, 
+                            update_progress=None, task_control=None):
+        matched_table = pandas.DataFrame()
 
         for row_idx, row in sorted_seq_peptides_in_raw.iterrows():
+            if task_control is not None and task_control.checkPoint():
+                break
+
             (peptide_seq, modifications, charge, calc_mz, start_scan) \
                                       = seq_peptides_reader.getRowInfo(row)             
             mass_shift                = self.getMassShift(seq_peptides_reader, row, 
@@ -137,13 +104,18 @@ class ExperimentTask():
                                                                        calc_mz, mass_shift)
 
             #Inform the user about what is happening and begin finding pairs 
-            self.updateProgress(peptide_seq, raw_reader.raw_file)
+            if update_progress is not None:
+                update_progress(peptide_seq, raw_reader.raw_file)
+            start_time    = startTimer()
+            psm_trace     = startPsmTrace(raw_reader.raw_file, start_scan, peptide_seq)
             matched_row   = self.identifyPair(raw_reader.xr_info, start_scan, 
                                               RT_MSMS, peptide_isotope_masses)
             matched_row.insert(0, MASS_DIFFERENCE_COLUMN_NAME, mass_shift)
             matched_table = matched_table.append(matched_row)
+            finishPsmTrace(psm_trace)
+            stopTimer(STAGE_SEARCH, start_time)
  
-        return self.rearrangeOutput(seq_peptides_reader, sorted_seq_peptides_in_raw, matched_table)
+        return matched_table
     
     """ Search for SILAC pair for peptide
         
@@ -160,7 +132,13 @@ class ExperimentTask():
         correlation_task = CorrelationTask(self.parameters, self.output_style, self.default_mass_shift,
                                            xr_info, MS_MS_scan_num, RT_MSMS, peptide_isotope_masses)
         correlation_task.run()
-        return correlation_task.outputRow
+
+        matched_row = correlation_task.outputRow
+        if self.keep_correlation_results:
+            correlation_result = numpy.empty(1, dtype=object)
+            correlation_result[0] = correlation_task.getCorrelationResult()
+            matched_row.insert(len(matched_row.columns), CORRELATION_RESULT_COLUMN_NAME, correlation_result)
+        return matched_row
 
     def getMassShift(self, seq_peptides_reader, row, peptide_seq, modifications, charge):
         try:
@@ -175,12 +153,63 @@ class ExperimentTask():
                                                 self.silac_type, self.mass_shifts)
         return mass_shift
 
+    """ Returns the keys in the result cache (See io.ResultCache) of each row of a RAW file (in sorted order), 
+        as (result keys, correlation keys, mass shifts). 
+        
+        A correlation result depends on the RAW file, the MS/MS scan, the isotope target masses and 
+        the parameters of the correlation stages. The isotope target masses are given by the precursor mass 
+        of the MS/MS scan, the charge, the calculated m/z and the mass shift, so we use these instead 
+        (and don't need to open the RAW file). A (scored) result also depends on the scoring parameters.
+
+        Keyword arguments:
+        seq_peptides_reader -- Sequenced peptides file reader
+        raw_file            -- Raw file that we want to look into
+        raw_stat            -- (path, size, modification time) of the RAW file
+    """
+    def getResultKeys(self, seq_peptides_reader, raw_file, raw_stat):
+        parameter_tuple  = self.parameters.getCorrelationParameterTuple()
+        result_keys      = []
+        correlation_keys = []
+        mass_shifts      = []
+        for row_idx, row in seq_peptides_reader.getSortedRowsInRaw(raw_file).iterrows():
+            (peptide_seq, modifications, charge, calc_mz, start_scan) \
+                            = seq_peptides_reader.getRowInfo(row)
+            mass_shift      = self.getMassShift(seq_peptides_reader, row, peptide_seq, modifications, charge)
+            correlation_key = getResultKey([list(raw_stat), start_scan, charge, calc_mz, float(mass_shift),
+                                            list(parameter_tuple)])
+            result_key      = getResultKey([correlation_key, self.parameters.pearson_threshold, 
+                                            self.output_style, bool(self.default_mass_shift)])
+            result_keys.append(result_key)
+            correlation_keys.append(correlation_key)
+            mass_shifts.append(mass_shift)
+
+        return (result_keys, correlation_keys, mass_shifts)
+
+    """ Re-runs the scoring stage on the correlation result of a row (See CorrelationTask).
+        Returns the (columns, values) that are added to the row in the output, as in rearrangeOutput
+    """
+    def scorePair(self, seq_peptides_reader, correlation_result, mass_shift):
+        correlation_task = CorrelationTask(self.parameters, self.output_style, self.default_mass_shift, 
+                                           None, None, None, None)
+        correlation_task.setCorrelationResult(correlation_result)
+        correlation_task.runScoring()
+
+        matched_row = correlation_task.outputRow
+        if not seq_peptides_reader.hasMassDifferenceColumn():
+            matched_row.insert(0, MASS_DIFFERENCE_COLUMN_NAME, mass_shift)
+        return (tuple(matched_row.columns), next(matched_row.itertuples(index=False, name=None)))
+
     def getScanTuple(self, xr_info, MS_MS_scan_num):
         RT_MSMS        = xr_info.getScanInfo(MS_MS_scan_num).getRT()
         precursor_mass = xr_info.getScanInfo(MS_MS_scan_num).getPrecursorMass()
         return (RT_MSMS, precursor_mass)
     
     def rearrangeOutput(self, seq_peptides_reader, sorted_seq_peptides_in_raw, matched_table):
+        #if the search was cancelled, only the first rows have been searched
+        sorted_seq_peptides_in_raw = sorted_seq_peptides_in_raw.iloc[:len(matched_table)]
+        if len(matched_table) == 0:
+            return sorted_seq_peptides_in_raw
+
         #Reset indexes so that the tables can be joined correctly
         matched_table.index = range(len(matched_table))
         if seq_peptides_reader.hasMassDifferenceColumn():
@@ -204,19 +233,57 @@ class CorrelationTask():
         self.peptide_isotope_masses = peptide_isotope_masses
         
     def run(self):
+        self.runCorrelation()
+        self.runScoring()
+
+    """ Extraction, windowing and correlation stages. These read the RAW file (xr_info) and 
+        depend on every parameter except the scoring parameters (See Parameters.getCorrelationParameterTuple)
+    """
+    def runCorrelation(self):
         ## Run the original algorithm by Vincent
         isotope_correlation_task \
             = IsotopeCorrelationTask(self.parameters, self.xr_info, self.MS_MS_scan_num, 
                                      self.RT_MSMS, self.peptide_isotope_masses)
         isotope_correlation_task.runTask()
 
-        ## Run the updated algorithm by Aidan
+        ## Run the updated algorithm by Aidan (without scoring)
+        elution_correlation_task \
+            = ElutionCorrelationTask(self.parameters, self.xr_info, self.MS_MS_scan_num, 
+                                     self.RT_MSMS, self.peptide_isotope_masses)
+        elution_correlation_task.runCorrelation()
+
+        self.setCorrelationResult((isotope_correlation_task.getOutputValues(), 
+                                   elution_correlation_task.getCorrelationResult()))
+
+    """ Scoring stage. This only needs the result of the correlation stages, 
+        so it can be re-run (e.g., with a different Pearson threshold) without the RAW file 
+    """
+    def runScoring(self):
+        start_time = startTimer()
+        (isotope_correlation_values, elution_correlation_result) = self.correlation_result
+
+        isotope_correlation_task \
+            = IsotopeCorrelationTask(self.parameters, self.xr_info, self.MS_MS_scan_num, 
+                                     self.RT_MSMS, self.peptide_isotope_masses)
+        isotope_correlation_task.setOutputValues(isotope_correlation_values)
+
         elution_correlation_task \
             = ElutionCorrelationTask(self.parameters, self.xr_info, self.MS_MS_scan_num, 
                                      self.RT_MSMS, self.peptide_isotope_masses)
-        elution_correlation_task.runTask()
+        elution_correlation_task.setCorrelationResult(elution_correlation_result)
+        elution_correlation_task.runScoring()
  
         self.formatRow(isotope_correlation_task.outputRow, elution_correlation_task.outputRow)
+        stopTimer(STAGE_SCORING, start_time)
+
+    """ Returns (isotope correlation values, elution correlation result). 
+        This is everything that the scoring stage needs, and is kept in the result cache (See io.ResultCache)
+    """
+    def getCorrelationResult(self):
+        return self.correlation_result
+
+    def setCorrelationResult(self, correlation_result):
+        self.correlation_result = correlation_result
 
     def formatRow(self, isotope_correlation_row, elution_correlation_row):
         isotope_correlation       = isotope_correlation_row.iloc[0][ISOTOPE_CORRELATION_COLUMN_NAME]
@@ -0,0 +1,391 @@
+#--------------------------------------------------------------------------------------------------------------------
+
+#This module contains task-related classes and functions for processing RAW files in worker processes
+
+#------------------ Dependencies ----------------------------#
+
+# Standard library imports
+import shutil
+import tempfile
+
+# External imports
+import numpy
+import pandas
+
+# Internal imports
+from .. import model
+from ..io.reader import RawReader
+from .progress import getTime
+from .constants import *
+
+#------------------ Global Variables ------------------------#
+
+#------------------ Classes & Functions ---------------------#
+
+""" Quantification of a single RAW file (for all peptides files that reference it) in a worker process
+"""
+class RawJob():
+
+    def __init__(self, raw_file, peptides_jobs, task_control=None):
+        self.raw_file      = raw_file
+        self.peptides_jobs = peptides_jobs
+        self.task_control  = task_control
+        self.future        = None
+        self.start_time    = None
+        self.raw_timings   = model.StageTimings()                           # Opening and indexing the RAW file
+        self.job_timings   = [model.StageTimings() for j in peptides_jobs]  # Searching each peptides job
+
+    def getRawDirMap(self):
+        return self.peptides_jobs[0].experiment_task.raw_dir_map
+
+    def getNumRows(self):
+        f = lambda x: len(x.seq_peptides_reader.getSortedRowsInRaw(self.raw_file))
+        return sum(map(f, self.peptides_jobs))
+
+    def submit(self, executor):
+        self.start_time = getTime()
+
+        #only send the rows we need to the worker process
+        raw_tasks   = [(j.experiment_task, j.seq_peptides_reader.getReaderForRaw(self.raw_file)) 
+                       for j in self.peptides_jobs]
+        self.future = executor.submit(runTimed, model.isTimingEnabled(), model.isTraceEnabled(), len(raw_tasks), 
+                                      identifyPairsInRaw, self.raw_file, raw_tasks, task_control=self.task_control)
+
+    def update(self, executor):
+        pass
+
+    def getFutures(self):
+        return [self.future]
+
+    def isDone(self):
+        return self.future.done()
+
+    def getMatchedTables(self):
+        return self.addStageTimings(*self.future.result())
+
+    """ Adds the timings returned by a worker process (See runTimed), and returns its result
+    """
+    def addStageTimings(self, result, raw_timings, job_timings):
+        self.raw_timings.merge(raw_timings)
+        for stage_timings, worker_timings in zip(self.job_timings, job_timings):
+            stage_timings.merge(worker_timings)
+        return result
+
+    """ Returns (RAW file timings, [timings of each peptides job]). Only filled in once the RAW file is done
+    """
+    def getStageTimings(self):
+        return (self.raw_timings, self.job_timings)
+
+#########################################################################################################
+
+""" A RAW file that has nothing to search (e.g., all rows are in the result cache), 
+    so it is never opened or sent to a worker process
+"""
+class CachedRawJob(RawJob):
+
+    def submit(self, executor):
+        self.start_time = getTime()
+
+    def getFutures(self):
+        return []
+
+    def isDone(self):
+        return True
+
+    def getMatchedTables(self):
+        return [pandas.DataFrame()] * len(self.peptides_jobs)
+
+#########################################################################################################
+
+""" Quantification of a single RAW file, where the rows are split into shards 
+    that are processed by different worker processes.
+
+    Rows are sorted by 'Start Scan', so each shard covers a contiguous RT range. 
+    The RAW file is only indexed once; the scan table is then shared with the 
+    shards through memory-mapped files (See model.SharedScanTable). 
+    Each shard only loads the scans within the maximum time window of its rows.
+
+    The matched rows of each shard are merged back in order, 
+    so the result is the same as processing the RAW file in one go.
+    If the session is cancelled, the merge stops at the first shard that did not finish.
+"""
+class ShardedRawJob(RawJob):
+
+    def __init__(self, raw_file, peptides_jobs, num_shards, task_control=None):
+        RawJob.__init__(self, raw_file, peptides_jobs, task_control)
+        self.num_shards    = num_shards
+        self.shard_futures = None
+        self.shard_sizes   = []     # Number of rows in each shard for each peptides job
+
+    """ Returns the maximum time window (in minutes) that any of the searches will look through
+    """
+    def getMargin(self):
+        f = lambda x: max(x.experiment_task.parameters.time_window, 
+                          x.experiment_task.parameters.time_window_overlap)
+        return max(map(f, self.peptides_jobs))
+
+    """ Returns a list of shards, where each shard is a list of (start, stop) 
+        row positions for each peptides job. 
+
+        Shard boundaries are chosen on 'Start Scan' over all peptides jobs, 
+        so that rows with the same start scan always end up in the same shard.
+    """
+    def getShards(self):
+        start_scans_list = [j.seq_peptides_reader.getSortedStartScans(self.raw_file) for j in self.peptides_jobs]
+        start_scans      = numpy.sort(numpy.concatenate(start_scans_list))
+        boundary_indices = [(len(start_scans) * i) // self.num_shards for i in range(1, self.num_shards)]
+        boundaries       = numpy.unique(start_scans[boundary_indices])
+
+        shards = [[] for i in range(len(boundaries) + 1)]
+        for job_start_scans in start_scans_list:
+            row_indices = [0] + numpy.searchsorted(job_start_scans, boundaries).tolist() + [len(job_start_scans)]
+            for shard_idx, shard in enumerate(shards):
+                shard.append((row_indices[shard_idx], row_indices[shard_idx + 1]))
+
+        #skip shards without any rows
+        f = lambda x: any([start != stop for (start, stop) in x])
+        return list(filter(f, shards))
+
+    def submit(self, executor):
+        self.start_time = getTime()
+
+        #index the RAW file first. The shards are submitted once this has finished
+        self.table_dir         = tempfile.mkdtemp(prefix=SHARED_SCAN_TABLE_PREFIX)
+        self.shared_scan_table = model.SharedScanTable(self.table_dir)
+        self.future            = executor.submit(runTimed, model.isTimingEnabled(), model.isTraceEnabled(), 0, 
+                                                 indexRaw, self.raw_file, self.getRawDirMap(), self.shared_scan_table, 
+                                                 self.task_control)
+
+    def update(self, executor):
+        if (self.shard_futures is not None or not self.future.done() 
+            or self.future.exception() is not None):
+            return
+
+        self.shard_futures = []
+        if self.task_control is not None and self.task_control.isCancelled():
+            return
+
+        margin             = self.getMargin()
+        for shard in self.getShards():
+            shard_tasks = []
+            shard_scans = []
+            for peptides_job, (start_idx, stop_idx) in zip(self.peptides_jobs, shard):
+                seq_peptides_reader = peptides_job.seq_peptides_reader
+                shard_tasks.append((peptides_job.experiment_task, 
+                                    seq_peptides_reader.getReaderForRaw(self.raw_file, start_idx, stop_idx)))
+                shard_scans.extend(seq_peptides_reader.getSortedStartScans(self.raw_file)[start_idx:stop_idx])
+
+            scan_window = (int(min(shard_scans)), int(max(shard_scans)), margin)
+            future      = executor.submit(runTimed, model.isTimingEnabled(), model.isTraceEnabled(), 
+                                          len(shard_tasks), identifyPairsInShard, self.raw_file, shard_tasks, 
+                                          self.shared_scan_table, scan_window, self.task_control)
+            self.shard_futures.append(future)
+            self.shard_sizes.append([stop_idx - start_idx for (start_idx, stop_idx) in shard])
+
+    def getFutures(self):
+        if self.shard_futures is None:
+            return [self.future]
+        return [self.future] + self.shard_futures
+
+    def isDone(self):
+        if not self.future.done():
+            return False
+
+        if self.future.exception() is not None:
+            return True
+
+        return self.shard_futures is not None and all([f.done() for f in self.shard_futures])
+
+    def getMatchedTables(self):
+        try:
+            self.addStageTimings(*self.future.result())
+            shard_tables_list = [self.addStageTimings(*f.result()) for f in self.shard_futures]
+
+        finally:
+            #the scan table is no longer needed once all shards have finished
+            shutil.rmtree(self.table_dir, ignore_errors=True)
+
+        matched_tables = []
+        for job_idx, peptides_job in enumerate(self.peptides_jobs):
+            #merge the shards in the same way as identifyPairsInRows
+            job_tables = []
+            for shard_tables, shard_sizes in zip(shard_tables_list, self.shard_sizes):
+                job_tables.append(shard_tables[job_idx])
+                if len(shard_tables[job_idx]) != shard_sizes[job_idx]:
+                    break
+            matched_table = pandas.concat(job_tables) if len(job_tables) != 0 else pandas.DataFrame()
+
+            #Reset indexes so that we can join the tables correctly
+            seq_peptides_reader              = peptides_job.seq_peptides_reader
+            sorted_seq_peptides_in_raw       = seq_peptides_reader.getSortedRowsInRaw(self.raw_file)
+            sorted_seq_peptides_in_raw.index = range(len(sorted_seq_peptides_in_raw))
+            matched_table = peptides_job.experiment_task.rearrangeOutput(seq_peptides_reader, 
+                                                                         sorted_seq_peptides_in_raw, 
+                                                                         matched_table)
+            matched_tables.append(matched_table)
+
+        return matched_tables
+
+#########################################################################################################
+
+""" Runs one of the functions below in a worker process, and returns 
+    (result, RAW file timings, [timings of each task]) so that the timings can be reported by the session.
+
+    Keyword arguments:
+    timing_enabled  -- Whether stages are timed (worker processes don't share the setting, See model.enableTiming)
+    trace_enabled   -- Whether PSMs are traced (See model.enableTrace). The traces are returned in the task timings
+    num_tasks       -- Number of (ExperimentTask, PeptidesReader) that the function searches
+    worker_function -- identifyPairsInRaw, indexRaw or identifyPairsInShard
+"""
+def runTimed(timing_enabled, trace_enabled, num_tasks, worker_function, *args, **kwargs):
+    model.enableTiming(timing_enabled)
+    model.enableTrace(trace_enabled)
+    raw_timings = model.StageTimings()
+    job_timings = [model.StageTimings() for i in range(num_tasks)]
+    result      = worker_function(*args, raw_timings=raw_timings, job_timings=job_timings, **kwargs)
+    return (result, raw_timings, job_timings)
+
+""" Search for SILAC pairs in a RAW file for all peptides files that reference it.
+    This is a module-level function so that it can be run in a worker process.
+    
+    Keyword arguments:
+    raw_file        -- Raw file that we want to look into
+    raw_tasks       -- List of (ExperimentTask, PeptidesReader) that reference the RAW file
+    raw_reader      -- Raw file reader for the RAW file, if it has already been opened
+    update_progress -- Function called with (peptide sequence, Raw file) before searching each row
+    task_control    -- TaskControl that can pause or cancel the search
+    raw_timings     -- StageTimings to add the opening and indexing of the RAW file to
+    job_timings     -- List of StageTimings to add the search of each task to
+"""
+def identifyPairsInRaw(raw_file, raw_tasks, raw_reader=None, update_progress=None, task_control=None, 
+                       raw_timings=None, job_timings=None):
+    if task_control is not None and task_control.checkPoint():
+        return [pandas.DataFrame()] * len(raw_tasks)
+
+    #nothing to search (e.g., all rows are in the result cache), so we don't need to open the RAW file
+    if all([len(r.getSortedRowsInRaw(raw_file)) == 0 for (t, r) in raw_tasks]):
+        return [pandas.DataFrame()] * len(raw_tasks)
+
+    #get a XR object containing all the RAW file information
+    if raw_reader is None:
+        (experiment_task, seq_peptides_reader) = raw_tasks[0]
+        raw_reader = RawReader(raw_file, experiment_task.raw_dir_map)
+    addRawTimings(raw_timings, raw_reader)
+
+    #the peptide tables in xr_info depend on the parameters (except for the scoring parameters), 
+    #so they need to be cleared whenever those parameters change
+    matched_tables  = []
+    parameter_tuple = None
+    for task_idx, (experiment_task, seq_peptides_reader) in enumerate(raw_tasks):
+        if parameter_tuple != experiment_task.parameters.getCorrelationParameterTuple():
+            raw_reader.xr_info.clearPeptideTables()
+            parameter_tuple = experiment_task.parameters.getCorrelationParameterTuple()
+
+        # Find matched peptides for a RAW 
+        previous_timings            = model.setStageTimings(getJobTimings(job_timings, task_idx))
+        matched_seq_peptides_in_raw = experiment_task.identifyPairsInRaw(seq_peptides_reader, raw_reader, 
+                                                                         update_progress, task_control)
+        matched_tables.append(matched_seq_peptides_in_raw)
+        model.setStageTimings(previous_timings)
+        addCacheStats(getJobTimings(job_timings, task_idx), raw_reader)
+
+    #the memo tables only live as long as the RAW file, so memory doesn't grow over a session
+    addMemoryUsage(raw_timings, raw_reader)
+    raw_reader.xr_info.clearTables()
+
+    # #since we are done with xr_info, close it
+    # raw_reader.closeRawReader()
+    return matched_tables
+
+""" Extract the information for ALL scans in a RAW file and share it with other processes
+    
+    Keyword arguments:
+    raw_file          -- Raw file that we want to look into
+    raw_dir_map       -- Table containing Raw dir paths -> {Raw file names}
+    shared_scan_table -- SharedScanTable to write the scan information to
+    task_control      -- TaskControl that can pause or cancel the session
+    raw_timings       -- StageTimings to add the opening and indexing of the RAW file to
+"""
+def indexRaw(raw_file, raw_dir_map, shared_scan_table, task_control=None, raw_timings=None, job_timings=None):
+    if task_control is not None and task_control.checkPoint():
+        return
+
+    raw_reader = RawReader(raw_file, raw_dir_map)
+    start_time = model.startTimer()
+    shared_scan_table.save(raw_reader.xr_info.scan_table)
+    model.stopTimer(model.STAGE_RAW_INDEX, start_time, 0, raw_reader.stage_timings)
+    addRawTimings(raw_timings, raw_reader)
+    addMemoryUsage(raw_timings, raw_reader)
+
+""" Search for SILAC pairs in a shard of a RAW file (See ShardedRawJob)
+    Unlike identifyPairsInRaw, the matched rows are not joined to the sequenced peptides.
+    
+    Keyword arguments:
+    raw_file          -- Raw file that we want to look into
+    shard_tasks       -- List of (ExperimentTask, PeptidesReader) containing the rows of the shard
+    shared_scan_table -- SharedScanTable containing the scan information of the RAW file
+    scan_window       -- (Start scan number, stop scan number, margin in minutes) of the shard
+    task_control      -- TaskControl that can pause or cancel the search
+    raw_timings       -- StageTimings to add the loading of the scan table to
+    job_timings       -- List of StageTimings to add the search of each task to
+"""
+def identifyPairsInShard(raw_file, shard_tasks, shared_scan_table, scan_window, task_control=None, 
+                         raw_timings=None, job_timings=None):
+    if task_control is not None and task_control.checkPoint():
+        return [pandas.DataFrame()] * len(shard_tasks)
+
+    (experiment_task, seq_peptides_reader) = shard_tasks[0]
+    raw_reader = RawReader(raw_file, experiment_task.raw_dir_map, shared_scan_table, scan_window)
+    addRawTimings(raw_timings, raw_reader)
+
+    matched_tables  = []
+    parameter_tuple = None
+    for task_idx, (experiment_task, seq_peptides_reader) in enumerate(shard_tasks):
+        if parameter_tuple != experiment_task.parameters.getCorrelationParameterTuple():
+            raw_reader.xr_info.clearPeptideTables()
+            parameter_tuple = experiment_task.parameters.getCorrelationParameterTuple()
+
+        sorted_seq_peptides_in_shard = seq_peptides_reader.getSortedRowsInRaw(raw_file)
+        previous_timings             = model.setStageTimings(getJobTimings(job_timings, task_idx))
+        matched_table = experiment_task.identifyPairsInRows(seq_peptides_reader, raw_reader, 
+                                                            sorted_seq_peptides_in_shard, 
+                                                            task_control=task_control)
+        matched_tables.append(matched_table)
+        model.setStageTimings(previous_timings)
+        addCacheStats(getJobTimings(job_timings, task_idx), raw_reader)
+
+    addMemoryUsage(raw_timings, raw_reader)
+    raw_reader.xr_info.clearTables()
+    return matched_tables
+
+""" Adds the time it took to open and index a RAW file (See io.RawReader)
+"""
+def addRawTimings(raw_timings, raw_reader):
+    if raw_timings is not None:
+        raw_timings.merge(raw_reader.stage_timings)
+
+""" Adds the memory held by the scan table and the memo tables of a RAW file, 
+    and the peak RSS of the process (See model.MemoryUsage). This is done whether or not stages are timed
+"""
+def addMemoryUsage(raw_timings, raw_reader):
+    if raw_timings is not None:
+        raw_timings.memory_usage.merge(raw_reader.xr_info.getMemoryUsage())
+
+""" Adds the hits, misses and size of the memo tables (See model.CacheStats) after searching a task. 
+    The tables are cleared when the parameters change, so their size is taken before that
+"""
+def addCacheStats(stage_timings, raw_reader):
+    if stage_timings is None or not model.isTimingEnabled():
+        return
+
+    for cache_name, cache_stats in raw_reader.xr_info.popCacheStats().items():
+        stage_timings.addCacheStats(cache_name, cache_stats)
+
+""" Returns the StageTimings of a task, or None if the stages are not timed
+"""
+def getJobTimings(job_timings, task_idx):
+    if job_timings is None:
+        return None
+    return job_timings[task_idx]
+
+#########################################################################################################
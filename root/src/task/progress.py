@@ -0,0 +1,203 @@
+#--------------------------------------------------------------------------------------------------------------------
+
+#This module contains task-related classes and functions for reporting the progress of a session
+
+#------------------ Dependencies ----------------------------#
+
+# Standard library imports
+import time
+
+# External imports
+
+# Internal imports
+from .constants import *
+
+#------------------ Global Variables ------------------------#
+
+#------------------ Classes & Functions ---------------------#
+
+""" Number of completed rows (PSMs) out of a total, for a RAW file, an experiment or the whole session
+"""
+class ProgressCount():
+
+    def __init__(self, name, num_total, start_time):
+        self.name          = name
+        self.num_total     = num_total
+        self.num_completed = 0
+        self.start_time    = start_time
+        self.curr_time     = start_time
+
+    def increment(self, num_steps, curr_time):
+        self.num_completed = min(self.num_completed + num_steps, self.num_total)
+        self.curr_time     = curr_time
+
+    def getFraction(self):
+        if self.num_total == 0:
+            return 1.0
+        return self.num_completed / self.num_total
+
+    """ Returns the number of rows completed per second
+    """
+    def getRate(self):
+        elapsed_time = self.curr_time - self.start_time
+        if elapsed_time <= 0:
+            return 0.0
+        return self.num_completed / elapsed_time
+
+    """ Returns the estimated number of seconds until all rows are completed (None if unknown)
+    """
+    def getEta(self):
+        rate = self.getRate()
+        if rate == 0:
+            return None
+        return (self.num_total - self.num_completed) / rate
+
+    def getEtaText(self):
+        eta = self.getEta()
+        if eta is None:
+            return "--:--:--"
+
+        (minutes, seconds) = divmod(int(round(eta)), 60)
+        (hours, minutes)   = divmod(minutes, 60)
+        return "%d:%02d:%02d" % (hours, minutes, seconds)
+
+    def __str__(self):
+        return "%s: %d/%d PSMs, %.1f PSMs/s, ETA %s" % (self.name, self.num_completed, self.num_total, 
+                                                         self.getRate(), self.getEtaText())
+
+#########################################################################################################
+
+""" Snapshot of the progress of a session that is sent to the UI
+"""
+class ProgressReport():
+
+    def __init__(self, raw_count, experiment_count, session_count):
+        self.raw_count        = raw_count           # ProgressCount of the current RAW file (None if there isn't one)
+        self.experiment_count = experiment_count    # ProgressCount of the current experiment (None if there isn't one)
+        self.session_count    = session_count       # ProgressCount of the whole session
+
+#########################################################################################################
+
+""" Aggregates the progress of a session and publishes it at most every interval milliseconds.
+
+    Rows are counted as they complete, but only a (copy of the) ProgressReport is sent 
+    to the UI every so often, instead of a message for every row.
+
+    Within a RAW file, the peptides jobs are searched one after the other, 
+    so completed rows are attributed to experiments in that order.
+"""
+class ProgressAggregator():
+
+    def __init__(self, send_message, experiment_list, interval=PROGRESS_INTERVAL_MS):
+        self.sendMessage      = send_message
+        self.experiment_list  = experiment_list
+        self.interval         = interval / 1000
+        self.last_report_time = None
+
+    def getTime(self):
+        return getTime()
+
+    """ Keyword arguments:
+        experiment_totals -- Table containing experiment index -> number of rows to search
+    """
+    def initSession(self, experiment_totals):
+        curr_time                   = self.getTime()
+        self.session_count          = ProgressCount("Session", sum(experiment_totals.values()), curr_time)
+        self.experiment_count_table = {}
+        for experiment_idx, num_total in experiment_totals.items():
+            experiment_name = self.experiment_list[experiment_idx].getExperimentName()
+            self.experiment_count_table[experiment_idx] = ProgressCount(experiment_name, num_total, curr_time)
+
+        self.raw_count      = None
+        self.raw_job_totals = []
+        self.curr_job_idx   = 0
+        self.publish(force=True)
+
+    """ Keyword arguments:
+        raw_file       -- Raw file that we are about to search
+        raw_job_totals -- List of (experiment index, number of rows) for each peptides job, in search order
+    """
+    def initRaw(self, raw_file, raw_job_totals):
+        self.setRaw(raw_file, raw_job_totals, self.getTime())
+        self.publish(force=True)
+
+    def increment(self, num_steps=1):
+        self.count(num_steps)
+        self.publish()
+
+    """ Mark all rows of a RAW file as completed. 
+        This is used when we only hear back once the RAW file has finished (i.e., from worker processes)
+
+        Keyword arguments:
+        raw_file       -- Raw file that has finished
+        raw_job_totals -- List of (experiment index, number of rows) for each peptides job, in search order
+        start_time     -- Time (See getTime) that the search of the RAW file started
+    """
+    def finishRaw(self, raw_file, raw_job_totals, start_time):
+        self.setRaw(raw_file, raw_job_totals, start_time)
+        self.count(self.raw_count.num_total)
+        self.publish(force=True)
+
+    def setRaw(self, raw_file, raw_job_totals, start_time):
+        num_total           = sum([num_rows for (experiment_idx, num_rows) in raw_job_totals])
+        self.raw_count      = ProgressCount(raw_file, num_total, start_time)
+        self.raw_job_totals = [[experiment_idx, num_rows] for (experiment_idx, num_rows) in raw_job_totals]
+        self.curr_job_idx   = 0
+
+    def count(self, num_steps):
+        curr_time = self.getTime()
+        self.raw_count.increment(num_steps, curr_time)
+        self.session_count.increment(num_steps, curr_time)
+
+        #attribute the completed rows to the peptides jobs (and their experiments) in order
+        while num_steps > 0 and self.curr_job_idx < len(self.raw_job_totals):
+            job_totals                 = self.raw_job_totals[self.curr_job_idx]
+            (experiment_idx, num_rows) = job_totals
+            num_job_steps              = min(num_steps, num_rows)
+            job_totals[1]             -= num_job_steps
+            num_steps                 -= num_job_steps
+            self.experiment_count_table[experiment_idx].increment(num_job_steps, curr_time)
+            if job_totals[1] == 0:
+                self.curr_job_idx += 1
+
+    def getCurrentExperimentCount(self):
+        if self.curr_job_idx < len(self.raw_job_totals):
+            (experiment_idx, num_rows) = self.raw_job_totals[self.curr_job_idx]
+            return self.experiment_count_table[experiment_idx]
+
+        elif len(self.raw_job_totals) != 0:
+            (experiment_idx, num_rows) = self.raw_job_totals[-1]
+            return self.experiment_count_table[experiment_idx]
+
+        return None
+
+    def publish(self, force=False):
+        curr_time = self.getTime()
+        if (not force and self.last_report_time is not None 
+            and (curr_time - self.last_report_time) < self.interval):
+            return
+
+        self.last_report_time = curr_time
+        progress_report = ProgressReport(copyCount(self.raw_count), 
+                                         copyCount(self.getCurrentExperimentCount()), 
+                                         copyCount(self.session_count))
+        self.sendMessage(UPDATE_PROGRESS_LISTENER, progress_report=progress_report)
+
+#########################################################################################################
+
+def getTime():
+    return time.monotonic()
+
+""" Returns a copy of a ProgressCount, so that the UI thread doesn't see it change underneath it
+"""
+def copyCount(progress_count):
+    if progress_count is None:
+        return None
+
+    progress_count_copy = ProgressCount(progress_count.name, progress_count.num_total, 
+                                        progress_count.start_time)
+    progress_count_copy.num_completed = progress_count.num_completed
+    progress_count_copy.curr_time     = progress_count.curr_time
+    return progress_count_copy
+
+#########################################################################################################
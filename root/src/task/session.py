@@ -0,0 +1,631 @@
+#--------------------------------------------------------------------------------------------------------------------
+
+#This module contains task-related classes and functions for running a session of MethylQuant experiments
+
+#------------------ Dependencies ----------------------------#
+
+# Standard library imports
+import os
+import json
+import hashlib
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+from concurrent.futures import FIRST_COMPLETED
+
+# External imports
+import pandas
+
+# Internal imports
+from .. import model
+from ..model import Experiment
+from ..io.reader import PeptidesReader
+from ..io.reader import RawPrefetcher
+from ..io.reader import getRawPath
+from ..io.reader import initRawThread
+from ..io.reader import closeRawThread
+from ..io.writer import CsvWriter
+from ..io.writer import CheckpointWriter
+from ..io.writer import getOutputPath
+from ..io.cache import ResultCache
+from ..io.cache import STAGE_CORRELATION
+from ..io.cache import STAGE_RESULT
+from .experiment import ExperimentTask
+from .pool import RawJob
+from .pool import ShardedRawJob
+from .pool import CachedRawJob
+from .pool import identifyPairsInRaw
+from .progress import ProgressAggregator
+from .control import TaskControl
+from .common import CORRELATION_RESULT_COLUMN_NAME
+from .constants import *
+
+#------------------ Global Variables ------------------------#
+
+#------------------ Classes & Functions ---------------------#
+
+""" Runs a list of experiments, opening each RAW file only once.
+
+    Rather than looping over experiments -> peptides files -> RAW files 
+    (and re-reading RAW files that are shared between peptides files/experiments), 
+    we loop over RAW files and serve every peptides file that references it. 
+    Output files are still written in the same order as before 
+    (i.e., sorted by RAW file name) so the results are unchanged.
+
+    RAW files are independent of each other, so they can also be 
+    processed by a pool of worker processes (num_workers > 1).
+    RAW files with many rows are split into shards of at least 
+    min_shard_size rows, which are processed by different workers.
+
+    All progress messages go through send_message (pubsub by default). 
+    When the session runs in a background thread, this is used to pass the messages 
+    to the GUI thread. When it runs headless, the messages are printed to the console instead.
+
+    The session can be paused, resumed or cancelled from another thread. 
+    If cancelled, the rows searched so far are still written and 
+    unfinished experiments are marked as PARTIAL.
+
+    A checkpoint is written beside each output file after every RAW file (See io.CheckpointWriter).
+    If resume is True, RAW files that were completed by a previous (interrupted) run 
+    with the same parameters and inputs are skipped, and the remaining results are appended.
+
+    If cache_path is given, the result of each row is kept in a persistent cache (See io.ResultCache). 
+    Only rows that are not in the cache are searched, and RAW files without any such rows are not opened.
+
+    If timing is enabled (See model.enableTiming), the time spent in each stage of the search 
+    is reported for each RAW file and each experiment (See getTimingReport). 
+    Opening and indexing a RAW file is shared by experiments, so it is only reported for the RAW file.
+
+    After each RAW file, the memory held by its scan table, memo tables and results, and the peak RSS, 
+    are sent to UPDATE_MEMORY_LISTENER (See model.MemoryUsage and getMemoryReport).
+
+    If trace_path is given, every PSM that is searched is traced (See model.PsmTrace), 
+    and its trace is written as a JSON line to that file in the background (See model.TraceWriter).
+"""
+class SessionTask():
+
+    def __init__(self, experiment_list, num_workers=DEFAULT_NUM_WORKERS, 
+                 min_shard_size=MIN_ROWS_PER_SHARD, prefetch_depth=DEFAULT_PREFETCH_DEPTH, 
+                 send_message=None, resume=False, cache_path=None, trace_path=None):
+        if send_message is None:
+            #pubsub is only needed by the GUI
+            from pubsub import pub
+            send_message = pub.sendMessage
+
+        self.experiment_list = experiment_list
+        self.sendMessage     = send_message
+        self.num_workers     = max(int(num_workers), 1)
+        self.min_shard_size  = max(int(min_shard_size), 1)
+        self.prefetch_depth  = max(int(prefetch_depth), 0)
+        self.resume_run      = resume     # Not self.resume, which would hide the resume method
+        self.cache_path      = cache_path
+        self.result_cache    = None
+        self.trace_path      = trace_path
+        self.trace_writer    = None
+        self.task_control    = TaskControl()
+        self.timing_report   = model.TimingReport()
+        self.memory_report   = {}       # Table containing Raw file name -> MemoryUsage
+
+    def run(self):
+        #the session may run in its own thread
+        initRawThread()
+        try:
+            self.initTrace()
+            self.initJobs()
+            self.initGauge()
+
+            #------------------ This is the heart of MethylQuant ----------------------------#
+            raw_keys = sorted(self.raw_job_table)
+            if self.num_workers > 1:
+                self.runParallel(raw_keys)
+            else:
+                self.runSerial(raw_keys)
+
+            self.progress_aggregator.publish(force=True)
+            if self.isCancelled():
+                self.stopExperiments(Experiment.PARTIAL)
+
+        # If, for whatever reason, we encounter an error, then update the status of unfinished experiments to FAILED
+        except:
+            self.stopExperiments(Experiment.FAILED)
+            raise
+
+        finally:
+            closeRawThread()
+            if self.result_cache is not None:
+                self.result_cache.close()
+            self.closeTrace()
+
+        #due to calculations with floating point numbers, 
+        #the task will finish before the gauge (progress bar) gets to the end. 
+        #this (attempts to) ensure that they occur simultaneously
+        self.sendMessage(UPDATE_GAUGE_LISTENER, filled=True)
+
+    def initTrace(self):
+        if self.trace_path is not None:
+            self.trace_writer = model.TraceWriter(self.trace_path)
+            model.enableTrace(True)
+
+    def closeTrace(self):
+        if self.trace_writer is not None:
+            model.enableTrace(False)
+            self.trace_writer.close()
+            self.trace_writer = None
+
+    def pause(self):
+        self.task_control.pause()
+
+    def resume(self):
+        self.task_control.resume()
+
+    def cancel(self):
+        self.task_control.cancel()
+
+    def isPaused(self):
+        return self.task_control.isPaused()
+
+    def isCancelled(self):
+        return self.task_control.isCancelled()
+
+    """ Creates the jobs and groups them by the RAW files that they reference (See createPeptidesJobs)
+    """
+    def initJobs(self):
+        self.peptides_job_list = self.createPeptidesJobs()
+        if self.cache_path is not None:
+            self.result_cache  = ResultCache(self.cache_path)
+
+        self.raw_job_table     = {}     # Table containing (Raw file name, Raw file path) -> [PeptidesJob]
+        self.pending_job_table = dict.fromkeys(range(len(self.experiment_list)), 0)
+        for peptides_job in self.peptides_job_list:
+            peptides_job.initWriter(self.resume_run)
+            if peptides_job.isDone():
+                continue
+
+            if self.result_cache is not None:
+                peptides_job.initCache(self.result_cache)
+
+            self.pending_job_table[peptides_job.experiment_idx] += 1
+            for raw_file in peptides_job.remaining_raw_files:
+                raw_path = getRawPath(raw_file, peptides_job.experiment_task.raw_dir_map)
+                self.raw_job_table.setdefault((raw_file, raw_path), []).append(peptides_job)
+
+        #experiments without any (remaining) jobs are already done
+        for experiment_idx, num_jobs in self.pending_job_table.items():
+            if num_jobs == 0:
+                self.updateExperimentStatus(experiment_idx)
+
+    """ Returns a job for each peptides file in each experiment.
+
+        If the same peptides file is used in more than one experiment,
+        only the last one is kept (they share the same output file, 
+        and previously the last one would overwrite the others anyway)
+    """
+    def createPeptidesJobs(self):
+        peptides_reader_table = {}      # Table containing peptides file paths -> PeptidesReader
+        peptides_job_table    = {}      # Table containing output file paths -> PeptidesJob
+        for experiment_idx, experiment in enumerate(self.experiment_list):
+            for seq_peptides_path in experiment.file_info.getPeptideFiles():
+                #reading the file SHOULD NOT error. 
+                #We already checked for this when the user inputs their files
+                if seq_peptides_path not in peptides_reader_table:
+                    peptides_reader_table[seq_peptides_path] = PeptidesReader(seq_peptides_path)
+
+                seq_peptides_reader = peptides_reader_table[seq_peptides_path]
+                peptides_job        = PeptidesJob(experiment_idx, experiment, 
+                                                  seq_peptides_path, seq_peptides_reader)
+                output_path         = getOutputPath(seq_peptides_path)
+                peptides_job_table.pop(output_path, None)
+                peptides_job_table[output_path] = peptides_job
+
+        return list(peptides_job_table.values())
+
+    def initGauge(self):
+        #reset the gauge (progress bar) 
+        experiment_totals = dict.fromkeys(range(len(self.experiment_list)), 0)
+        for raw_key in self.raw_job_table:
+            (raw_file, raw_path) = raw_key
+            for experiment_idx, num_rows in self.getRawJobTotals(raw_file, self.raw_job_table[raw_key]):
+                experiment_totals[experiment_idx] += num_rows
+
+        self.sendMessage(UPDATE_GAUGE_LISTENER, filled=False)
+        self.progress_aggregator = ProgressAggregator(self.sendMessage, self.experiment_list)
+        self.progress_aggregator.initSession(experiment_totals)
+
+    """ Search for SILAC pairs in each RAW file, one at a time.
+        
+        The next RAW file(s) are opened in the background while we search the current one
+        (See RawPrefetcher). RAW files without any rows to search are never opened
+    """
+    def runSerial(self, raw_keys):
+        raw_prefetcher = None
+        if self.prefetch_depth > 0:
+            raw_requests   = [(raw_key[0], self.getRawDirMap(raw_key)) for raw_key in raw_keys 
+                              if self.getNumRows(raw_key) != 0]
+            raw_prefetcher = RawPrefetcher(raw_requests, self.prefetch_depth)
+            raw_prefetcher.start()
+
+        try:
+            for raw_key in raw_keys:
+                if self.task_control.checkPoint():
+                    break
+
+                (raw_file, raw_path) = raw_key
+                peptides_jobs        = self.getPeptidesJobs(raw_key)
+                self.progress_aggregator.initRaw(raw_file, self.getRawJobTotals(raw_file, peptides_jobs))
+
+                raw_tasks      = [(j.experiment_task, j.seq_peptides_reader) for j in peptides_jobs]
+                raw_reader     = None
+                if raw_prefetcher is not None and self.getNumRows(raw_key) != 0:
+                    raw_reader = raw_prefetcher.getNextRawReader()
+                raw_timings    = model.StageTimings()
+                job_timings    = [model.StageTimings() for j in peptides_jobs]
+                matched_tables = identifyPairsInRaw(raw_file, raw_tasks, raw_reader, 
+                                                    self.updateProgress, self.task_control, 
+                                                    raw_timings, job_timings)
+                self.writeRaw(raw_file, peptides_jobs, matched_tables, raw_timings, job_timings)
+
+        finally:
+            if raw_prefetcher is not None:
+                raw_prefetcher.stop()
+
+    """ Search for SILAC pairs in each RAW file using a pool of worker processes.
+
+        Results are written in the same order as the serial path, 
+        i.e., we wait for the oldest RAW file even if a newer one finishes first.
+        The number of RAW files submitted at once is bounded, 
+        so that finished results don't pile up in memory.
+
+        Worker processes are paused/cancelled through a copy of 
+        the task control that is shared by a multiprocessing.Manager.
+    """
+    def runParallel(self, raw_keys):
+        max_pending_raws = self.num_workers * MAX_PENDING_RAWS_PER_WORKER
+        pending_raws     = deque()
+        with multiprocessing.Manager() as manager, \
+             ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+            shared_control = self.task_control.share(manager)
+            for raw_key in raw_keys:
+                if self.isCancelled():
+                    break
+
+                raw_job = self.createRawJob(raw_key, shared_control)
+                raw_job.submit(executor)
+                pending_raws.append(raw_job)
+
+                if len(pending_raws) >= max_pending_raws:
+                    self.finaliseRaw(self.waitForRaw(executor, pending_raws))
+
+            while len(pending_raws) != 0:
+                self.finaliseRaw(self.waitForRaw(executor, pending_raws))
+
+    def createRawJob(self, raw_key, task_control=None):
+        (raw_file, raw_path) = raw_key
+        raw_job    = RawJob(raw_file, self.getPeptidesJobs(raw_key), task_control)
+        num_shards = min(self.num_workers, raw_job.getNumRows() // self.min_shard_size)
+        if raw_job.getNumRows() == 0:
+            raw_job = CachedRawJob(raw_file, raw_job.peptides_jobs, task_control)
+        elif num_shards > 1:
+            raw_job = ShardedRawJob(raw_file, raw_job.peptides_jobs, num_shards, task_control)
+        return raw_job
+
+    """ Wait for the oldest RAW file to finish. 
+        
+        While waiting, we keep the pool busy by submitting the shards 
+        of any (newer) RAW files that have finished indexing.
+    """
+    def waitForRaw(self, executor, pending_raws):
+        raw_job = pending_raws[0]
+        while True:
+            for pending_raw_job in pending_raws:
+                pending_raw_job.update(executor)
+
+            if raw_job.isDone():
+                break
+
+            futures = [f for j in pending_raws for f in j.getFutures() if not f.done()]
+            wait(futures, return_when=FIRST_COMPLETED)
+
+        return pending_raws.popleft()
+
+    def updateProgress(self, peptide_seq, raw_file):
+        #update gauge (progress bar) and status text (at most every PROGRESS_INTERVAL_MS)
+        self.progress_aggregator.increment()
+
+    def finaliseRaw(self, raw_job):
+        matched_tables             = raw_job.getMatchedTables()
+        (raw_timings, job_timings) = raw_job.getStageTimings()
+        self.writeRaw(raw_job.raw_file, raw_job.peptides_jobs, matched_tables, raw_timings, job_timings)
+
+        #update gauge (progress bar) and status text
+        raw_job_totals = self.getRawJobTotals(raw_job.raw_file, raw_job.peptides_jobs)
+        self.progress_aggregator.finishRaw(raw_job.raw_file, raw_job_totals, raw_job.start_time)
+
+    """ Returns the jobs that reference a RAW file. 
+        Jobs with the same parameters are kept together 
+        (See identifyPairsInRaw)
+        
+        Keyword arguments:
+        raw_key -- (Raw file name, Raw file path)
+    """
+    def getPeptidesJobs(self, raw_key):
+        f = lambda x: x.experiment_task.parameters.getParameterTuple()
+        return sorted(self.raw_job_table[raw_key], key=f)
+
+    """ Returns a list of (experiment index, number of rows) for each peptides job in a RAW file
+    """
+    def getRawJobTotals(self, raw_file, peptides_jobs):
+        f = lambda x: (x.experiment_idx, len(x.seq_peptides_reader.getSortedRowsInRaw(raw_file)))
+        return list(map(f, peptides_jobs))
+
+    """ Returns the number of rows to search in a RAW file (over all peptides jobs)
+    """
+    def getNumRows(self, raw_key):
+        (raw_file, raw_path) = raw_key
+        return sum([num_rows for (experiment_idx, num_rows) in self.getRawJobTotals(raw_file, self.raw_job_table[raw_key])])
+
+    def getRawDirMap(self, raw_key):
+        return self.raw_job_table[raw_key][0].experiment_task.raw_dir_map
+
+    """ Reports the memory used by a RAW file, then writes its results for each peptides job, 
+        and adds their timings to the timing report (and their PSM traces to the trace file)
+
+        Keyword arguments:
+        raw_file       -- Raw file name
+        peptides_jobs  -- List of PeptidesJob that reference the RAW file
+        matched_tables -- List of the matched rows for each peptides job
+        raw_timings    -- StageTimings of opening and indexing the RAW file
+        job_timings    -- List of StageTimings of each peptides job
+    """
+    def writeRaw(self, raw_file, peptides_jobs, matched_tables, raw_timings, job_timings):
+        memory_usage = self.getMemoryUsage(raw_timings, matched_tables)
+        self.memory_report[raw_file] = memory_usage
+        self.sendMessage(UPDATE_MEMORY_LISTENER, raw_file=raw_file, memory_usage=memory_usage)
+
+        self.timing_report.addRaw(raw_file, raw_timings)
+        for peptides_job, matched_seq_peptides_in_raw, stage_timings in zip(peptides_jobs, matched_tables, job_timings):
+            previous_timings = model.setStageTimings(stage_timings)
+            peptides_job.writeRaw(raw_file, matched_seq_peptides_in_raw)
+            model.setStageTimings(previous_timings)
+
+            experiment = self.experiment_list[peptides_job.experiment_idx]
+            self.writeTraces(experiment, peptides_job, stage_timings.popPsmTraces())
+            self.timing_report.addRaw(raw_file, stage_timings)
+            self.timing_report.addExperiment(experiment.getExperimentName(), stage_timings)
+            if peptides_job.isDone():
+                self.finaliseJob(peptides_job)
+
+    """ Returns the MemoryUsage of a RAW file (See pool.addMemoryUsage), with the size of its results.
+        Worker processes report their own peak RSS, so the session's is added separately
+    """
+    def getMemoryUsage(self, raw_timings, matched_tables):
+        memory_usage = raw_timings.memory_usage
+        memory_usage.add(model.MEMORY_PENDING_RESULTS, model.getTablesSize(matched_tables))
+        if self.num_workers > 1:
+            memory_usage.session_peak_rss = model.getPeakRss()
+        else:
+            memory_usage.peak_rss = model.getPeakRss()
+        return memory_usage
+
+    def writeTraces(self, experiment, peptides_job, psm_traces):
+        if self.trace_writer is None or len(psm_traces) == 0:
+            return
+
+        trace_fields = {"experiment": experiment.getExperimentName()}
+        trace_fields.update(peptides_job.getTraceFields())
+        self.trace_writer.writeRecords([dict(trace_fields, **r) for r in psm_traces])
+
+    """ Returns the TimingReport of the session (empty unless timing is enabled, See model.enableTiming)
+    """
+    def getTimingReport(self):
+        return self.timing_report
+
+    """ Returns a table of Raw file name -> MemoryUsage, for each RAW file written so far
+    """
+    def getMemoryReport(self):
+        return self.memory_report
+
+    def finaliseJob(self, peptides_job):
+        self.pending_job_table[peptides_job.experiment_idx] -= 1
+        if self.pending_job_table[peptides_job.experiment_idx] == 0:
+            self.updateExperimentStatus(peptides_job.experiment_idx)
+
+    """ Update the status of unfinished experiments
+    
+        Keyword arguments:
+        experiment_status -- Experiment.FAILED or Experiment.PARTIAL
+    """
+    def stopExperiments(self, experiment_status):
+        if not hasattr(self, 'pending_job_table'):
+            return
+
+        for experiment_idx, num_jobs in self.pending_job_table.items():
+            if num_jobs != 0:
+                self.updateExperimentStatus(experiment_idx, experiment_status)
+
+    def updateExperimentStatus(self, experiment_idx, experiment_status=None):
+        if experiment_status is None:
+            experiment_status = Experiment.PASSED
+        self.sendMessage(UPDATE_EXPERIMENT_STATUS_LISTENER, 
+                         experiment_idx=experiment_idx, experiment_status=experiment_status)
+
+#########################################################################################################
+
+""" Quantification of a single peptides file within an experiment
+
+    If there is a result cache, seq_peptides_reader only contains the rows that need to be searched.
+    The cached results are merged back in (in order) before each RAW file is written.
+"""
+class PeptidesJob():
+
+    def __init__(self, experiment_idx, experiment, seq_peptides_path, seq_peptides_reader):
+        self.experiment_idx          = experiment_idx
+        self.experiment_task         = ExperimentTask(experiment)
+        self.seq_peptides_path       = seq_peptides_path
+        self.seq_peptides_reader     = seq_peptides_reader
+        self.all_seq_peptides_reader = seq_peptides_reader     # Includes the rows that are in the result cache
+        self.seq_peptides_writer     = None
+        self.checkpoint_writer       = None
+        self.has_incomplete_raw      = False    # True once a RAW file has not been (completely) written
+        self.result_cache            = None
+        self.cached_results          = {}       # Table containing Raw file name -> (result keys, correlation keys, {result key -> result})
+        self.raw_files               = seq_peptides_reader.getDataFiles()
+        self.remaining_raw_files     = set(self.raw_files)
+        self.raw_sizes               = {r: len(seq_peptides_reader.getSortedRowsInRaw(r)) for r in self.raw_files}
+        self.experiment_task.initPeptidesFile(seq_peptides_path)
+
+    def isDone(self):
+        return len(self.remaining_raw_files) == 0
+
+    """ Returns the fields that are added to the trace of each PSM of the job (See SessionTask.writeTraces)
+    """
+    def getTraceFields(self):
+        return {"peptides_file": self.seq_peptides_path}
+
+    def initWriter(self, resume=False):
+        output_path            = getOutputPath(self.seq_peptides_path)
+        self.checkpoint_writer = CheckpointWriter(output_path, self.getInputHash())
+
+        #skip the RAW files that have already been written (if we can)
+        if resume and self.checkpoint_writer.load():
+            self.remaining_raw_files.difference_update(self.checkpoint_writer.completed_raw_files)
+
+        #create the output table for results
+        self.seq_peptides_writer = CsvWriter(self.seq_peptides_path, self.checkpoint_writer.output_size)
+        self.checkpoint_writer.save()
+
+    """ Looks up the results of the remaining RAW files in the result cache, 
+        and only keeps the rows that are not in the cache in seq_peptides_reader.
+
+        Rows that were searched before with different scoring parameters (e.g., Pearson threshold) 
+        only need to be scored again, which doesn't need the RAW file
+    """
+    def initCache(self, result_cache):
+        experiment_task   = self.experiment_task
+        self.result_cache = result_cache
+        raw_rows          = {}      # Table containing Raw file name -> [Row positions that are not cached]
+        for raw_file in self.remaining_raw_files:
+            raw_stat       = getFileStat(getRawPath(raw_file, experiment_task.raw_dir_map))
+            (result_keys, correlation_keys, mass_shifts) \
+                           = experiment_task.getResultKeys(self.all_seq_peptides_reader, raw_file, raw_stat)
+            cached_results = result_cache.getResults(result_keys, STAGE_RESULT)
+
+            #score the rows whose correlation results are cached
+            uncached_rows       = [i for (i, k) in enumerate(result_keys) if k not in cached_results]
+            cached_correlations = result_cache.getResults([correlation_keys[i] for i in uncached_rows], 
+                                                          STAGE_CORRELATION)
+            scored_results      = {}
+            for row_idx in uncached_rows:
+                if correlation_keys[row_idx] in cached_correlations:
+                    scored_results[result_keys[row_idx]] \
+                        = experiment_task.scorePair(self.all_seq_peptides_reader, 
+                                                    cached_correlations[correlation_keys[row_idx]], 
+                                                    mass_shifts[row_idx])
+            result_cache.putResults(scored_results, STAGE_RESULT)
+            cached_results.update(scored_results)
+
+            self.cached_results[raw_file] = (result_keys, correlation_keys, cached_results)
+            raw_rows[raw_file]            = [i for (i, k) in enumerate(result_keys) if k not in cached_results]
+
+        #the searched rows also return their correlation results, so that they can be cached
+        experiment_task.keep_correlation_results = True
+        self.seq_peptides_reader = self.all_seq_peptides_reader.getReaderForRows(raw_rows)
+
+    """ Returns the results of a RAW file with the cached results merged back in, 
+        and adds the new results to the cache.
+        
+        As with a cancelled search, the results stop at the first row that was not searched 
+        (so a cached row is never written after a missing one)
+    """
+    def mergeCachedResults(self, raw_file, matched_seq_peptides_in_raw):
+        (result_keys, correlation_keys, cached_results) = self.cached_results.pop(raw_file)
+        sorted_seq_peptides_in_raw       = self.all_seq_peptides_reader.getSortedRowsInRaw(raw_file)
+        sorted_seq_peptides_in_raw.index = range(len(sorted_seq_peptides_in_raw))
+
+        #MethylQuant's columns come after the columns of the sequenced peptides file 
+        num_columns         = len(sorted_seq_peptides_in_raw.columns)
+        searched_table      = matched_seq_peptides_in_raw.iloc[:, num_columns:]
+        correlation_results = iter([])
+        if CORRELATION_RESULT_COLUMN_NAME in searched_table.columns:
+            correlation_results = iter(searched_table[CORRELATION_RESULT_COLUMN_NAME].tolist())
+            searched_table      = searched_table.drop(CORRELATION_RESULT_COLUMN_NAME, axis=1)
+        result_columns      = tuple(searched_table.columns)
+        searched_results    = searched_table.itertuples(index=False, name=None)
+
+        results                 = []
+        new_results             = {}
+        new_correlation_results = {}
+        for result_key, correlation_key in zip(result_keys, correlation_keys):
+            if result_key in cached_results:
+                (result_columns, result_values) = cached_results[result_key]
+            else:
+                result_values = next(searched_results, None)
+                if result_values is None:
+                    break
+                new_results[result_key]                 = (result_columns, result_values)
+                new_correlation_results[correlation_key] = next(correlation_results)
+            results.append(result_values)
+
+        self.result_cache.putResults(new_correlation_results, STAGE_CORRELATION)
+        self.result_cache.putResults(new_results, STAGE_RESULT)
+        if len(results) == 0:
+            return sorted_seq_peptides_in_raw.iloc[:0]
+
+        result_table = pandas.DataFrame(results, columns=list(result_columns))
+        return sorted_seq_peptides_in_raw.iloc[:len(results)].join(result_table)
+
+    """ Returns a hash of everything that the output depends on.
+        Files are identified by their path, size and modification time (RAW files are too big to read)
+    """
+    def getInputHash(self):
+        experiment_task = self.experiment_task
+        raw_paths       = [getRawPath(r, experiment_task.raw_dir_map) for r in sorted(self.raw_files)]
+        inputs          = [experiment_task.parameters.getParameterTuple(),
+                           sorted(experiment_task.mass_shifts.label_set),
+                           sorted(experiment_task.mass_shifts.mod_set),
+                           experiment_task.silac_type, experiment_task.output_style,
+                           [getFileStat(p) for p in [self.seq_peptides_path] + raw_paths]]
+        return hashlib.sha256(json.dumps(inputs).encode()).hexdigest()
+
+    def writeRaw(self, raw_file, matched_seq_peptides_in_raw):
+        if raw_file in self.cached_results:
+            matched_seq_peptides_in_raw = self.mergeCachedResults(raw_file, matched_seq_peptides_in_raw)
+
+        # Write the results for a RAW to file 
+        # This is based on original sequenced peptides file, just with extra columns
+        # Nothing was searched if the session was cancelled before we got to the RAW file
+        if len(matched_seq_peptides_in_raw) != 0:
+            start_time = model.startTimer()
+            self.seq_peptides_writer.writeFile(self.formatOutput(matched_seq_peptides_in_raw))
+            model.stopTimer(model.STAGE_OUTPUT, start_time, len(matched_seq_peptides_in_raw))
+
+        #the RAW file is only done if all of its rows were searched
+        if len(matched_seq_peptides_in_raw) != self.raw_sizes[raw_file]:
+            self.has_incomplete_raw = True
+            return
+
+        self.remaining_raw_files.discard(raw_file)
+
+        #a resumed run appends to the end of the checkpoint, 
+        #so it can't include anything written after an incomplete RAW file
+        if not self.has_incomplete_raw and self.checkpoint_writer is not None:
+            self.checkpoint_writer.addRawFile(raw_file)
+
+    """ Returns the results of a RAW file as they are written to the output file
+    """
+    def formatOutput(self, matched_seq_peptides_in_raw):
+        return matched_seq_peptides_in_raw
+
+#########################################################################################################
+
+""" Returns (path, size, modification time) of a file, or (path, None, None) if it doesn't exist
+"""
+def getFileStat(file_path):
+    try:
+        file_stat = os.stat(file_path)
+        return (str(file_path), file_stat.st_size, file_stat.st_mtime)
+
+    except OSError:
+        return (str(file_path), None, None)
+
+#########################################################################################################
@@ -0,0 +1,91 @@
+#--------------------------------------------------------------------------------------------------------------------
+
+#This module contains task-related classes and functions for parameter sweeps
+
+#------------------ Dependencies ----------------------------#
+
+# Standard library imports
+
+# External imports
+
+# Internal imports
+from ..io.writer import CsvWriter
+from ..io.writer import getSweepOutputPath
+from .session import SessionTask
+from .session import PeptidesJob
+from .common import PARAMETER_SET_COLUMN_NAME
+from .common import PARAMETER_COLUMN_NAMES
+from .constants import *
+
+#------------------ Global Variables ------------------------#
+
+#------------------ Classes & Functions ---------------------#
+
+""" Runs every experiment with each of a list of Parameters (e.g., a grid of mass errors and time windows).
+
+    Each (peptides file, parameter set) is a job of the session, so each RAW file is still
+    only opened and indexed once and every parameter set is searched against the same scan table.
+    Jobs with the same correlation parameters are kept together, so they share the peptide tables
+    of the RAW file, and sharded RAW files load the scans for the widest time window of all parameter sets.
+    With a result cache, parameter sets that only differ in their scoring parameters
+    (Pearson threshold) are just scored again (See io.ResultCache).
+
+    The results for each peptides file are written to one table (See io.getSweepOutputPath),
+    with the parameter set (starting at 1) and its parameters in the first columns.
+    The parameters of the experiments themselves are ignored.
+"""
+class SweepTask(SessionTask):
+
+    def __init__(self, experiment_list, parameters_list, num_workers=DEFAULT_NUM_WORKERS,
+                 min_shard_size=MIN_ROWS_PER_SHARD, prefetch_depth=DEFAULT_PREFETCH_DEPTH,
+                 send_message=None, cache_path=None, trace_path=None):
+        SessionTask.__init__(self, experiment_list, num_workers, min_shard_size, prefetch_depth,
+                             send_message, resume=False, cache_path=cache_path, trace_path=trace_path)
+        self.parameters_list = list(parameters_list)
+
+    """ Returns a job for each parameter set of each peptides file (See SessionTask.createPeptidesJobs)
+    """
+    def createPeptidesJobs(self):
+        sweep_job_list = []
+        for peptides_job in SessionTask.createPeptidesJobs(self):
+            experiment = self.experiment_list[peptides_job.experiment_idx]
+            for parameter_set_idx, parameters in enumerate(self.parameters_list):
+                sweep_job_list.append(SweepJob(peptides_job.experiment_idx, experiment,
+                                               peptides_job.seq_peptides_path, peptides_job.seq_peptides_reader,
+                                               parameter_set_idx + 1, parameters))
+        return sweep_job_list
+
+#########################################################################################################
+
+""" Quantification of a single peptides file with one parameter set of a sweep.
+    All parameter sets of a peptides file write to the same output file (without checkpoints)
+"""
+class SweepJob(PeptidesJob):
+
+    def __init__(self, experiment_idx, experiment, seq_peptides_path, seq_peptides_reader,
+                 parameter_set, parameters):
+        PeptidesJob.__init__(self, experiment_idx, experiment, seq_peptides_path, seq_peptides_reader)
+        self.parameter_set              = parameter_set
+        self.experiment_task.parameters = parameters
+
+    def getTraceFields(self):
+        trace_fields = PeptidesJob.getTraceFields(self)
+        trace_fields["parameter_set"] = self.parameter_set
+        return trace_fields
+
+    def initWriter(self, resume=False):
+        #nothing has been written yet, so every job of the peptides file can (re)create the output file
+        self.seq_peptides_writer = CsvWriter(self.seq_peptides_path,
+                                             output_path=getSweepOutputPath(self.seq_peptides_path))
+
+    def formatOutput(self, matched_seq_peptides_in_raw):
+        parameter_tuple = self.experiment_task.parameters.getParameterTuple()
+        sweep_columns   = [PARAMETER_SET_COLUMN_NAME] + list(PARAMETER_COLUMN_NAMES)
+        sweep_values    = [self.parameter_set] + list(parameter_tuple)
+
+        matched_seq_peptides_in_raw = matched_seq_peptides_in_raw.copy()
+        for column_idx, (column_name, value) in enumerate(zip(sweep_columns, sweep_values)):
+            matched_seq_peptides_in_raw.insert(column_idx, column_name, value)
+        return matched_seq_peptides_in_raw
+
+#########################################################################################################
@@ -7,16 +7,36 @@
 ## External dependencies
 import unittest
 import os
+import json
+import numpy
 import pandas
 import filecmp
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import Future
+import signal
 
 ## Internal dependencies
 from mq.io.reader import PeptidesReader, RawReader, MzIdentMlReader
-from mq.io.writer import CsvWriter
-from mq.model.core import MassShifts
+from mq.io.writer import CsvWriter, CheckpointWriter, getSweepOutputPath
+from mq.io.experiments import getDefinition, createExperiment, upgradeDefinitions
+from mq.io.cache import ResultCache, getResultKey
+from mq.io.synthetic import writeSyntheticRaw
+from mq.model.core import MassShifts, Parameters
 from mq.model.menu import DEFAULT_LABEL_LIST, DEFAULT_MOD_LIST
+from mq.model.constants import ID_HEAVY, ID_FULL
 from mq.task.experiment import CorrelationTask
+from mq.task.equivalence import OutputDiff
+from mq.task.session import PeptidesJob
+from mq.task.pool import ShardedRawJob, identifyPairsInRaw
+from mq.task.control import TaskControl
+from mq.task.common import PARAMETER_SET_COLUMN_NAME, PARAMETER_COLUMN_NAMES
+from mq.console import createParser, createExperiments, createParametersList, EXIT_CANCELLED
+from mq.console import main as consoleMain
 import mq.task as mqt
+import mq.model as mqm
 
 #------------------- Global Variables -----------------------#
 
@@ -31,6 +51,62 @@ PEPTIDE_FILE_PATH_5 = DIR_PATH + "\\" + "test_file_05.csv"
 PEPTIDE_FILE_PATH_6 = DIR_PATH + "\\" + "test_file_06.csv"
 PEPTIDE_FILE_PATH_7 = DIR_PATH + "\\" + "nostaingels_orbi_metK.mzid" 
 
+# The root element's attributes are filled in (e.g., the default namespace, See TestMzIdentMlReader)
+MZID_DOCUMENT = """<?xml version="1.0" encoding="UTF-8"?>
+<MzIdentML id="test" version="1.1.0" %s>
+  <SequenceCollection>
+    <DBSequence id="DBSeq_A" accession="A">
+      <cvParam accession="MS:1001088" name="protein description" cvRef="PSI-MS" value="Protein A"/>
+    </DBSequence>
+    <DBSequence id="DBSeq_B" accession="B">
+      <cvParam accession="MS:1001088" name="protein description" cvRef="PSI-MS" value="Protein B"/>
+    </DBSequence>
+    <Peptide id="peptide_1">
+      <PeptideSequence>PEPTMIDEK</PeptideSequence>
+      <Modification location="4" residues="M" monoisotopicMassDelta="15.994915">
+        <cvParam accession="UNIMOD:35" name="Oxidation" cvRef="UNIMOD"/>
+      </Modification>
+    </Peptide>
+    <Peptide id="peptide_2">
+      <PeptideSequence>KDDAVR</PeptideSequence>
+    </Peptide>
+    <PeptideEvidence id="PE_1" peptide_ref="peptide_1" dBSequence_ref="DBSeq_A" isDecoy="false"/>
+    <PeptideEvidence id="PE_2" peptide_ref="peptide_2" dBSequence_ref="DBSeq_B" isDecoy="false"/>
+  </SequenceCollection>
+  <DataCollection>
+    <Inputs>
+      <SpectraData location="/data/20140120_001.raw" id="SD_1"/>
+      <SpectraData location="/data/20140120_002.raw" id="SD_2"/>
+    </Inputs>
+    <AnalysisData>
+      <SpectrumIdentificationList id="SIL_1">
+        <SpectrumIdentificationResult id="SIR_1" spectrumID="index=1" spectraData_ref="SD_1">
+          <SpectrumIdentificationItem id="SII_1_1" calculatedMassToCharge="500.25" chargeState="2" peptide_ref="peptide_1" rank="1">
+            <PeptideEvidenceRef peptideEvidence_ref="PE_1"/>
+            <cvParam accession="MS:1001171" name="Mascot:score" cvRef="PSI-MS" value="23.86"/>
+          </SpectrumIdentificationItem>
+          <SpectrumIdentificationItem id="SII_1_2" calculatedMassToCharge="350.19" chargeState="3" peptide_ref="peptide_2" rank="2">
+            <PeptideEvidenceRef peptideEvidence_ref="PE_2"/>
+          </SpectrumIdentificationItem>
+          <cvParam accession="MS:1000796" name="spectrum title" cvRef="PSI-MS" value="Spectrum1 scans:1916,"/>
+        </SpectrumIdentificationResult>
+        <SpectrumIdentificationResult id="SIR_2" spectrumID="index=2" spectraData_ref="SD_2">
+          <SpectrumIdentificationItem id="SII_2_1" calculatedMassToCharge="351.2" chargeState="2" peptide_ref="peptide_2" rank="1">
+            <PeptideEvidenceRef peptideEvidence_ref="PE_2"/>
+          </SpectrumIdentificationItem>
+          <cvParam accession="MS:1000796" name="spectrum title" cvRef="PSI-MS" value="Spectrum2 scans:2020,"/>
+        </SpectrumIdentificationResult>
+      </SpectrumIdentificationList>
+      <ProteinDetectionList id="PDL_1">
+        <ProteinAmbiguityGroup id="PAG_1">
+          <ProteinDetectionHypothesis id="PDH_1" dBSequence_ref="DBSeq_A" passThreshold="true"/>
+        </ProteinAmbiguityGroup>
+      </ProteinDetectionList>
+    </AnalysisData>
+  </DataCollection>
+</MzIdentML>
+"""
+
 #------------------ Classes & Functions ---------------------#
 """ Class for testing functionality of PeptideReader
 """
@@ -69,6 +145,60 @@ class TestPeptideReader(unittest.TestCase):
   
         self.assertEquals(total, len(csv_reader.seq_peptides)) 
 
+    def testSortedRowsInRaw(self):
+        data_dir          = tempfile.mkdtemp()
+        seq_peptides_path = os.path.join(data_dir, "peptides.csv")
+        self.addCleanup(shutil.rmtree, data_dir, ignore_errors=True)
+
+        #.RAW files are interleaved, and rows with the same start scan are numbered in their original order
+        pandas.DataFrame({"Sequence":      ["PEPMK%d" % i for i in range(7)],
+                          "Modifications": "",
+                          "Charge":        2,
+                          "Data File":     ["b.raw", "a.raw", "b.raw", "a.raw", "b.raw", "a.raw", "b.raw"],
+                          "Start Scan":    [300, 200, 100, 200, 300, 50, 300],
+                          "Calc m/z":      500.25}).to_csv(seq_peptides_path, index=False)
+
+        csv_reader = PeptidesReader(seq_peptides_path)
+        self.assertEqual(csv_reader.getDataFiles(), set(["a.raw", "b.raw"]))
+        self.assertEqual(csv_reader.raw_indices, {"a.raw": (0, 3), "b.raw": (3, 7)})
+        self.assertEqual(list(csv_reader.getSortedRowsInRaw("a.raw")["Sequence"]), ["PEPMK5", "PEPMK1", "PEPMK3"])
+        self.assertEqual(list(csv_reader.getSortedRowsInRaw("b.raw")["Sequence"]), 
+                         ["PEPMK2", "PEPMK0", "PEPMK4", "PEPMK6"])
+        self.assertEqual(list(csv_reader.getSortedStartScans("b.raw")), [100, 300, 300, 300])
+
+#########################################################################################################
+
+""" Class for testing functionality of a MzIdentMlReader, with a minimal mzIdentML file (See MZID_DOCUMENT)
+"""
+class TestMzIdentMlReader(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def readTable(self, namespace_attribute):
+        mzid_path = os.path.join(self.data_dir, "peptides.mzid")
+        with open(mzid_path, "w") as mzid_file:
+            mzid_file.write(MZID_DOCUMENT % namespace_attribute)
+        return MzIdentMlReader(mzid_path).seq_peptides_table
+
+    def checkTable(self, seq_peptides_table):
+        #one row per SpectrumIdentificationItem, in the order of the file
+        self.assertEqual(seq_peptides_table.values.tolist(), 
+                         [["Protein A", "PEPTMIDEK", "M4(Oxidation)", 2, "20140120_001.raw", 1916, 500.25], 
+                          ["Protein B", "KDDAVR", "", 3, "20140120_001.raw", 1916, 350.19], 
+                          ["Protein B", "KDDAVR", "", 2, "20140120_002.raw", 2020, 351.2]])
+        self.assertEqual([str(t) for t in seq_peptides_table.dtypes], 
+                         ["object", "object", "object", "int64", "object", "int64", "float64"])
+
+    def testNamespace(self):
+        self.checkTable(self.readTable('xmlns="http://psidev.info/psi/pi/mzIdentML/1.1"'))
+
+    def testNoNamespace(self):
+        self.checkTable(self.readTable(""))
+
 #########################################################################################################
 
 """ Class for testing functionality of a CsvWriter   
@@ -149,6 +279,79 @@ class TestRawReader(unittest.TestCase):
 
 #########################################################################################################
 
+""" Class for testing a RawReader on a synthetic RAW file (See benchmarks/dataset.py)
+"""
+class TestSyntheticRaw(unittest.TestCase):
+
+    def setUp(self):
+        self.raw_dir  = tempfile.mkdtemp()
+        self.raw_file = "synthetic_01.raw"
+        self.raw_dirs = {self.raw_dir: set([self.raw_file])}
+
+        #MS1, MS/MS, MS1 with 2, 1 and 2 peaks
+        writeSyntheticRaw(os.path.join(self.raw_dir, self.raw_file), 
+                          numpy.array([0.01, 0.02, 0.03]), numpy.array([1, 2, 1]), numpy.array([0, 500.25, 0]),
+                          numpy.array([0, 2, 3, 5]), numpy.array([500.25, 502.26, 150.0, 500.250001, 502.26]), 
+                          numpy.array([100, 50, 10, 300, 0], dtype=numpy.float32))
+
+    def tearDown(self):
+        shutil.rmtree(self.raw_dir)
+
+    def testInit(self):
+        raw_reader = RawReader(self.raw_file, self.raw_dirs)
+        xr         = raw_reader.xr_info.xr
+        self.assertEqual(raw_reader.xr_info.getNumSpectra(), 3)
+        self.assertEqual(xr.GetMSOrderForScanNum(2), 2)
+        self.assertEqual(xr.GetPrecursorMassForScanNum(2, 2), 500.25)
+        self.assertEqual(xr.ScanNumFromRT(0.026), 3)
+        self.assertEqual(list(xr.GetMassListFromScanNum(2)[0][0]), [150.0])
+
+        #the 500.25 peaks are merged, and the MS/MS scan is left out
+        ((masses, intensities), pl) = xr.GetAverageMassList(1, 3)
+        self.assertEqual(len(masses), 2)
+        self.assertAlmostEqual(masses[0], 500.25000075, places=8)
+        self.assertEqual(list(intensities), [200, 25])
+        raw_reader.closeRawReader()
+
+#########################################################################################################
+
+""" Writes a tiny synthetic dataset to data_dir: a synthetic RAW file for each name in raw_files,
+    and a sequenced peptides file (.CSV) with a row for each start scan in each RAW file.
+    Returns the path of the sequenced peptides file.
+
+    Each RAW file has 20 cycles of an MS1 scan and an MS/MS scan (so start scans are even numbers).
+    The light (500.25 m/z) and heavy (M residue, 2+) isotope envelopes of PEPTMIDEK elute over the MS1 scans
+    in the middle of the run, and are 0 at either end. Every MS1 scan also has a background peak (400 m/z)
+"""
+def writeSyntheticDataset(data_dir, raw_files, start_scans=(14, 20, 20, 26)):
+    num_cycles  = 20
+    scan_rts    = 0.01 + numpy.arange(2 * num_cycles) * 0.01
+    scan_types  = numpy.tile([1, 2], num_cycles)
+    mzs         = numpy.concatenate([[400.0], 500.25 + numpy.arange(3) * 0.501675, 
+                                     502.2610925 + numpy.arange(3) * 0.501675])
+    cycle_nums  = numpy.arange(num_cycles) - num_cycles / 2
+    elution     = numpy.where(abs(cycle_nums) <= 6, 1e6 * numpy.exp(-0.5 * (cycle_nums / 3.0) ** 2), 0)
+    intensities = elution[:, None] * numpy.array([0, 1.0, 0.6, 0.2, 0.8, 0.48, 0.16]) + [1000, 0, 0, 0, 0, 0, 0]
+
+    #each MS/MS scan has a single fragment peak
+    peak_masses      = numpy.concatenate([numpy.append(mzs, 150.0) for i in range(num_cycles)])
+    peak_intensities = numpy.concatenate([numpy.append(i, 1000.0) for i in intensities]).astype(numpy.float32)
+    peak_offsets     = numpy.concatenate([[0], numpy.cumsum(numpy.tile([len(mzs), 1], num_cycles))])
+    for raw_file in raw_files:
+        writeSyntheticRaw(os.path.join(data_dir, raw_file), scan_rts, scan_types, 
+                          numpy.where(scan_types == 2, 500.25, 0), peak_offsets, peak_masses, peak_intensities)
+
+    seq_peptides_path = os.path.join(data_dir, "synthetic_psms.csv")
+    pandas.DataFrame({"Sequence":      "PEPTMIDEK",
+                      "Modifications": "",
+                      "Charge":        2,
+                      "Data File":     numpy.repeat(raw_files, len(start_scans)),
+                      "Start Scan":    numpy.tile(start_scans, len(raw_files)),
+                      "Calc m/z":      500.25}).to_csv(seq_peptides_path, index=False)
+    return seq_peptides_path
+
+#########################################################################################################
+
 """ Class for testing calculations for MethylQuant Confidence and MethylQuant Score   
 """
 class TestConfidenceCalculations(unittest.TestCase):
@@ -197,3 +400,552 @@ class TestConfidenceCalculations(unittest.TestCase):
             self.checkConfidence(isotope_correlation, isotope_H_to_L_ratio, 
                                  elution_correlation_count, elution_H_to_L_ratio,
                                  exp_confidence)
+
+    def testRescoring(self):
+        #the scoring stage only needs the correlation result, so it can be re-run with a new Pearson threshold
+        isotope_correlation_values = (10, 20, 0.1, 0.2) + (500.0, 100.0) * 6 + (0.99, 0.5)
+        elution_correlation_result = (numpy.array([[500.0, 100.0]] * 3), numpy.array([[504.0, 50.0]] * 3), 
+                                      [0.9, 0.6, 'NA'])
+
+        for pearson_threshold, exp_count in [(0.5, 2), (0.7, 1), (0.95, 0)]:
+            task = CorrelationTask(Parameters((10, 0.14, 1, 1, 5, pearson_threshold)), ID_FULL, True, 
+                                   None, None, None, None)
+            task.setCorrelationResult((isotope_correlation_values, elution_correlation_result))
+            task.runScoring()
+            self.assertEqual(task.outputRow.iloc[0]['# Good Elution Profile Correlations'], exp_count)
+
+#########################################################################################################
+
+""" Class for testing the command line arguments of the headless runner
+"""
+class TestConsole(unittest.TestCase):
+
+    def testParseArgs(self):
+        args = createParser().parse_args(["-p", PEPTIDE_FILE_PATH_2, "-r", RAW_FILE_PATH, 
+                                          "--labels", "K:8.014199", "--mass-error", "5"])
+
+        self.assertEqual(args.peptides, [PEPTIDE_FILE_PATH_2])
+        self.assertEqual(args.labels, [('K', 8.014199)])
+        self.assertEqual(args.mass_error, 5.0)
+        self.assertEqual(args.workers, mqt.DEFAULT_NUM_WORKERS)
+        self.assertRaises(SystemExit, lambda: createParser().parse_args(["--labels", "K"]))
+
+    def testCreateExperiments(self):
+        args = createParser().parse_args(["-p", PEPTIDE_FILE_PATH_2])
+        self.assertRaises(ValueError, lambda: createExperiments(args))
+
+    def testSweep(self):
+        args = createParser().parse_args(["--sweep", "mass_error=5,10", "--sweep", "time_window=0.5,1,2", 
+                                          "--pearson-threshold", "0.7"])
+        parameters_list = createParametersList(args)
+
+        self.assertEqual(len(parameters_list), 6)
+        self.assertEqual(parameters_list[0].getParameterTuple(), (5.0, 0.14, 0.5, 1, 5, 0.7))
+        self.assertEqual(parameters_list[-1].getParameterTuple(), (10.0, 0.14, 2.0, 1, 5, 0.7))
+        self.assertRaises(SystemExit, lambda: createParser().parse_args(["--sweep", "pearson=0.5"]))
+
+    def testInterrupt(self):
+        data_dir          = tempfile.mkdtemp()
+        seq_peptides_path = writeSyntheticDataset(data_dir, ["synthetic_01.raw", "synthetic_02.raw"])
+        self.addCleanup(shutil.rmtree, data_dir, ignore_errors=True)
+
+        #Ctrl+C once the first RAW file has been written, and wait for the main thread to cancel the session
+        write_raw = mqt.SessionTask.writeRaw
+        def interruptAfterRaw(session_task, *args):
+            write_raw(session_task, *args)
+            signal.raise_signal(signal.SIGINT)
+            session_task.task_control.cancel_event.wait(10)
+        mqt.SessionTask.writeRaw = interruptAfterRaw
+        try:
+            exit_code = consoleMain(["-p", seq_peptides_path, "-r", data_dir, "-w", "1", "-q"])
+        finally:
+            mqt.SessionTask.writeRaw = write_raw
+
+        self.assertEqual(exit_code, EXIT_CANCELLED)
+        self.assertIs(signal.getsignal(signal.SIGINT), signal.default_int_handler)
+        self.assertEqual(len(pandas.read_csv(os.path.join(data_dir, "synthetic_psms_MethylQuant.csv"))), 4)
+
+#########################################################################################################
+
+""" Class for testing experiment definitions (saving and opening experiments)
+"""
+class TestExperimentDefinitions(unittest.TestCase):
+
+    def setUp(self):
+        self.definition = {"name": "My Experiment", "description": "Methyl-SILAC",
+                           "peptides_files": [{"path": PEPTIDE_FILE_PATH_2, "raw_files": ["a.raw", "b.raw"], 
+                                               "silac_type": "heavy", "output_style": "full"}],
+                           "raw_dirs": [{"path": RAW_FILE_PATH, "raw_files": ["a.raw", "b.raw", "c.raw"]}],
+                           "labels": [{"residue": "M", "mass": 4.022185}],
+                           "modifications": [{"name": "Methyl", "mass": 4.022185}],
+                           "parameters": {"mass_error": 20.0, "time_window_overlap": 0.14, "time_window": 1.0, 
+                                          "empty_ms_allowed": 1, "min_isotopomers_allowed": 5, 
+                                          "pearson_threshold": 0.5}}
+
+    def testRoundTrip(self):
+        experiment = createExperiment(self.definition)
+        self.assertEqual(getDefinition(experiment), self.definition)
+        self.assertEqual(experiment.file_info.getSilacType(PEPTIDE_FILE_PATH_2), ID_HEAVY)
+        self.assertEqual(experiment.parameters.mass_error, 20.0)
+
+    def testInvalid(self):
+        self.definition["raw_dirs"][0]["raw_files"] = ["a.raw"]
+        self.assertRaises(ValueError, lambda: createExperiment(self.definition))
+        self.assertRaises(ValueError, lambda: upgradeDefinitions({"format": "MethylQuant experiments", 
+                                                                  "version": 99}))
+
+#########################################################################################################
+
+""" Class for testing the result cache and reading the rows that are not cached
+"""
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir         = tempfile.mkdtemp()
+        self.seq_peptides_path = os.path.join(self.cache_dir, "peptides.csv")
+        pandas.DataFrame({"Sequence":      ["PEPMK", "PEPMR", "PEPMMK", "PEPMMR"],
+                          "Modifications": "",
+                          "Charge":        2,
+                          "Data File":     ["b.raw", "a.raw", "b.raw", "a.raw"],
+                          "Start Scan":    [30, 20, 10, 40],
+                          "Calc m/z":      500.25}).to_csv(self.seq_peptides_path, index=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def testRoundTrip(self):
+        result_key   = getResultKey([["a.raw", 100, 1.0], 1234, 2, 500.25, 4.022185])
+        result_cache = ResultCache(os.path.join(self.cache_dir, "cache.sqlite"))
+        result_cache.putResults({result_key: (("MQ Score",), (3,))})
+        result_cache.close()
+
+        result_cache = ResultCache(os.path.join(self.cache_dir, "cache.sqlite"))
+        self.assertEqual(result_cache.getResults([result_key, "missing"]), {result_key: (("MQ Score",), (3,))})
+        self.assertNotEqual(result_key, getResultKey([["a.raw", 101, 1.0], 1234, 2, 500.25, 4.022185]))
+        result_cache.close()
+
+    def testReaderForRows(self):
+        seq_peptides_reader = PeptidesReader(self.seq_peptides_path)
+        sorted_rows         = seq_peptides_reader.getSortedRowsInRaw("b.raw")
+
+        uncached_reader = seq_peptides_reader.getReaderForRows({"b.raw": [1]})
+        self.assertEqual(uncached_reader.getDataFiles(), set(["a.raw", "b.raw"]))
+        self.assertTrue(uncached_reader.getSortedRowsInRaw("b.raw").equals(sorted_rows.iloc[[1]]))
+        self.assertEqual(list(uncached_reader.getSortedRowsInRaw("b.raw")["Start Scan"]), [30])
+        self.assertEqual(len(uncached_reader.getSortedRowsInRaw("a.raw")), 0)
+
+#########################################################################################################
+
+""" Class for testing sessions (pausing, resuming and checkpoints) on a tiny synthetic dataset
+"""
+class TestSession(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir          = tempfile.mkdtemp()
+        self.raw_files         = ["synthetic_01.raw", "synthetic_02.raw"]
+        self.seq_peptides_path = writeSyntheticDataset(self.data_dir, self.raw_files)
+        self.output_path       = os.path.join(self.data_dir, "synthetic_psms_MethylQuant.csv")
+        self.messages          = []
+        self.experiment        = createExperiment({"peptides_files": [{"path": self.seq_peptides_path}],
+                                                   "raw_dirs": [{"path": self.data_dir, "raw_files": self.raw_files}],
+                                                   "labels": [{"residue": "M", "mass": 4.022185}]})
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def sendMessage(self, topic, **kwargs):
+        self.messages.append((topic, kwargs))
+
+    def createSession(self, resume=False, num_workers=1):
+        return mqt.SessionTask([self.experiment], num_workers=num_workers, send_message=self.sendMessage, 
+                               resume=resume)
+
+    """ Returns a session that is cancelled once the first RAW file has been written
+    """
+    def createCancelledSession(self, num_workers=1):
+        session_task = self.createSession(num_workers=num_workers)
+        send_message = session_task.sendMessage
+        def cancelAfterRaw(topic, **kwargs):
+            send_message(topic, **kwargs)
+            if topic == mqt.UPDATE_MEMORY_LISTENER:
+                session_task.cancel()
+        session_task.sendMessage = cancelAfterRaw
+        return session_task
+
+    def getExperimentStatus(self):
+        return [m["experiment_status"] for (t, m) in self.messages if t == mqt.UPDATE_EXPERIMENT_STATUS_LISTENER]
+
+    def readOutput(self):
+        with open(self.output_path, "rb") as output_file:
+            return output_file.read()
+
+    def testPauseResume(self):
+        session_task   = self.createSession()
+        session_thread = threading.Thread(target=session_task.run)
+        session_task.pause()
+        session_thread.start()
+
+        #nothing is searched while paused
+        session_thread.join(0.5)
+        self.assertTrue(session_thread.is_alive())
+        self.assertTrue(session_task.isPaused())
+        self.assertEqual(os.path.getsize(self.output_path), 0)
+
+        session_task.resume()
+        session_thread.join(60)
+        self.assertFalse(session_thread.is_alive())
+        self.assertEqual(self.getExperimentStatus(), [mqm.Experiment.PASSED])
+        output_table = pandas.read_csv(self.output_path)
+        self.assertEqual(len(output_table), 8)
+        self.assertTrue(numpy.allclose(output_table["H/L Ratio #1"], 0.8))
+
+    def testCheckpoint(self):
+        checkpoint_writer = CheckpointWriter(self.output_path, "hash")
+        self.assertFalse(checkpoint_writer.load())
+
+        with open(self.output_path, "w") as output_file:
+            output_file.write("Sequence\nPEPTMIDEK\n")
+        checkpoint_writer.addRawFile(self.raw_files[0])
+
+        checkpoint_writer = CheckpointWriter(self.output_path, "hash")
+        self.assertTrue(checkpoint_writer.load())
+        self.assertEqual(checkpoint_writer.completed_raw_files, self.raw_files[:1])
+        self.assertEqual(checkpoint_writer.output_size, len("Sequence\nPEPTMIDEK\n"))
+        self.assertFalse(CheckpointWriter(self.output_path, "other hash").load())
+
+        #the output file is shorter than the checkpoint
+        with open(self.output_path, "w") as output_file:
+            output_file.write("Sequence\n")
+        self.assertFalse(CheckpointWriter(self.output_path, "hash").load())
+
+    def testResume(self):
+        self.createSession().run()
+        full_output = self.readOutput()
+
+        #cancel once the first RAW file has been written
+        self.createCancelledSession().run()
+        self.assertEqual(self.getExperimentStatus()[-1], mqm.Experiment.PARTIAL)
+        self.assertEqual(len(pandas.read_csv(self.output_path)), 4)
+
+        #rows written after the checkpoint (e.g., by a crash) are truncated, and only the second RAW file is searched
+        with open(self.output_path, "ab") as output_file:
+            output_file.write(b"PEPTMIDEK,,2,synthetic_02.raw")
+        self.messages = []
+        self.createSession(resume=True).run()
+        self.assertEqual(self.getExperimentStatus(), [mqm.Experiment.PASSED])
+        self.assertEqual(self.readOutput(), full_output)
+        memory_raws = [m["raw_file"] for (t, m) in self.messages if t == mqt.UPDATE_MEMORY_LISTENER]
+        self.assertEqual(memory_raws, self.raw_files[1:])
+
+    def testCancelParallel(self):
+        session_task = self.createCancelledSession(num_workers=2)
+        session_task.run()
+
+        #the worker processes (and the manager of the task control) have stopped
+        self.assertTrue(session_task.isCancelled())
+        self.assertEqual(multiprocessing.active_children(), [])
+        self.assertGreaterEqual(len(pandas.read_csv(self.output_path)), 4)
+
+    """ Every parameter set writes its own rows (and parameters) to the one sweep file of the peptides file
+    """
+    def checkSweep(self, num_workers):
+        parameters_list = createParametersList(createParser().parse_args(["--sweep", "mass_error=5,10"]))
+        sweep_task      = mqt.SweepTask([self.experiment], parameters_list, num_workers=num_workers, 
+                                        send_message=self.sendMessage)
+        sweep_task.run()
+        self.assertEqual(self.getExperimentStatus(), [mqm.Experiment.PASSED])
+
+        sweep_path = getSweepOutputPath(self.seq_peptides_path)
+        with open(sweep_path) as sweep_file:
+            sweep_lines = sweep_file.read().splitlines()
+        self.assertEqual(len([l for l in sweep_lines if l.startswith(PARAMETER_SET_COLUMN_NAME)]), 1)
+
+        sweep_table = pandas.read_csv(sweep_path)
+        self.assertEqual(len(sweep_table), 16)
+        for parameter_set, parameters in enumerate(parameters_list, 1):
+            set_table = sweep_table[sweep_table[PARAMETER_SET_COLUMN_NAME] == parameter_set]
+            self.assertEqual(len(set_table), 8)
+            self.assertEqual(sorted(set(set_table["Data File"])), self.raw_files)
+            for column_name, value in zip(PARAMETER_COLUMN_NAMES, parameters.getParameterTuple()):
+                self.assertTrue((set_table[column_name] == value).all())
+
+    def testSweep(self):
+        self.checkSweep(num_workers=1)
+
+    def testSweepParallel(self):
+        self.checkSweep(num_workers=2)
+
+#########################################################################################################
+
+""" Runs the functions given to submit straight away (in this process), like a pool with a single worker.
+    The function submitted at cancel_idx is given a cancelled TaskControl (its last argument), 
+    as if the session was cancelled before it started
+"""
+class SerialExecutor():
+
+    def __init__(self, cancel_idx=None):
+        self.cancel_idx    = cancel_idx
+        self.num_submitted = 0
+
+    def submit(self, function, *args):
+        if self.num_submitted == self.cancel_idx:
+            task_control = TaskControl()
+            task_control.cancel()
+            args         = args[:-1] + (task_control,)
+        self.num_submitted += 1
+
+        future = Future()
+        future.set_result(function(*args))
+        return future
+
+""" Class for testing the splitting of a RAW file into shards, and merging them back (See task.ShardedRawJob)
+"""
+class TestShardedRawJob(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir          = tempfile.mkdtemp()
+        self.raw_file          = "synthetic_01.raw"
+        self.seq_peptides_path = writeSyntheticDataset(self.data_dir, [self.raw_file], 
+                                                       start_scans=(24, 14, 12, 14, 20, 18, 14, 20))
+        self.experiment        = createExperiment({"peptides_files": [{"path": self.seq_peptides_path}],
+                                                   "raw_dirs": [{"path": self.data_dir, "raw_files": [self.raw_file]}],
+                                                   "labels": [{"residue": "M", "mass": 4.022185}]})
+        self.peptides_job      = PeptidesJob(0, self.experiment, self.seq_peptides_path, 
+                                             PeptidesReader(self.seq_peptides_path))
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def getMatchedTable(self, executor, task_control=None, num_shards=3):
+        task_control    = TaskControl() if task_control is None else task_control
+        sharded_raw_job = ShardedRawJob(self.raw_file, [self.peptides_job], num_shards, task_control)
+        sharded_raw_job.submit(executor)
+        sharded_raw_job.update(executor)
+        self.assertTrue(sharded_raw_job.isDone())
+        return sharded_raw_job.getMatchedTables()[0]
+
+    def testGetShards(self):
+        #sorted start scans are 12, 14, 14, 14, 18, 20, 20, 24
+        sharded_raw_job = ShardedRawJob(self.raw_file, [self.peptides_job, self.peptides_job], 4)
+        self.assertEqual(sharded_raw_job.getShards(), [[(0, 1)] * 2, [(1, 4)] * 2, [(4, 5)] * 2, [(5, 8)] * 2])
+
+        #rows with the same start scan are never split, even if there are more shards than start scans
+        sharded_raw_job = ShardedRawJob(self.raw_file, [self.peptides_job], 8)
+        self.assertEqual(sharded_raw_job.getShards(), [[(0, 1)], [(1, 4)], [(4, 5)], [(5, 7)], [(7, 8)]])
+
+    def testMerge(self):
+        raw_tasks      = [(self.peptides_job.experiment_task, self.peptides_job.seq_peptides_reader)]
+        expected_table = identifyPairsInRaw(self.raw_file, raw_tasks)[0]
+
+        matched_table = self.getMatchedTable(SerialExecutor())
+        self.assertEqual(len(matched_table), 8)
+        self.assertTrue(matched_table.equals(expected_table))
+
+        #the 2nd shard was cancelled, so the 3rd shard is left out too
+        matched_table = self.getMatchedTable(SerialExecutor(cancel_idx=2))
+        self.assertEqual(list(matched_table["Start Scan"]), [12])
+        self.assertTrue(matched_table.equals(expected_table.iloc[:1]))
+
+        #cancelled before the RAW file was indexed, so no shards are searched
+        task_control = TaskControl()
+        task_control.cancel()
+        self.assertEqual(len(self.getMatchedTable(SerialExecutor(), task_control)), 0)
+
+#########################################################################################################
+
+""" Class for testing the timing of stages
+"""
+class TestStageTimings(unittest.TestCase):
+
+    def tearDown(self):
+        mqm.enableTiming(False)
+        mqm.setStageTimings(None)
+
+    def testTimers(self):
+        stage_timings = mqm.StageTimings()
+        mqm.setStageTimings(stage_timings)
+
+        #nothing is recorded while timing is off
+        mqm.stopTimer(mqm.STAGE_OUTPUT, mqm.startTimer(), 10)
+        self.assertTrue(stage_timings.isEmpty())
+
+        mqm.enableTiming(True)
+        mqm.stopTimer(mqm.STAGE_OUTPUT, mqm.startTimer(), 10)
+        mqm.stopTimer(mqm.STAGE_RAW_OPEN, mqm.startTimer())
+        mqm.stopTimer(mqm.STAGE_OUTPUT, mqm.startTimer(), 5)
+        self.assertEqual([row[0] for row in stage_timings.getRows()], [mqm.STAGE_RAW_OPEN, mqm.STAGE_OUTPUT])
+        self.assertEqual(stage_timings.stage_table[mqm.STAGE_OUTPUT][0], 2)
+        self.assertEqual(stage_timings.stage_table[mqm.STAGE_OUTPUT][3], 15)
+
+        timing_report = mqm.TimingReport()
+        timing_report.addRaw("a.raw", stage_timings)
+        timing_report.addRaw("a.raw", stage_timings)
+        timing_report.addExperiment("My Experiment", mqm.StageTimings())
+        self.assertEqual(timing_report.raw_timings_table["a.raw"].stage_table[mqm.STAGE_OUTPUT][0], 4)
+        self.assertEqual(list(timing_report.experiment_timings_table), [])
+
+    def testCacheStats(self):
+        cache_stats = mqm.CacheStats()
+        cache_stats.addLookup(False)
+        self.assertEqual((cache_stats.hits, cache_stats.misses), (0, 0))
+
+        mqm.enableTiming(True)
+        self.assertFalse(cache_stats.addLookup(False))
+        self.assertTrue(cache_stats.addLookup(True))
+
+        #sizes are snapshots, so the peak is kept
+        cache_stats.merge(mqm.CacheStats(1, 0, 10, 1000))
+        cache_stats.merge(mqm.CacheStats(0, 1, 5, 500))
+        self.assertEqual((cache_stats.hits, cache_stats.misses, cache_stats.num_entries, cache_stats.num_bytes), 
+                         (2, 2, 10, 1000))
+        self.assertGreater(mqm.timing.getApproximateSize({(500.25, 12): numpy.zeros((3, 2))}), 48)
+
+#########################################################################################################
+
+""" Class for testing the LRU caches of memo tables (See model.LruCache)
+"""
+class TestLruCache(unittest.TestCase):
+
+    def tearDown(self):
+        mqm.enableTiming(False)
+
+    def testLruCache(self):
+        mqm.enableTiming(True)
+        lru_cache = mqm.LruCache(max_bytes=2 * mqm.timing.getApproximateSize((1, numpy.zeros(1000))))
+        for scan_num in range(1, 4):
+            if scan_num == 3:
+                self.assertTrue(lru_cache.contains(1))      #1 is now the most recently used
+            lru_cache.put(scan_num, numpy.zeros(1000))
+
+        self.assertEqual(len(lru_cache), 2)
+        self.assertTrue(lru_cache.contains(1))
+        self.assertFalse(lru_cache.contains(2))
+        cache_stats = lru_cache.popCacheStats()
+        self.assertEqual((cache_stats.hits, cache_stats.misses, cache_stats.num_evictions), (2, 1, 1))
+        self.assertLessEqual(cache_stats.num_bytes, lru_cache.max_bytes)
+
+        lru_cache.clear()
+        self.assertEqual((len(lru_cache), lru_cache.num_bytes), (0, 0))
+        self.assertEqual(lru_cache.peak_bytes, cache_stats.num_bytes)
+
+#########################################################################################################
+
+""" Class for testing the quantized m/z keys of memo tables (See model.getMassKey)
+"""
+class TestMassKeys(unittest.TestCase):
+
+    def testMassKeys(self):
+        isotope_masses = numpy.array([500.2512346, 500.7526, 501.2540])
+        self.assertEqual(mqm.getMassesKey(isotope_masses), (500251235, 500752600, 501254000))
+        self.assertEqual(mqm.getMassesKey(isotope_masses), tuple(map(mqm.getMassKey, isotope_masses)))
+
+        #masses within half a quantum share a key, anything further apart doesn't
+        self.assertEqual(mqm.getMassKey(500.2512341), mqm.getMassKey(500.2512343))
+        self.assertNotEqual(mqm.getMassKey(500.251234), mqm.getMassKey(500.251236))
+
+#########################################################################################################
+
+""" Class for testing the accounting of memory used by a search (See model.MemoryUsage)
+"""
+class TestMemoryUsage(unittest.TestCase):
+
+    def testMemoryUsage(self):
+        memory_usage = mqm.MemoryUsage(100 * mqm.memory.MB)
+        memory_usage.add(mqm.memory.MEMORY_PEAK_ARRAYS, 2 * mqm.memory.MB)
+        memory_usage.addCache(mqm.timing.CACHE_AVERAGE_MASS_LIST, 3 * mqm.memory.MB)
+
+        #sizes are peaks, so the largest is kept
+        shard_memory_usage = mqm.MemoryUsage(50 * mqm.memory.MB)
+        shard_memory_usage.add(mqm.memory.MEMORY_PEAK_ARRAYS, 1 * mqm.memory.MB)
+        shard_memory_usage.addCache(mqm.timing.CACHE_AVERAGE_MASS_LIST, 4 * mqm.memory.MB)
+        shard_memory_usage.add(mqm.MEMORY_PENDING_RESULTS, mqm.getTablesSize([pandas.DataFrame({'a': ['PEPTIDE']})]))
+        memory_usage.merge(shard_memory_usage)
+        self.assertEqual(memory_usage.peak_rss, 100 * mqm.memory.MB)
+        self.assertEqual(memory_usage.getBytes(mqm.memory.MEMORY_PEAK_ARRAYS), 2 * mqm.memory.MB)
+        self.assertEqual(memory_usage.getCacheBytes(), 4 * mqm.memory.MB)
+        self.assertGreater(memory_usage.getBytes(mqm.MEMORY_PENDING_RESULTS), 0)
+        self.assertEqual(memory_usage.formatSummary(), 
+                         "peak RSS 100.0 MB | scans 0.0 MB, peaks 2.0 MB, caches 4.0 MB, results 0.0 MB")
+
+#########################################################################################################
+
+""" Class for testing the traces of PSMs (See model.trace)
+"""
+class TestPsmTrace(unittest.TestCase):
+
+    def tearDown(self):
+        mqm.enableTrace(False)
+        mqm.setStageTimings(None)
+
+    def testPsmTrace(self):
+        stage_timings = mqm.StageTimings()
+        mqm.setStageTimings(stage_timings)
+        self.assertIsNone(mqm.trace.startPsmTrace("a.raw", 1200, "PEPTIDE"))
+
+        #stages are added to the trace even though timing is off
+        mqm.enableTrace(True)
+        psm_trace = mqm.trace.startPsmTrace("a.raw", numpy.int64(1200), "PEPTIDE")
+        mqm.stopTimer(mqm.STAGE_OUTPUT, mqm.startTimer())
+        mqm.trace.addTraceCount(mqm.trace.TRACE_SCANS_VISITED, 3)
+        mqm.trace.setTraceBoundary("isotope_windows", (1190, 1210), is_list=True)
+        mqm.trace.finishPsmTrace(psm_trace)
+        mqm.trace.addTraceCount(mqm.trace.TRACE_SCANS_VISITED)
+        self.assertTrue(stage_timings.isEmpty())
+
+        psm_traces = stage_timings.popPsmTraces()
+        self.assertEqual(len(psm_traces), 1)
+        self.assertEqual(psm_traces[0][mqm.trace.TRACE_SCANS_VISITED], 3)
+        self.assertEqual(list(psm_traces[0]["phases"]), [mqm.STAGE_OUTPUT])
+
+        trace_path   = os.path.join(tempfile.mkdtemp(), "trace.jsonl")
+        trace_writer = mqm.TraceWriter(trace_path)
+        trace_writer.writeRecords(psm_traces * 2)
+        trace_writer.close()
+        with open(trace_path) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(records, psm_traces * 2)
+        self.assertEqual(records[0]["boundaries"], {"isotope_windows": [[1190, 1210]]})
+        shutil.rmtree(os.path.dirname(trace_path))
+
+#########################################################################################################
+
+""" Class for testing the comparison of output files (See task.equivalence)
+"""
+class TestOutputDiff(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.output_table = pandas.DataFrame({"Sequence":               ["PEPMK", "PEPMR", "PEPMMK"],
+                                              "Data File":              ["b.raw", "a.raw", "a.raw"],
+                                              "Start Scan":             [20, 100, 30],
+                                              "H/L Ratio #1":           [1.5, "NA", 0.25],
+                                              "MethylQuant Confidence": ["High", "Low", "Very High"]})
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def writeOutput(self, output_name, output_table):
+        output_path = os.path.join(self.output_dir, output_name)
+        output_table.to_csv(output_path, index=False)
+        return output_path
+
+    def testCompare(self):
+        expected_path = self.writeOutput("expected.csv", self.output_table)
+
+        #rows are matched in (Data File, Start Scan) order, and numbers within the tolerance are the same
+        actual_table = self.output_table.iloc[::-1].copy()
+        actual_table["H/L Ratio #1"] = [0.25 * (1 + 1e-9), "NA", 1.5]
+        output_diff  = OutputDiff(expected_path, self.writeOutput("same.csv", actual_table)).compare()
+        self.assertTrue(output_diff.isEqual())
+
+        actual_table["H/L Ratio #1"]           = [0.2501, "NA", 1.5]
+        actual_table["MethylQuant Confidence"] = ["Very High", "Low", "Very High"]
+        output_diff  = OutputDiff(expected_path, self.writeOutput("different.csv", actual_table)).compare()
+        self.assertFalse(output_diff.isEqual())
+        self.assertEqual(output_diff.getNumMismatchingRows(), 2)
+        self.assertEqual(list(output_diff.mismatch_table["Column"]), ["H/L Ratio #1", "MethylQuant Confidence"])
+        self.assertEqual(list(output_diff.mismatch_table["Start Scan"]), ["30", "20"])
+
+        output_diff  = OutputDiff(expected_path, self.writeOutput("short.csv", actual_table.iloc[1:])).compare()
+        self.assertEqual(output_diff.num_rows, (3, 2))
+        self.assertFalse(output_diff.isEqual())
@@ -9,16 +9,15 @@
 # External imports
 
 # Internal imports
+from ..model.constants import ID_LIGHT
+from ..model.constants import ID_HEAVY
+from ..model.constants import ID_SUMMARY
+from ..model.constants import ID_FULL
 
 #------------------- Global Variables -----------------------#
 
 UPDATE_EXPERIMENT_LIST_LISTENER = "UpdateExperimentsListListener"
 
-ID_LIGHT    = 1
-ID_HEAVY    = -1
-ID_SUMMARY  = 1
-ID_FULL     = -1
-
 #------------------ Classes & Functions ---------------------#
 
 #########################################################################################################
@@ -14,7 +14,6 @@ import itertools
 from pubsub import pub
 from wx.lib.agw import flatnotebook as FNB
 from wx.lib.agw import ultimatelistctrl as ULC
-from wx import Yield
 
 # Internal imports
 from .. import task
@@ -37,16 +36,53 @@ class MethylQuantPanel(wx.Panel):
         self.experiment_summary_list     = ExperimentSummaryListCtrl(self)      # List of experiments
         # self.experiment_summary_notebook = ExperimentSummaryNotebook(self)      # Details of experiments
         self.start_btn                   = wx.Button(self, label="Find pairs")  # Start button that starts the program!
+        self.pause_btn                   = wx.Button(self, label="Pause")       # Pauses/resumes a running session
+        self.cancel_btn                  = wx.Button(self, label="Cancel")      # Cancels a running session
+        self.workers_spin                = WorkersSpinCtrl(self)                # Number of worker processes
+        self.resume_checkbox             = wx.CheckBox(self, label="Resume")    # Skip RAW files completed by a previous run
+        self.resume_checkbox.SetToolTip(wx.ToolTip("Skip .raw files that were completed by a previous (interrupted) run\n" + 
+                                                   "with the same parameters and input files"))
+        self.cache_checkbox              = wx.CheckBox(self, label="Cache")     # Reuse the results of previous runs
+        self.cache_checkbox.SetToolTip(wx.ToolTip("Keep the result of each peptide in a cache,\n" + 
+                                                  "so that re-runs only search new or changed peptides"))
         self.progress_gauge              = ProgressGauge(self)                  # Progress gauge
+        self.enableSessionButtons(False)
         
+        hbox = wx.BoxSizer(wx.HORIZONTAL)
+        hbox.Add(self.start_btn, flag=wx.ALIGN_CENTER_VERTICAL | wx.RIGHT, border=10)
+        hbox.Add(self.pause_btn, flag=wx.ALIGN_CENTER_VERTICAL | wx.RIGHT, border=5)
+        hbox.Add(self.cancel_btn, flag=wx.ALIGN_CENTER_VERTICAL | wx.RIGHT, border=10)
+        hbox.Add(wx.StaticText(self, wx.ID_ANY, "Workers"), flag=wx.ALIGN_CENTER_VERTICAL | wx.RIGHT, border=5)
+        hbox.Add(self.workers_spin, flag=wx.ALIGN_CENTER_VERTICAL | wx.RIGHT, border=10)
+        hbox.Add(self.resume_checkbox, flag=wx.ALIGN_CENTER_VERTICAL | wx.RIGHT, border=5)
+        hbox.Add(self.cache_checkbox, flag=wx.ALIGN_CENTER_VERTICAL)
+
         vbox = wx.BoxSizer(wx.VERTICAL)
         vbox.Add(wx.StaticLine(self), flag=wx.EXPAND)           #Divider to partition the toolbar and the rest of the panel
         vbox.Add(self.experiment_summary_list, proportion=1, flag=wx.EXPAND | wx.ALL, border=10)
         #vbox.Add(self.experiment_summary_notebook, proportion=1, flag=wx.EXPAND | wx.ALL, border=10)
-        vbox.Add(self.start_btn, flag=wx.ALIGN_CENTER | wx.ALL, border=10)
+        vbox.Add(hbox, flag=wx.ALIGN_CENTER | wx.ALL, border=10)
         vbox.Add(self.progress_gauge, flag=wx.EXPAND)
         self.SetSizer(vbox)
 
+    """ Only the pause and cancel buttons are enabled while a session is running
+    """
+    def enableWidgets(self, is_enabled):
+        self.experiment_summary_list.Enable(is_enabled)
+        self.start_btn.Enable(is_enabled)
+        self.workers_spin.Enable(is_enabled)
+        self.resume_checkbox.Enable(is_enabled)
+        self.cache_checkbox.Enable(is_enabled)
+        self.enableSessionButtons(not is_enabled)
+
+    def enableSessionButtons(self, is_enabled):
+        self.pause_btn.SetLabel("Pause")
+        self.pause_btn.Enable(is_enabled)
+        self.cancel_btn.Enable(is_enabled)
+
+    def updatePauseButton(self, is_paused):
+        self.pause_btn.SetLabel("Resume" if is_paused else "Pause")
+
 #########################################################################################################
 
 class ExperimentSummaryListCtrl(MQListCtrl):
@@ -79,7 +115,8 @@ class ExperimentSummaryListCtrl(MQListCtrl):
         return columnItem
 
     def getImageData(self):
-        return (wx.ART_TICK_MARK, wx.ART_CROSS_MARK)
+        #in the same order as Experiment.PASSED, FAILED, PARTIAL
+        return (wx.ART_TICK_MARK, wx.ART_CROSS_MARK, wx.ART_WARNING)
 
     def createImageList(self):
         self.imageList = wx.ImageList(24, 24)
@@ -145,26 +182,33 @@ class ProgressGauge(wx.Gauge):
 
     def __init__(self, parent):
         wx.Gauge.__init__(self, parent, wx.ID_ANY, self.MAX_GAUGE_VALUE, style=wx.GA_SMOOTH)
-        pub.subscribe(self.UpdateStepsize, task.UPDATE_GAUGE_STEPSIZE_LISTENER)
         pub.subscribe(self.UpdateGauge, task.UPDATE_GAUGE_LISTENER)
-        pub.subscribe(self.OnIncrement, task.INCREMENT_GAUGE_LISTENER)
-
-    def getStepsize(self):
-        return self.stepsize
+        pub.subscribe(self.OnUpdateProgress, task.UPDATE_PROGRESS_LISTENER)
 
     def UpdateGauge(self, filled):
         if filled:
             self.SetValue(self.MAX_GAUGE_VALUE)
         else:
             self.SetValue(0)
-    
-    def UpdateStepsize(self, seq_peptides_reader):
-        self.stepsize = self.MAX_GAUGE_VALUE / len(seq_peptides_reader.seq_peptides)
 
-    def OnIncrement(self):
-        progress = self.GetValue() + self.getStepsize()
-        self.SetValue(progress)  
-        Yield()
+    def OnUpdateProgress(self, progress_report):
+        progress = progress_report.session_count.getFraction() * self.MAX_GAUGE_VALUE
+        self.SetValue(int(progress))
+
+#########################################################################################################
+
+class WorkersSpinCtrl(wx.SpinCtrl):
+
+    def __init__(self, parent):
+        #each worker process holds a whole RAW file in memory, 
+        #so we don't go beyond the number of CPUs
+        max_workers = os.cpu_count() or 1
+        wx.SpinCtrl.__init__(self, parent, wx.ID_ANY, min=1, max=max_workers, 
+                             initial=min(task.DEFAULT_NUM_WORKERS, max_workers))
+        self.SetToolTip(wx.ToolTip("Number of RAW files processed at the same time"))
+
+    def getNumWorkers(self):
+        return self.GetValue()
 
 #########################################################################################################
 